@@ -1,15 +1,18 @@
 ﻿import streamlit as st
-import pandas as pd
-import plotly.express as px
 from datetime import datetime
 import time
+import uuid
 
 
 from config import *
-from models.embedding_model import PersianEmbeddingModel
-from memory.vector_store import RealityMemory
-from models.llm_interface import LLMInterface
-from utils.reality_tracker import RealityTracker
+from utils.startup import StartupTimer, BackgroundLoader
+from utils.chat_view import make_message, message_html, window_start, render_window, EmotionCounter
+from utils.metrics import metrics, start_metrics_server
+from utils.session_state import SessionStateManager
+from utils.structured_logging import configure_logging
+
+
+configure_logging(LOG_LEVEL, LOG_JSON)
 
 
 # ============================================
@@ -63,42 +66,114 @@ st.markdown("""
 # ============================================
 # کش کردن مدل‌ها برای اجرای یک‌بار (مهم برای Streamlit)
 # ============================================
+def build_pipeline(timer: StartupTimer):
+    """بارگذاری مدل‌ها و ساخت موتور پردازش (در thread پس‌زمینه)"""
+    # بارگذاری پرامپت‌ها
+    try:
+        with open('prompts/system_prompt.txt', 'r', encoding='utf-8') as f:
+            system_prompt = f.read()
+    except:
+        system_prompt = "شما یک دستیار تحول شناختی هستید."
+    
+    # chromadb و sentence_transformers فقط در این thread import می‌شوند
+    with timer.stage("import"):
+        from pipeline import TurnPipeline
+    
+    pipeline = TurnPipeline.from_config(system_prompt, timer)
+    
+    if STARTUP_WARMUP:
+        with timer.stage("warmup"):
+            pipeline.embedding_model.encode("سلام")
+    
+    return pipeline
+
+
 @st.cache_resource
-def load_models():
-    """بارگذاری مدل‌ها - فقط یک بار اجرا می‌شود"""
-    with st.spinner("در حال بارگذاری مدل‌های هوش مصنوعی..."):
-        embedding_model = PersianEmbeddingModel(EMBEDDING_MODEL)
-        memory = RealityMemory(CHROMA_PERSIST_DIR, COLLECTION_NAME)
-        llm = LLMInterface(OPENAI_API_KEY, USE_LOCAL_LLM)
-        tracker = RealityTracker(SIMILARITY_THRESHOLD)
-        
-        # بارگذاری پرامپت‌ها
-        try:
-            with open('prompts/system_prompt.txt', 'r', encoding='utf-8') as f:
-                system_prompt = f.read()
-        except:
-            system_prompt = "شما یک دستیار تحول شناختی هستید."
-            
-    return embedding_model, memory, llm, tracker, system_prompt
+def start_pipeline_loader():
+    """شروع بارگذاری مدل‌ها - فقط یک بار برای همه جلسه‌ها اجرا می‌شود"""
+    return BackgroundLoader(build_pipeline)
+
+
+def get_pipeline():
+    """موتور پردازش؛ در صورت نیاز تا پایان بارگذاری منتظر می‌ماند"""
+    global pipeline_loader
+    try:
+        if not pipeline_loader.ready():
+            with st.spinner("در حال بارگذاری مدل‌های هوش مصنوعی..."):
+                return pipeline_loader.result()
+        return pipeline_loader.result()
+    except Exception:
+        # بارگذاری ناموفق کش نمی‌شود؛ بارگذاری تازه شروع می‌شود و نوبت بعد از آن استفاده می‌کند
+        start_pipeline_loader.clear()
+        pipeline_loader = start_pipeline_loader()
+        raise
 
 
+@st.cache_resource
+def start_metrics_endpoint():
+    """سرور /metrics - فقط یک بار برای کل فرایند"""
+    metrics.configure(METRICS_ENABLED, METRICS_WINDOW)
+    if METRICS_PORT:
+        return start_metrics_server(METRICS_PORT, host=METRICS_HOST)
+    return None
+
+
+start_metrics_endpoint()
+
 # بارگذاری مدل‌ها
-embedding_model, memory, llm, tracker, system_prompt = load_models()
+pipeline_loader = start_pipeline_loader()
+if not STARTUP_BACKGROUND_LOADING:
+    get_pipeline()
 
 
 # ============================================
 # مدیریت state جلسه (Session State)
 # ============================================
+@st.cache_resource
+def get_session_manager():
+    """تاریخچه همه جلسه‌ها با بودجه حافظه مشترک - یک نمونه برای کل سرور"""
+    return SessionStateManager(SESSION_SPILL_PATH, SESSION_MEMORY_BUDGET_MB,
+                               CHAT_WINDOW_SIZE, SESSION_MAX_RESIDENT_MESSAGES)
+
+
+session_manager = get_session_manager()
+
+
 if 'user_id' not in st.session_state:
     st.session_state.user_id = f"user_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
 
+# کلید یکتای جلسه برای تاریخچه‌های محدود (چند جلسه ممکن است یک user_id داشته باشند)
+if 'session_key' not in st.session_state:
+    st.session_state.session_key = uuid.uuid4().hex
+
+
+# تاریخچه‌ها فقط پنجره آخر را در حافظه نگه می‌دارند و بقیه را در صورت نیاز از دیسک می‌خوانند
 if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+    st.session_state.chat_history = session_manager.history(st.session_state.session_key, "chat")
 
 
 if 'reality_history' not in st.session_state:
-    st.session_state.reality_history = []
+    st.session_state.reality_history = session_manager.history(st.session_state.session_key, "reality")
+
+
+session_manager.touch(st.session_state.session_key)
+
+
+if 'last_similar' not in st.session_state:
+    st.session_state.last_similar = []
+
+
+# شمارش تدریجی حالات عاطفی (به جای محاسبه دوباره از کل تاریخچه در هر اجرا)
+if 'emotion_counter' not in st.session_state:
+    st.session_state.emotion_counter = EmotionCounter(
+        entry['emotional_state'] for entry in st.session_state.reality_history
+    )
+
+
+# تعداد صفحه‌های قبلی نمایش داده شده در گفتگو
+if 'chat_pages' not in st.session_state:
+    st.session_state.chat_pages = 0
 
 
 # ============================================
@@ -115,31 +190,35 @@ with st.sidebar:
     
     # دکمه شروع مکالمه جدید
     if st.button("🔄 شروع مکالمه جدید", use_container_width=True):
-        st.session_state.chat_history = []
-        st.session_state.reality_history = []
+        st.session_state.chat_history.clear()
+        st.session_state.reality_history.clear()
+        st.session_state.last_similar = []
+        st.session_state.emotion_counter.reset()
+        st.session_state.chat_pages = 0
         st.rerun()
     
     st.markdown("---")
     
     # نمایش تاریخچه واقعیت‌ها (اگر وجود داشته باشد)
-    if st.session_state.reality_history:
+    emotion_counter = st.session_state.emotion_counter
+    if emotion_counter:
         st.subheader("📊 تاریخچه واقعیت‌ها")
         
-        # تبدیل به DataFrame برای نمایش
-        df = pd.DataFrame(st.session_state.reality_history)
-        if not df.empty and 'timestamp' in df.columns:
-            df['time'] = pd.to_datetime(df['timestamp']).dt.strftime('%H:%M')
+        # نمودار تغییرات عاطفی؛ فقط وقتی شمارش‌ها تغییر کرده دوباره ساخته می‌شود
+        cached_chart = st.session_state.get('emotion_chart')
+        if cached_chart is None or cached_chart[0] != emotion_counter.version:
+            # کتابخانه نمودار فقط هنگام رسم import می‌شود
+            import plotly.express as px
             
-            # نمودار تغییرات عاطفی
-            if 'emotional_state' in df.columns:
-                emotion_counts = df['emotional_state'].value_counts()
-                fig = px.pie(
-                    values=emotion_counts.values,
-                    names=emotion_counts.index,
-                    title="توزیع حالات عاطفی",
-                    color_discrete_sequence=px.colors.sequential.Purpor
-                )
-                st.plotly_chart(fig, use_container_width=True)
+            emotion_counts = emotion_counter.counts.most_common()
+            fig = px.pie(
+                values=[count for _, count in emotion_counts],
+                names=[emotion for emotion, _ in emotion_counts],
+                title="توزیع حالات عاطفی",
+                color_discrete_sequence=px.colors.sequential.Purpor
+            )
+            cached_chart = st.session_state.emotion_chart = (emotion_counter.version, fig)
+        st.plotly_chart(cached_chart[1], use_container_width=True)
     
     st.markdown("---")
     st.caption("🌟 نسخه آزمایشی - طراحی شده برای کشف واقعیت‌های پویا")
@@ -158,82 +237,56 @@ col1, col2 = st.columns([2, 1])
 with col1:
     st.subheader("💬 گفتگو با دستیار")
     
-    # نمایش تاریخچه گفتگو
+    # نمایش تاریخچه گفتگو: فقط پنجره آخر پیام‌ها، با HTML ذخیره‌شده هر پیام
+    chat_history = st.session_state.chat_history
     chat_container = st.container(height=400)
     with chat_container:
-        for msg in st.session_state.chat_history:
-            if msg["role"] == "user":
-                st.markdown(f"""
-                <div style="background-color: #e3f2fd; padding: 0.5rem 1rem; border-radius: 15px; margin-bottom: 0.5rem; text-align: right;">
-                    <b>شما:</b> {msg['content']}
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div style="background-color: #f3e5f5; padding: 0.5rem 1rem; border-radius: 15px; margin-bottom: 0.5rem; text-align: right;">
-                    <b>دستیار:</b> {msg['content']}
-                </div>
-                """, unsafe_allow_html=True)
+        start = window_start(len(chat_history), CHAT_WINDOW_SIZE, st.session_state.chat_pages)
+        if start > 0:
+            if st.button(f"⬆️ نمایش پیام‌های قبلی ({start})", use_container_width=True):
+                st.session_state.chat_pages += 1
+                start = window_start(len(chat_history), CHAT_WINDOW_SIZE, st.session_state.chat_pages)
+        if chat_history:
+            st.markdown(render_window(chat_history, start), unsafe_allow_html=True)
     
     # ورودی متن کاربر
     user_input = st.chat_input("پیام خود را بنویسید...")
     
     if user_input:
         # اضافه کردن به تاریخچه
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
+        user_message = make_message("user", user_input)
+        st.session_state.chat_history.append(user_message)
         
         # نمایش پیام کاربر بلافاصله
         with chat_container:
-            st.markdown(f"""
-            <div style="background-color: #e3f2fd; padding: 0.5rem 1rem; border-radius: 15px; margin-bottom: 0.5rem; text-align: right;">
-                <b>شما:</b> {user_input}
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(user_message["html"], unsafe_allow_html=True)
         
         # پردازش با دستیار
         with st.spinner("🤔 در حال تفکر..."):
-            # مرحله 1: تحلیل واقعیت
-            analysis = llm.analyze_reality(user_input, "")
-            
-            # مرحله 2: تبدیل به بردار
-            embedding = embedding_model.encode(user_input)
-            
-            # مرحله 3: جستجوی مشابه‌ها
-            similar = memory.search_similar_realities(
-                embedding, 
-                user_id=st.session_state.user_id,
-                n_results=TOP_K_RESULTS
-            )
-            
-            # مرحله 4: تشخیص تغییر
-            is_new = tracker.is_new_reality(analysis, similar)
+            # نمایش تدریجی پاسخ همزمان با دریافت توکن‌ها
+            with chat_container:
+                response_placeholder = st.empty()
+            streamed = []
             
-            # مرحله 5: ذخیره در حافظه
-            memory.add_reality(st.session_state.user_id, user_input, embedding, analysis)
+            def show_token(token):
+                streamed.append(token)
+                response_placeholder.markdown(message_html("assistant", "".join(streamed)),
+                                              unsafe_allow_html=True)
             
-            # مرحله 6: تولید پاسخ
-            response = llm.generate_response(user_input, analysis, similar, "")
+            pipeline = get_pipeline()
+            from pipeline import to_reality_entry
+            result = pipeline.process_turn(st.session_state.user_id, user_input, on_token=show_token)
+            response = result["response"]
+            is_new = result["is_new_reality"]
             
             # ذخیره در تاریخچه واقعیت‌ها
-            reality_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "emotional_state": analysis.get("emotional_state", "نامشخص"),
-                "beliefs": ", ".join(analysis.get("beliefs", [])),
-                "cognitive_needs": analysis.get("cognitive_needs", ""),
-                "is_new_reality": is_new
-            }
+            reality_entry = to_reality_entry(result)
             st.session_state.reality_history.append(reality_entry)
+            st.session_state.emotion_counter.add(reality_entry['emotional_state'])
+            st.session_state.last_similar = result["similar"]
             
             # اضافه کردن پاسخ به تاریخچه
-            st.session_state.chat_history.append({"role": "assistant", "content": response})
-            
-            # نمایش پاسخ
-            with chat_container:
-                st.markdown(f"""
-                <div style="background-color: #f3e5f5; padding: 0.5rem 1rem; border-radius: 15px; margin-bottom: 0.5rem; text-align: right;">
-                    <b>دستیار:</b> {response}
-                </div>
-                """, unsafe_allow_html=True)
+            st.session_state.chat_history.append(make_message("assistant", response))
             
             # نمایش تغییر واقعیت
             if is_new:
@@ -272,6 +325,13 @@ with col2:
         if last.get('is_new_reality', False):
             st.markdown("**✨ وضعیت:** واقعیت جدید ✨")
         
+        # خلاصه مسیر واقعیت کاربر در طول زمان
+        trajectory_description = ""
+        if pipeline_loader.ready() and pipeline_loader.error is None:
+            trajectory_description = pipeline_loader.value.tracker.describe_trajectory(st.session_state.user_id)
+        if trajectory_description:
+            st.caption(f"🧭 {trajectory_description}")
+        
         st.markdown('</div>', unsafe_allow_html=True)
         
         # نمایش تعداد واقعیت‌های ثبت شده
@@ -281,11 +341,13 @@ with col2:
         )
         
         # نمایش مشابه‌های یافت شده
+        similar = st.session_state.last_similar
         if similar:
             with st.expander("🔄 واقعیت‌های مشابه قبلی"):
                 for i, sim in enumerate(similar[:3]):
                     st.markdown(f"**{i+1}.** {sim['text'][:100]}...")
-                    st.caption(f"شباهت: {1 - sim.get('distance', 0):.2f}")
+                    repeats = f" - {sim['duplicates']} بار تکرار شده" if sim.get('duplicates') else ""
+                    st.caption(f"شباهت: {1 - sim.get('distance', 0):.2f}{repeats}")
     else:
         st.info("هنوز گفتگویی شروع نشده است. پیامی بفرستید تا تحلیل آغاز شود.")
 
@@ -300,4 +362,31 @@ with st.expander("ℹ️ اطلاعات فنی"):
     - **تعداد پیام‌ها:** {len(st.session_state.chat_history)}
     - **وضعیت حافظه:** فعال (ChromaDB)
     - **مدل embedding:** {EMBEDDING_MODEL}
-    """)
\ No newline at end of file
+    - **وضعیت مدل‌ها:** {'آماده' if pipeline_loader.ready() else 'در حال بارگذاری...'}
+    """)
+    
+    # زمان‌بندی راه‌اندازی (ثانیه)
+    startup_timings = pipeline_loader.timer.breakdown()
+    if startup_timings:
+        st.markdown("**⏱️ زمان راه‌اندازی:** " + "، ".join(
+            f"{stage}: {seconds:.2f}s" for stage, seconds in startup_timings.items()
+        ))
+    
+    # حافظه تاریخچه جلسه‌های این سرور
+    session_stats = session_manager.stats()
+    st.markdown(f"**🗂️ حافظه جلسه‌ها:** {session_stats['resident_bytes'] / 1048576:.1f}MB از "
+                f"{session_stats['budget_bytes'] / 1048576:.0f}MB ({session_stats['sessions']} جلسه، "
+                f"{session_stats['spilled_items']} ردیف روی دیسک)")
+    
+    # صدک‌های زمان مراحل (میلی‌ثانیه)
+    if metrics.enabled:
+        rows = ["| معیار | تعداد | p50 | p95 | p99 |", "|---|---|---|---|---|"]
+        for entry in metrics.snapshot():
+            label = entry['name'] + "".join(f" {value}" for value in entry['labels'].values())
+            rows.append(f"| {label} | {entry['count']} | {entry.get('p50', 0) * 1000:.1f} | "
+                        f"{entry.get('p95', 0) * 1000:.1f} | {entry.get('p99', 0) * 1000:.1f} |")
+        st.markdown("**📈 زمان مراحل (ms):**\n\n" + "\n".join(rows))
+
+
+# زمان اولین نمایش کامل صفحه از شروع بارگذاری
+pipeline_loader.timer.mark_once("first_render")
\ No newline at end of file
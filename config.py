@@ -9,17 +9,111 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 # اگر کلید OpenAI ندارید، می‌توانید از مدل محلی استفاده کنید
 USE_LOCAL_LLM = True  # اگر کلید ندارید True بگذارید
+# سرور سازگار با OpenAI (برای آزمایش محلی: python -m tools.stub_llm_server)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_TIMEOUT = 30.0  # ثانیه
+LLM_MAX_RETRIES = 3
+LLM_MAX_CONCURRENCY = 8  # حداکثر درخواست همزمان به مدل
+# کش تحلیل و پاسخ برای ورودی‌های تکراری
+LLM_CACHE_ENABLED = True
+LLM_CACHE_TTL_SECONDS = 3600
+LLM_CACHE_MAX_ITEMS = 5000
+LLM_CACHE_PATH = None  # مثلاً "./llm_cache/responses.sqlite3" برای ذخیره روی دیسک
 
 
 # تنظیمات پایگاه داده برداری
 CHROMA_PERSIST_DIR = "./chroma_data"
 COLLECTION_NAME = "user_realities"
+# ایندکس درون‌حافظه‌ای هر کاربر (جستجوی زیرمیلی‌ثانیه بدون ChromaDB)
+MEMORY_USER_INDEX = True
+MEMORY_USER_INDEX_BUDGET_MB = 256
+# تقسیم کاربران میان چند مجموعه (۱ یعنی بدون shard؛ انتقال: python -m tools.rebalance_shards)
+MEMORY_NUM_SHARDS = 1
+MEMORY_SHARD_SEPARATE_DIRS = False  # هر shard در پوشه جداگانه
+# ذخیره‌سازی بردارها: "chroma" یا "compact" (فایل memory-mapped فشرده با امتیازدهی دقیق نامزدها)
+MEMORY_STORAGE = "chroma"
+MEMORY_VECTOR_DTYPE = "float16"  # "float16" یا "int8"
+MEMORY_KEEP_EXACT_VECTORS = True  # نسخه float32 روی دیسک برای امتیازدهی دقیق (فقط برای نامزدها خوانده می‌شود)
+MEMORY_RERANK_FACTOR = 4  # تعداد نامزدها = این ضریب × تعداد نتایج
+# نوشتن با تأخیر: درج در صف و لاگ پایدار، ثبت گروهی در پس‌زمینه
+MEMORY_WRITE_BEHIND = False
+MEMORY_WRITE_BEHIND_DIR = os.path.join(CHROMA_PERSIST_DIR, "write_behind")
+MEMORY_WRITE_BEHIND_MAX_PENDING = 10000  # حداکثر رکوردهای ثبت‌نشده (پس از آن درج منتظر می‌ماند)
+MEMORY_WRITE_BEHIND_BATCH = 256  # ثبت گروهی با رسیدن به این تعداد
+MEMORY_WRITE_BEHIND_INTERVAL_MS = 50  # یا پس از این مدت
+MEMORY_WRITE_BEHIND_FSYNC = True  # fsync لاگ پس از هر درج (بدون آن، قطع برق ممکن است آخرین درج‌ها را از بین ببرد)
+
+# نگه‌داری حافظه (خلاصه‌سازی واقعیت‌های قدیمی و فشرده‌سازی پایگاه)
+MEMORY_MAINTENANCE_ENABLED = False
+MEMORY_RETENTION_DAYS = 90  # واقعیت‌های قدیمی‌تر از این مدت خلاصه می‌شوند
+MEMORY_RETENTION_KEEP_RECENT = 50  # این تعداد واقعیت آخر هر کاربر همیشه دست‌نخورده می‌ماند
+MEMORY_COMPACTION_DISTANCE = 0.15  # واقعیت‌های با فاصله کسینوسی کمتر از این مقدار در یک خلاصه ادغام می‌شوند
+MEMORY_COMPACTION_MIN_CLUSTER = 2
+MEMORY_MAINTENANCE_INTERVAL_HOURS = 24
 
 
 # تنظیمات مدل embedding
 EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"  # مدل چندزبانه خوب
+EMBEDDING_SNAPSHOT_DIR = None  # پوشه نسخه محلی مدل (مثلاً "./model_snapshot")؛ در اولین اجرا ساخته می‌شود
+# backend اجرای مدل: "torch" (float32)، "int8" (کوانتیزه پویا روی CPU) یا "onnx" (نیازمند optimum[onnxruntime])
+EMBEDDING_BACKEND = "torch"
+# مقایسه backend با مدل float32 هنگام بارگذاری و بازگشت به float32 در صورت انحراف زیاد
+EMBEDDING_ACCURACY_CHECK = True
+EMBEDDING_MAX_DRIFT = 0.05  # حداکثر اختلاف شباهت کسینوسی میان جفت جمله‌ها
+EMBEDDING_MIN_AGREEMENT = 0.98  # حداقل توافق در تصمیم «واقعیت جدید»
+EMBEDDING_ACCURACY_RECORD_PATH = "./embedding_cache/backend_accuracy.json"  # نتیجه بررسی هر (مدل، backend)؛ برای بررسی دوباره حذف کنید
+# دسته‌بندی درخواست‌های همزمان encode (برای چند کاربر همزمان)
+EMBEDDING_MICRO_BATCHING = False
+EMBEDDING_MAX_BATCH_SIZE = 32
+EMBEDDING_MAX_WAIT_MS = 5.0
+# کش بردارها برای عبارت‌های تکراری (با تغییر EMBEDDING_MODEL خودکار پاک می‌شود)
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = "./embedding_cache/embeddings.sqlite3"
+EMBEDDING_CACHE_MEMORY_ITEMS = 10000
 
 
 # تنظیمات بازیابی
 TOP_K_RESULTS = 3
-SIMILARITY_THRESHOLD = 0.6
\ No newline at end of file
+SIMILARITY_THRESHOLD = 0.6
+# "topk": نزدیک‌ترین‌ها؛ "diverse": حذف تکراری‌ها و بازچینی MMR روی نامزدهای بیشتر
+RETRIEVAL_MODE = "topk"
+RETRIEVAL_CANDIDATE_MULTIPLIER = 4  # تعداد نامزدها = این ضریب × TOP_K_RESULTS
+RETRIEVAL_MMR_LAMBDA = 0.7  # ۱ یعنی فقط شباهت به پیام، ۰ یعنی فقط تنوع
+RETRIEVAL_DEDUP_DISTANCE = 0.05  # نتایج با فاصله کسینوسی کمتر از این مقدار تکراری‌اند
+RETRIEVAL_APPLY_THRESHOLD = True  # حذف نتایج با شباهت کمتر از SIMILARITY_THRESHOLD در حافظه
+
+
+# موتور مسیر واقعیت (تشخیص تغییر از وضعیت تجمعی هر کاربر، بدون جستجوی اضافه)
+TRAJECTORY_ENABLED = False  # اختیاری: معنای is_new_reality را از مقایسه با نزدیک‌ترین واقعیت به مقایسه با مسیر کاربر تغییر می‌دهد
+TRAJECTORY_ALPHA = 0.3  # وزن نوبت جدید در میانگین متحرک
+TRAJECTORY_PATH = os.path.join(CHROMA_PERSIST_DIR, "trajectories.sqlite3")
+TRAJECTORY_MAX_USERS = 10000  # کاربران نگه‌داشته در حافظه؛ بقیه در صورت نیاز از TRAJECTORY_PATH خوانده می‌شوند
+TRAJECTORY_FLUSH_EVERY = 64  # وضعیت کاربران تغییرکرده پس از این تعداد یک‌جا در TRAJECTORY_PATH نوشته می‌شود
+TRAJECTORY_FLUSH_INTERVAL_SECONDS = 2.0  # حداکثر تأخیر نوشتن وضعیت مسیر (با قطع ناگهانی، نوبت‌های همین بازه از دست می‌روند)
+# تنظیمات اجرای چندفرایندی (یک سرویس حافظه تک‌نویسنده و چند کارگر با مدل مشترک)
+SERVING_WORKERS = 0  # ۰ یعنی به تعداد هسته‌ها
+MEMORY_SERVICE_ENABLED = False  # اتصال نمونه‌های برنامه به سرویس حافظه مشترک به جای ChromaDB محلی
+MEMORY_SERVICE_HOST = "127.0.0.1"
+MEMORY_SERVICE_PORT = 50515
+MEMORY_SERVICE_AUTHKEY = os.getenv("MEMORY_SERVICE_AUTHKEY")  # بدون مقدار پیش‌فرض؛ سرویس مستقل بدون آن اجرا نمی‌شود
+
+# تنظیمات راه‌اندازی
+STARTUP_BACKGROUND_LOADING = True  # بارگذاری مدل و حافظه در پس‌زمینه همزمان با نمایش صفحه
+STARTUP_WARMUP = True  # یک embedding آزمایشی پس از بارگذاری تا اولین پیام کند نباشد
+
+# تنظیمات رابط کاربری
+CHAT_WINDOW_SIZE = 30  # تعداد پیام‌های آخر که در هر اجرا نمایش داده می‌شوند
+
+# تاریخچه جلسه‌ها: فقط پنجره آخر در حافظه، بقیه در لاگ محلی (هر نمونه برنامه مسیر جداگانه)
+SESSION_MAX_RESIDENT_MESSAGES = 60  # با عبور از این تعداد، پیام‌های قدیمی‌تر از CHAT_WINDOW_SIZE به دیسک می‌روند
+SESSION_MEMORY_BUDGET_MB = 64  # بودجه حافظه تاریخچه همه جلسه‌های این سرور
+SESSION_SPILL_PATH = "./session_spill/sessions.sqlite3"
+
+# تنظیمات پایش و لاگ
+METRICS_ENABLED = False  # اندازه‌گیری زمان مراحل نوبت و فراخوانی‌های ChromaDB
+METRICS_WINDOW = 2048  # تعداد آخرین اندازه‌ها برای محاسبه صدک‌ها
+METRICS_PORT = 0  # درگاه /metrics با قالب Prometheus (۰ یعنی خاموش)
+METRICS_HOST = "127.0.0.1"  # درگاه /metrics احراز هویت ندارد و زمان‌بندی داخلی سرویس را نشان می‌دهد؛ فقط در صورت نیاز روی شبکه باز کنید
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = False  # لاگ ساخت‌یافته JSON به جای قالب key=value
\ No newline at end of file
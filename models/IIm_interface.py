@@ -1,16 +1,44 @@
 import openai
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterator
 import json
+import os
+
+from models.keyword_matcher import KeywordLexicon
+from models.llm_backends import OpenAICompatibleBackend
+
+
+# فایل پیش‌فرض واژگان تحلیل
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(__file__), "prompts", "analysis_lexicon.json")
+RESPONSE_PROMPT_PATH = os.path.join(os.path.dirname(__file__), "prompts", "response_prompt.txt")
 
 class LLMInterface:
     """
     ارتباط با مدل زبانی
     """
-    def __init__(self, api_key: str = None, use_local: bool = True):
+    def __init__(self,
+                 api_key: str = None,
+                 use_local: bool = True,
+                 lexicon_path: Optional[str] = None,
+                 backend: Optional[OpenAICompatibleBackend] = None):
         self.use_local = use_local
         
-        if not use_local and api_key:
-            openai.api_key = api_key
+        # backend فقط وقتی استفاده می‌شود که مدل محلی خاموش باشد
+        self.backend = None
+        if not use_local:
+            if backend is not None:
+                self.backend = backend
+            elif api_key:
+                openai.api_key = api_key
+                self.backend = OpenAICompatibleBackend(api_key)
+        
+        try:
+            with open(RESPONSE_PROMPT_PATH, 'r', encoding='utf-8') as f:
+                self.response_prompt = f.read().strip()
+        except OSError:
+            self.response_prompt = "با توجه به تحلیل واقعیت کاربر و سابقه قبلی او، پاسخی همدلانه و پرسشگرانه بده."
+        
+        # واژگان یک بار کامپایل می‌شود و همه فیلدها را با یک پیمایش متن تولید می‌کند
+        self.lexicon = KeywordLexicon.load(lexicon_path or DEFAULT_LEXICON_PATH)
     
     def analyze_reality(self, user_text: str, prompt_template: str) -> Dict[str, Any]:
         """
@@ -20,70 +48,29 @@ class LLMInterface:
         # در نسخه بعدی با LLM واقعی جایگزین می‌شود
         
         # تحلیل بسیار ساده بر اساس کلمات کلیدی
-        analysis = {
-            "emotional_state": self._detect_emotion(user_text),
-            "beliefs": self._detect_beliefs(user_text),
-            "cognitive_needs": self._detect_needs(user_text),
-            "shift_indicators": self._detect_shift(user_text)
-        }
-        
-        return analysis
+        return self.lexicon.analyze(user_text)
+    
+    def analyze_many(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        تحلیل دسته‌ای چند متن (برای پردازش‌های پس‌زمینه)
+        """
+        return self.lexicon.analyze_many(texts)
     
     def _detect_emotion(self, text: str) -> str:
         """تشخیص ساده وضعیت عاطفی"""
-        emotion_keywords = {
-            "شاد": ["خوشحال", "عالی", "خوب"],
-            "غمگین": ["غمگین", "ناراحت", "افسرده"],
-            "سردرگم": ["نمی‌دانم", "مردد", "شک"],
-            "مشتاق": ["کنجکاو", "می‌خواهم", "علاقه"]
-        }
-        
-        for emotion, keywords in emotion_keywords.items():
-            if any(kw in text for kw in keywords):
-                return emotion
-        
-        return "خنثی"
+        return self.lexicon.analyze(text)["emotional_state"]
     
     def _detect_beliefs(self, text: str) -> List[str]:
         """تشخیص ساده باورها"""
-        beliefs = []
-        belief_keywords = {
-            "مادی‌گرایی": ["پول", "ثروت", "مادی"],
-            "معنوی": ["روح", "معنا", "هدف"],
-            "شک‌گرا": ["چرا", "شک", "مطمئن نیستم"]
-        }
-        
-        for belief, keywords in belief_keywords.items():
-            if any(kw in text for kw in keywords):
-                beliefs.append(belief)
-        
-        return beliefs if beliefs else ["نامشخص"]
+        return self.lexicon.analyze(text)["beliefs"]
     
     def _detect_needs(self, text: str) -> str:
         """تشخیص نیاز شناختی"""
-        if "چرا" in text:
-            return "جستجوی معنا"
-        elif "چطور" in text:
-            return "راهنمایی عملی"
-        elif "احساس" in text:
-            return "همدلی و درک"
-        else:
-            return "اطلاعات عمومی"
+        return self.lexicon.analyze(text)["cognitive_needs"]
     
     def _detect_shift(self, text: str) -> List[str]:
         """تشخیص نشانه‌های تغییر"""
-        indicators = []
-        shift_keywords = {
-            "تغییر نگرش": ["قبلاً فکر می‌کردم", "عوض شده", "دیگر"],
-            "بحران": ["بی‌معنا", "پوچ", "چرا"],
-            "آغاز": ["تازه فهمیدم", "الان می‌بینم"]
-        }
-        
-        for indicator, keywords in shift_keywords.items():
-            if any(kw in text for kw in keywords):
-                indicators.append(indicator)
-        
-        return indicators
+        return self.lexicon.analyze(text)["shift_indicators"]
     
     def generate_response(self, 
                           user_text: str, 
@@ -93,6 +80,55 @@ class LLMInterface:
         """
         تولید پاسخ بر اساس تحلیل و واقعیت‌های مشابه
         """
+        if self.backend is None:
+            return self._canned_response(analysis)
+        
+        messages = self._build_messages(user_text, analysis, similar_realities, prompt_template)
+        return self.backend.complete(messages)
+    
+    def stream_response(self,
+                        user_text: str,
+                        analysis: Dict[str, Any],
+                        similar_realities: List[Dict],
+                        prompt_template: str) -> Iterator[str]:
+        """
+        تولید پاسخ به صورت تدریجی (توکن به توکن)
+        """
+        if self.backend is None:
+            words = self._canned_response(analysis).split(" ")
+            for i, word in enumerate(words):
+                yield word if i == 0 else " " + word
+            return
+        
+        messages = self._build_messages(user_text, analysis, similar_realities, prompt_template)
+        yield from self.backend.stream(messages)
+    
+    def _build_messages(self,
+                        user_text: str,
+                        analysis: Dict[str, Any],
+                        similar_realities: List[Dict],
+                        prompt_template: str) -> List[Dict[str, str]]:
+        """ساخت پیام‌های گفتگو برای مدل زبانی"""
+        context_lines = [
+            f"وضعیت عاطفی: {analysis.get('emotional_state', '')}",
+            f"باورها: {', '.join(analysis.get('beliefs', []))}",
+            f"نیاز شناختی: {analysis.get('cognitive_needs', '')}",
+            f"نشانه‌های تغییر: {', '.join(analysis.get('shift_indicators', []))}"
+        ]
+        if similar_realities:
+            context_lines.append("واقعیت‌های مشابه قبلی:")
+            for sim in similar_realities:
+                context_lines.append(f"- {sim.get('text', '')[:200]}")
+        
+        messages = []
+        if prompt_template:
+            messages.append({"role": "system", "content": prompt_template})
+        messages.append({"role": "system", "content": self.response_prompt + "\n\n" + "\n".join(context_lines)})
+        messages.append({"role": "user", "content": user_text})
+        return messages
+    
+    def _canned_response(self, analysis: Dict[str, Any]) -> str:
+        """پاسخ‌های از پیش تعریف‌شده برای حالت محلی"""
         # در این نسخه ساده، پاسخ‌های از پیش تعریف‌شده برمی‌گردانیم
         emotional_state = analysis.get("emotional_state", "")
         
@@ -0,0 +1,147 @@
+import json
+import os
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+
+# نمونه پیش‌فرض جمله‌ها برای مقایسه backendها (حالات و باورهای رایج در گفتگو)
+DEFAULT_SAMPLE_TEXTS = [
+    "امروز خیلی خوشحالم چون دوستم را دیدم",
+    "نمی‌دانم چرا همه چیز این‌قدر سخت شده",
+    "فکر می‌کنم هیچ‌کس مرا درک نمی‌کند",
+    "دوست دارم بدانم دنیا چطور کار می‌کند",
+    "از امتحان فردا خیلی می‌ترسم",
+    "مطمئنم که این بار موفق می‌شوم",
+    "احساس می‌کنم تنها هستم",
+    "چرا آسمان آبی است؟",
+    "به نظرم باید روش جدیدی را امتحان کنم",
+    "دیروز با خانواده به پارک رفتیم و خیلی خوش گذشت",
+    "سردرگم هستم و نمی‌دانم چه تصمیمی بگیرم",
+    "همیشه فکر می‌کردم آدم‌ها بد هستند ولی حالا نظرم عوض شده",
+    "کاش می‌توانستم دوباره از اول شروع کنم",
+    "خیلی کنجکاوم درباره ستاره‌ها بیشتر بدانم",
+    "از دست برادرم عصبانی هستم",
+    "باور دارم که هر مشکلی راه‌حلی دارد",
+    "این روزها حوصله هیچ کاری را ندارم",
+    "معلم امروز از من تعریف کرد",
+    "نگرانم که دوستانم مرا کنار بگذارند",
+    "یاد گرفتم که اشتباه کردن اشکالی ندارد",
+]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.clip(norms, 1e-12, None)
+
+
+def compare_embeddings(reference: np.ndarray,
+                       candidate: np.ndarray,
+                       similarity_threshold: float = 0.6) -> Dict[str, Any]:
+    """
+    مقایسه بردارهای یک backend با بردارهای مرجع float32 برای همان متن‌ها
+
+    - self_cosine: شباهت بردار هر متن در دو backend
+    - pairwise_drift: اختلاف شباهت کسینوسی میان جفت متن‌ها
+    - decision_agreement: درصد جفت‌هایی که تصمیم «واقعیت جدید»
+      (فاصله بیشتر از 1 - similarity_threshold) در هر دو یکسان است
+    """
+    reference = _normalize_rows(np.asarray(reference, dtype=np.float32))
+    candidate = _normalize_rows(np.asarray(candidate, dtype=np.float32))
+
+    self_cosine = np.sum(reference * candidate, axis=1)
+    upper = np.triu_indices(len(reference), k=1)
+    reference_sims = (reference @ reference.T)[upper]
+    candidate_sims = (candidate @ candidate.T)[upper]
+    drift = np.abs(reference_sims - candidate_sims)
+
+    cutoff = 1 - similarity_threshold
+    reference_new = (1 - reference_sims) > cutoff
+    candidate_new = (1 - candidate_sims) > cutoff
+
+    return {
+        "samples": len(reference),
+        "pairs": int(len(drift)),
+        "self_cosine_min": float(self_cosine.min()),
+        "self_cosine_mean": float(self_cosine.mean()),
+        "pairwise_drift_max": float(drift.max()) if len(drift) else 0.0,
+        "pairwise_drift_mean": float(drift.mean()) if len(drift) else 0.0,
+        "decision_agreement": float(np.mean(reference_new == candidate_new)) if len(drift) else 1.0,
+        "decision_flips": int(np.sum(reference_new != candidate_new))
+    }
+
+
+def _timed_encode(model, texts: List[str], repeats: int) -> Tuple[np.ndarray, float]:
+    model.encode_array(texts[:2])  # گرم کردن
+    started = time.perf_counter()
+    for _ in range(repeats):
+        embeddings = model.encode_array(texts)
+    return embeddings, (time.perf_counter() - started) / repeats
+
+
+def check_backend(reference_model,
+                  candidate_model,
+                  texts: Optional[List[str]] = None,
+                  similarity_threshold: float = 0.6,
+                  repeats: int = 3) -> Dict[str, Any]:
+    """
+    گزارش دقت و سرعت یک backend نسبت به مدل مرجع روی مجموعه نمونه
+    """
+    texts = texts or DEFAULT_SAMPLE_TEXTS
+    reference, reference_seconds = _timed_encode(reference_model, texts, repeats)
+    candidate, candidate_seconds = _timed_encode(candidate_model, texts, repeats)
+
+    report = compare_embeddings(reference, candidate, similarity_threshold)
+    report.update({
+        "backend": getattr(candidate_model, "backend", "unknown"),
+        "reference_seconds": reference_seconds,
+        "candidate_seconds": candidate_seconds,
+        "speedup": reference_seconds / candidate_seconds if candidate_seconds > 0 else float("inf")
+    })
+    return report
+
+
+def accuracy_key(model_name: str, backend: str, similarity_threshold: float) -> str:
+    return f"{model_name}:{backend}:{similarity_threshold}"
+
+
+def load_accuracy_report(path: Optional[str], key: str) -> Optional[Dict[str, Any]]:
+    """
+    گزارش ذخیره‌شده بررسی دقت یک (مدل، backend)؛ None یعنی بررسی هنوز انجام نشده
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get(key)
+    except (OSError, ValueError):
+        return None
+
+
+def save_accuracy_report(path: Optional[str], key: str, report: Dict[str, Any]):
+    """
+    ذخیره گزارش بررسی دقت تا در اجراهای بعدی مدل مرجع float32 دوباره بارگذاری نشود
+    """
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    reports = {}
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                reports = json.load(f)
+        except (OSError, ValueError):
+            reports = {}
+    reports[key] = report
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+def is_acceptable(report: Dict[str, Any], max_drift: float = 0.05, min_agreement: float = 0.98) -> bool:
+    """
+    آیا انحراف backend در محدوده مجاز است
+    """
+    return report["pairwise_drift_max"] <= max_drift and report["decision_agreement"] >= min_agreement
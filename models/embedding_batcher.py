@@ -0,0 +1,176 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from models.embedding_model import PersianEmbeddingModel
+
+
+class EmbeddingBatcher:
+    """
+    تجمیع درخواست‌های همزمان encode در یک دسته برای مدل embedding
+
+    درخواست‌ها در صف قرار می‌گیرند و تا رسیدن به max_batch_size یا گذشت
+    max_wait_ms جمع می‌شوند، سپس با یک فراخوانی مدل پردازش و به فراخواننده‌ها
+    برگردانده می‌شوند.
+    """
+    def __init__(self,
+                 embedding_model: PersianEmbeddingModel,
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0,
+                 stats_window: int = 1000):
+        self.embedding_model = embedding_model
+        self.model_name = getattr(embedding_model, "model_name", None)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        # بعد بردارها پس از اولین دسته پردازش‌شده مشخص می‌شود
+        self.dim: Optional[int] = None
+
+        self._queue: "queue.Queue[Optional[Tuple[str, Future, float]]]" = queue.Queue()
+        self._batches = deque(maxlen=stats_window)
+        self._stats_lock = threading.Lock()
+        self._total_batches = 0
+        self._total_items = 0
+        self._closed = False
+        # بررسی _closed و قرار دادن در صف باید با هم انجام شوند تا درخواستی پس از نشانه توقف در صف نماند
+        self._close_lock = threading.Lock()
+
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """
+        قرار دادن یک متن در صف و برگرداندن Future بردار آن
+        """
+        future: Future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher بسته شده است")
+            self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """
+        تبدیل یک متن به بردار float32 از طریق دسته‌بندی مشترک
+        """
+        return self.submit(text).result()
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        تبدیل چند متن به بردار؛ متن‌ها با درخواست‌های دیگر در یک دسته ادغام می‌شوند
+        """
+        if not texts:
+            if self.dim is None:
+                self.encode("")
+            return np.empty((0, self.dim), dtype=np.float32)
+        futures = [self.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures])
+
+    def close(self):
+        """
+        توقف کارگر پس از پردازش درخواست‌های باقیمانده
+        """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        آمار دسته‌ها برای تنظیم پنجره انتظار و اندازه دسته
+        """
+        with self._stats_lock:
+            batches = list(self._batches)
+            total_batches = self._total_batches
+            total_items = self._total_items
+
+        if not batches:
+            return {"batches": total_batches, "items": total_items}
+
+        sizes = np.array([b["size"] for b in batches], dtype=np.float64)
+        compute_ms = np.array([b["compute_ms"] for b in batches], dtype=np.float64)
+        wait_ms = np.array([b["queue_wait_ms"] for b in batches], dtype=np.float64)
+
+        return {
+            "batches": total_batches,
+            "items": total_items,
+            "mean_batch_size": float(sizes.mean()),
+            "max_batch_size": int(sizes.max()),
+            "compute_ms_p50": float(np.percentile(compute_ms, 50)),
+            "compute_ms_p95": float(np.percentile(compute_ms, 95)),
+            "queue_wait_ms_p50": float(np.percentile(wait_ms, 50)),
+            "queue_wait_ms_p95": float(np.percentile(wait_ms, 95)),
+            "items_per_sec": float(sizes.sum() / (compute_ms.sum() / 1000.0)) if compute_ms.sum() > 0 else None,
+            "recent_batches": batches[-10:]
+        }
+
+    def _collect(self, first: Tuple[str, Future, float]) -> Tuple[list, bool]:
+        """جمع کردن درخواست‌ها تا پر شدن دسته یا پایان مهلت انتظار"""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        stop = False
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+            self._process(batch)
+            if stop:
+                break
+
+        # پردازش درخواست‌هایی که پس از بسته شدن در صف مانده‌اند
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                leftover.append(item)
+        for start in range(0, len(leftover), self.max_batch_size):
+            self._process(leftover[start:start + self.max_batch_size])
+
+    def _process(self, batch: list):
+        texts = [text for text, _, _ in batch]
+        started = time.perf_counter()
+        try:
+            embeddings = self.embedding_model.encode_array(texts, batch_size=len(texts))
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        if self.dim is None and len(embeddings):
+            self.dim = int(np.shape(embeddings)[-1])
+
+        for (_, future, _), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+
+        record = {
+            "size": len(batch),
+            "compute_ms": (finished - started) * 1000.0,
+            "queue_wait_ms": (started - min(enqueued for _, _, enqueued in batch)) * 1000.0
+        }
+        with self._stats_lock:
+            self._batches.append(record)
+            self._total_batches += 1
+            self._total_items += len(batch)
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+# با تغییر قالب کلید، کش دیسکی قبلی پاک می‌شود
+KEY_VERSION = "2"
+
+
+def normalize_text(text: str) -> str:
+    """
+    یکسان‌سازی متن برای کلید کش: فقط NFC و فاصله‌ها
+
+    حروف بزرگ و کوچک و نویسه‌های عربی/فارسی یکسان نمی‌شوند، چون مدل آن‌ها را
+    متفاوت embed می‌کند و کش باید همان خروجی encode(text) را برگرداند.
+    """
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def text_key(model_name: str, text: str) -> str:
+    """کلید محتوایی (نام مدل، هش متن یکسان‌شده)"""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model_name}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    کش دو لایه بردارها: LRU در حافظه و SQLite روی دیسک
+
+    اگر نام مدل یا قالب کلید با مقدار ذخیره‌شده در فایل کش فرق کند، کش دیسکی پاک
+    می‌شود. بردارهای برگردانده‌شده کپی هستند و تغییر آن‌ها روی کش اثری ندارد.
+    """
+    def __init__(self,
+                 model_name: str,
+                 path: Optional[str] = None,
+                 max_memory_items: int = 10000):
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+            )
+            self._invalidate_if_model_changed()
+
+    def _invalidate_if_model_changed(self):
+        """پاک کردن کش دیسکی در صورت تغییر EMBEDDING_MODEL یا قالب کلید"""
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'model_name'").fetchone()
+        version = self._db.execute("SELECT value FROM meta WHERE name = 'key_version'").fetchone()
+        if row is None or row[0] != self.model_name or version is None or version[0] != KEY_VERSION:
+            with self._db:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('model_name', ?)",
+                    (self.model_name,)
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('key_version', ?)",
+                    (KEY_VERSION,)
+                )
+            if row is not None:
+                logger.info("♻️ کش embedding به دلیل تغییر مدل یا قالب کلید (%s ← %s) پاک شد.",
+                            row[0], self.model_name)
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """
+        دریافت بردار از کش (ابتدا حافظه، سپس دیسک)
+        """
+        key = text_key(self.model_name, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector.copy()
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector.copy()
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, vector) -> np.ndarray:
+        """
+        ذخیره بردار در هر دو لایه کش
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        key = text_key(self.model_name, text)
+        with self._lock:
+            self._remember(key, vector.copy())
+            if self._db is not None:
+                with self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                        (key, vector.tobytes())
+                    )
+        return vector
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        شمارنده‌های برخورد و عدم برخورد کش
+        """
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory)
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class CachedEmbeddingModel:
+    """
+    مدل embedding با کش محتوایی؛ فقط متن‌های جدید به مدل فرستاده می‌شوند
+    """
+    def __init__(self, embedding_model, cache: EmbeddingCache):
+        self.embedding_model = embedding_model
+        self.model_name = cache.model_name
+        self.cache = cache
+
+    def encode(self, text: str) -> np.ndarray:
+        """
+        تبدیل یک متن به بردار با استفاده از کش
+        """
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = self.cache.put(text, self.embedding_model.encode(text))
+        return vector
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        تبدیل چند متن به بردار؛ متن‌های موجود در کش دوباره محاسبه نمی‌شوند
+        """
+        vectors: List[Optional[np.ndarray]] = [self.cache.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embedding_model.encode_batch([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vectors[i] = self.cache.put(texts[i], vector)
+        return np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def encode_array(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self.encode_batch(texts)
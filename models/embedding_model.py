@@ -1,26 +1,110 @@
-from sentence_transformers import SentenceTransformer
+import logging
+import os
 import numpy as np
-from typing import List
+from typing import List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+
+
+class _OnnxSentenceEncoder:
+    """
+    اجرای مدل با ONNX Runtime با همان خروجی SentenceTransformer.encode
+    (میانگین بردار توکن‌ها با در نظر گرفتن attention mask)
+    """
+    def __init__(self, model_name: str, export_dir: Optional[str] = None, max_seq_length: int = 128):
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("برای EMBEDDING_BACKEND = \"onnx\" بسته optimum[onnxruntime] لازم است") from e
+
+        source = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        if export_dir and os.path.isdir(export_dir) and os.listdir(export_dir):
+            self.model = ORTModelForFeatureExtraction.from_pretrained(export_dir)
+            self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        else:
+            self.model = ORTModelForFeatureExtraction.from_pretrained(source, export=True)
+            self.tokenizer = AutoTokenizer.from_pretrained(source)
+            if export_dir:
+                self.model.save_pretrained(export_dir)
+                self.tokenizer.save_pretrained(export_dir)
+        self.max_seq_length = max_seq_length
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors="np")
+            hidden = self.model(**tokens).last_hidden_state
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            outputs.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        embeddings = np.concatenate(outputs).astype(np.float32) if outputs else np.zeros((0, 0), np.float32)
+        return embeddings[0] if single else embeddings
+
 
 class PersianEmbeddingModel:
     """
     مدل تبدیل متن فارسی به بردار (embedding)
+
+    backend:
+        "torch": مدل کامل float32 (پیش‌فرض)
+        "int8":  وزن‌های لایه‌های خطی با کوانتیزه‌سازی پویای int8 (فقط CPU)
+        "onnx":  مدل صادرشده برای ONNX Runtime
     """
-    def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"):
-        print(f"در حال بارگذاری مدل {model_name}...")
-        self.model = SentenceTransformer(model_name)
-        print("مدل با موفقیت بارگذاری شد.")
+    def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2", snapshot_dir: Optional[str] = None,
+                 backend: str = "torch"):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"backend نامعتبر: {backend} (مجاز: {', '.join(EMBEDDING_BACKENDS)})")
+
+        self.model_name = model_name
+        self.backend = backend
+        if backend == "onnx":
+            logger.info("در حال بارگذاری مدل %s با ONNX Runtime...", model_name)
+            self.model = _OnnxSentenceEncoder(model_name, os.path.join(snapshot_dir, "onnx") if snapshot_dir else None)
+        else:
+            self.model = self._load_sentence_transformer(model_name, snapshot_dir)
+            if backend == "int8":
+                import torch
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info("مدل با موفقیت بارگذاری شد.", extra={"model": model_name, "backend": backend})
+    
+    @staticmethod
+    def _load_sentence_transformer(model_name: str, snapshot_dir: Optional[str]):
+        # import سنگین فقط هنگام ساخت مدل انجام می‌شود
+        from sentence_transformers import SentenceTransformer
+
+        if snapshot_dir and os.path.exists(os.path.join(snapshot_dir, "modules.json")):
+            # نسخه ذخیره‌شده محلی: بدون دانلود و بررسی مخزن مدل
+            logger.info("در حال بارگذاری مدل %s از %s...", model_name, snapshot_dir)
+            return SentenceTransformer(snapshot_dir)
+        logger.info("در حال بارگذاری مدل %s...", model_name)
+        model = SentenceTransformer(model_name)
+        if snapshot_dir:
+            model.save(snapshot_dir)
+            logger.info("نسخه محلی مدل در %s ذخیره شد.", snapshot_dir)
+        return model
     
-    def encode(self, text: str) -> List[float]:
+    def encode(self, text: str) -> np.ndarray:
         """
-        تبدیل یک متن به بردار
+        تبدیل یک متن به بردار float32
         """
         embedding = self.model.encode(text)
-        return embedding.tolist()
+        return np.asarray(embedding, dtype=np.float32)
     
-    def encode_batch(self, texts: List[str]) -> List[List[float]]:
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
         """
-        تبدیل چند متن به بردار
+        تبدیل چند متن به ماتریس بردارها (هر سطر یک متن)
         """
         embeddings = self.model.encode(texts)
-        return [emb.tolist() for emb in embeddings]
+        return np.asarray(embeddings, dtype=np.float32)
+    
+    def encode_array(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        تبدیل چند متن به ماتریس float32 بدون تبدیل به لیست پایتونی
+        """
+        embeddings = self.model.encode(texts, batch_size=batch_size)
+        return np.asarray(embeddings, dtype=np.float32)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+from collections import deque
+from typing import List, Dict, Any, Hashable, Iterable, Set, Tuple
+
+
+class AhoCorasick:
+    """
+    تطبیق همزمان چند الگو با یک بار پیمایش متن (الگوریتم Aho–Corasick)
+
+    هزینه جستجو مستقل از تعداد کلمات کلیدی و متناسب با طول متن است.
+    """
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[Hashable, ...]] = [()]
+        self._built = False
+
+    def add(self, pattern: str, payload: Hashable):
+        """
+        افزودن یک الگو همراه با برچسبی که در صورت یافتن برگردانده می‌شود
+        """
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = next_node
+        if payload not in self._out[node]:
+            self._out[node] = self._out[node] + (payload,)
+        self._built = False
+
+    def build(self):
+        """
+        ساخت پیوندهای شکست و ادغام خروجی‌ها (یک بار پس از افزودن الگوها)
+        """
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            queue.append(node)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                inherited = self._out[self._fail[child]]
+                if inherited:
+                    self._out[child] = self._out[child] + tuple(
+                        p for p in inherited if p not in self._out[child]
+                    )
+        self._built = True
+
+    def find(self, text: str) -> Set[Hashable]:
+        """
+        برگرداندن برچسب همه الگوهایی که در متن وجود دارند
+        """
+        if not self._built:
+            self.build()
+
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[Hashable] = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class KeywordLexicon:
+    """
+    واژگان تحلیل (حالت عاطفی، باورها، نیاز شناختی، نشانه‌های تغییر)
+    که یک بار کامپایل می‌شود و هر چهار فیلد را با یک پیمایش متن تولید می‌کند
+
+    هر فیلد در فایل واژگان یکی از دو حالت را دارد:
+    - first: اولین برچسب (به ترتیب فایل) که کلمه‌اش در متن باشد
+    - all: همه برچسب‌هایی که کلمه‌شان در متن باشد، به ترتیب فایل
+    """
+    def __init__(self, fields: Dict[str, Dict[str, Any]]):
+        # اثر انگشت محتوای واژگان (برای باطل شدن کش تحلیل‌ها پس از تغییر فایل)
+        self.version = hashlib.sha256(
+            json.dumps(fields, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        self.fields: List[Tuple[str, str, List[str], Any]] = []
+        self.matcher = AhoCorasick()
+
+        for field_index, (field, spec) in enumerate(fields.items()):
+            mode = spec.get("mode", "all")
+            if mode not in ("first", "all"):
+                raise ValueError(f"حالت نامعتبر '{mode}' برای فیلد {field}")
+            labels = []
+            for label_index, (label, keywords) in enumerate(spec["labels"]):
+                labels.append(label)
+                for keyword in keywords:
+                    self.matcher.add(keyword, (field_index, label_index))
+            self.fields.append((field, mode, labels, spec.get("default")))
+
+        self.matcher.build()
+
+    @classmethod
+    def load(cls, path: str) -> "KeywordLexicon":
+        """
+        بارگذاری واژگان از فایل JSON
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        """
+        تولید همه فیلدهای تحلیل با یک پیمایش متن
+        """
+        found = self.matcher.find(text)
+        result = {}
+        for field_index, (field, mode, labels, default) in enumerate(self.fields):
+            matched = sorted(label_index for f, label_index in found if f == field_index)
+            if mode == "first":
+                result[field] = labels[matched[0]] if matched else default
+            else:
+                values = [labels[i] for i in matched]
+                result[field] = values if values else list(default or [])
+        return result
+
+    def analyze_many(self, texts: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        تحلیل دسته‌ای متن‌ها (برای پردازش‌های پس‌زمینه)
+        """
+        return [self.analyze(text) for text in texts]
@@ -0,0 +1,110 @@
+import threading
+import time
+import random
+from typing import List, Dict, Iterator, Optional
+
+import httpx
+import openai
+
+
+# خطاهای گذرا که ارزش تلاش دوباره دارند
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class OpenAICompatibleBackend:
+    """
+    کلاینت مدل زبانی سازگار با OpenAI (OpenAI یا هر سرور با همان API)
+
+    - یک اتصال HTTP مشترک (connection pool) برای همه درخواست‌ها
+    - دریافت تدریجی توکن‌ها (streaming)
+    - محدودیت زمانی و تلاش دوباره با backoff نمایی
+    - سقف تعداد درخواست‌های همزمان
+    """
+    def __init__(self,
+                 api_key: str,
+                 base_url: Optional[str] = None,
+                 model: str = "gpt-3.5-turbo",
+                 timeout: float = 30.0,
+                 max_retries: int = 3,
+                 max_concurrency: int = 8,
+                 backoff_base: float = 0.5,
+                 temperature: float = 0.7):
+        self.model = model
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.temperature = temperature
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        self._http = httpx.Client(
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(max_connections=max_concurrency,
+                                max_keepalive_connections=max_concurrency)
+        )
+        # تلاش دوباره را خودمان مدیریت می‌کنیم تا با سقف همزمانی هماهنگ باشد
+        self.client = openai.OpenAI(
+            api_key=api_key or "not-needed",
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=0,
+            http_client=self._http
+        )
+
+    def _backoff(self, attempt: int):
+        delay = self.backoff_base * (2 ** attempt)
+        time.sleep(delay + random.uniform(0, delay / 2))
+
+    def complete(self, messages: List[Dict[str, str]]) -> str:
+        """
+        دریافت کامل پاسخ در یک درخواست
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    completion = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=self.temperature
+                    )
+                return completion.choices[0].message.content or ""
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                self._backoff(attempt)
+
+    def stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        """
+        دریافت پاسخ به صورت توکن به توکن
+
+        تلاش دوباره فقط تا پیش از رسیدن اولین توکن انجام می‌شود.
+        """
+        for attempt in range(self.max_retries + 1):
+            received_any = False
+            try:
+                with self._slots:
+                    chunks = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        stream=True
+                    )
+                    for chunk in chunks:
+                        if not chunk.choices:
+                            continue
+                        token = chunk.choices[0].delta.content
+                        if token:
+                            received_any = True
+                            yield token
+                return
+            except RETRYABLE_ERRORS:
+                if received_any or attempt == self.max_retries:
+                    raise
+                self._backoff(attempt)
+
+    def close(self):
+        self._http.close()
@@ -0,0 +1,228 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+from models.embedding_cache import normalize_text
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    کش با انقضای زمانی (TTL) و حداکثر اندازه (حذف LRU)، با ذخیره اختیاری روی دیسک
+    """
+    def __init__(self, max_size: int = 5000, ttl_seconds: float = 3600.0, path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            with self._db:
+                self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._items.move_to_end(key)
+                    return value
+                del self._items[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, value FROM entries WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[1])
+                    self._remember(key, row[0], value)
+                    return value
+        return default
+
+    def put(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO entries (key, expires_at, value) VALUES (?, ?, ?)",
+                        (key, expires_at, json.dumps(value, ensure_ascii=False))
+                    )
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        self._items[key] = (expires_at, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _fingerprint(value: Any) -> str:
+    """اثر انگشت پایدار یک ساختار JSON"""
+    encoded = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class MemoizedLLM:
+    """
+    لایه memoization جلوی LLMInterface برای analyze_reality و generate_response
+
+    کلید: (نام متد، قالب پرامپت، متن کاربر، اثر انگشت تحلیل، شناسه‌های بازیابی‌شده)؛
+    پاسخ‌ها با هویت backend (محلی یا مدل و آدرس سرور) و پرامپت پاسخ هم کلید می‌خورند
+    تا پس از تغییر مدل یا پرامپت، پاسخ‌های قدیمی کش دیسکی استفاده نشوند.
+    تحلیل‌ها با متن خام و نسخه واژگان تحلیل کلید می‌خورند، چون تحلیل کلیدواژه‌ای به
+    نویسه‌ها حساس است و با تغییر analysis_lexicon.json نتیجه‌اش عوض می‌شود.
+    """
+    def __init__(self, llm, cache: TTLCache):
+        self.llm = llm
+        self.cache = cache
+        self._stats_lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._responder = self._responder_identity()
+
+    def __getattr__(self, name):
+        # بقیه ویژگی‌ها (مثل lexicon و backend) از LLMInterface اصلی
+        return getattr(self.llm, name)
+
+    def _key(self,
+             method: str,
+             prompt_template: str,
+             user_text: str,
+             analysis: Optional[Dict[str, Any]] = None,
+             similar_realities: Optional[List[Dict]] = None) -> str:
+        parts = {
+            "method": method,
+            "template": hashlib.sha256((prompt_template or "").encode("utf-8")).hexdigest(),
+            "text": user_text if method == "analyze_reality" else normalize_text(user_text),
+            "lexicon": self._lexicon_version() if method == "analyze_reality" else None,
+            "responder": self._responder if method != "analyze_reality" else None,
+            "analysis": _fingerprint(analysis) if analysis is not None else None,
+            "context": [sim.get("id") for sim in similar_realities] if similar_realities else []
+        }
+        return _fingerprint(parts)
+
+    def _responder_identity(self) -> str:
+        """اثر انگشت چیزهایی که پاسخ به آن‌ها وابسته است جز ورودی‌های هر نوبت"""
+        backend = getattr(self.llm, "backend", None)
+        return _fingerprint({
+            "backend": None if backend is None else {
+                "model": getattr(backend, "model", None),
+                "base_url": getattr(backend, "base_url", None),
+                "temperature": getattr(backend, "temperature", None)
+            },
+            "response_prompt": getattr(self.llm, "response_prompt", None)
+        })
+
+    def _lexicon_version(self) -> Optional[str]:
+        lexicon = getattr(self.llm, "lexicon", None)
+        return getattr(lexicon, "version", None)
+
+    def _record(self, method: str, hit: bool):
+        with self._stats_lock:
+            counter = self._hits if hit else self._misses
+            counter[method] = counter.get(method, 0) + 1
+
+    def analyze_reality(self, user_text: str, prompt_template: str) -> Dict[str, Any]:
+        """
+        تحلیل واقعیت با استفاده از کش
+        """
+        key = self._key("analyze_reality", prompt_template, user_text)
+        analysis = self.cache.get(key, _MISSING)
+        if analysis is not _MISSING:
+            self._record("analyze_reality", True)
+            return copy.deepcopy(analysis)
+
+        self._record("analyze_reality", False)
+        analysis = self.llm.analyze_reality(user_text, prompt_template)
+        self.cache.put(key, copy.deepcopy(analysis))
+        return analysis
+
+    def analyze_many(self, texts: List[str]) -> List[Dict[str, Any]]:
+        return [self.analyze_reality(text, "") for text in texts]
+
+    def generate_response(self,
+                          user_text: str,
+                          analysis: Dict[str, Any],
+                          similar_realities: List[Dict],
+                          prompt_template: str) -> str:
+        """
+        تولید پاسخ با استفاده از کش
+        """
+        key = self._key("generate_response", prompt_template, user_text, analysis, similar_realities)
+        response = self.cache.get(key, _MISSING)
+        if response is not _MISSING:
+            self._record("generate_response", True)
+            return response
+
+        self._record("generate_response", False)
+        response = self.llm.generate_response(user_text, analysis, similar_realities, prompt_template)
+        self.cache.put(key, response)
+        return response
+
+    def stream_response(self,
+                        user_text: str,
+                        analysis: Dict[str, Any],
+                        similar_realities: List[Dict],
+                        prompt_template: str) -> Iterator[str]:
+        """
+        پاسخ تدریجی؛ در صورت وجود در کش، پاسخ کامل یک‌جا برگردانده می‌شود
+        """
+        # کلید مشترک با generate_response تا هر دو مسیر از یک کش استفاده کنند
+        key = self._key("generate_response", prompt_template, user_text, analysis, similar_realities)
+        response = self.cache.get(key, _MISSING)
+        if response is not _MISSING:
+            self._record("generate_response", True)
+            yield response
+            return
+
+        self._record("generate_response", False)
+        tokens = []
+        for token in self.llm.stream_response(user_text, analysis, similar_realities, prompt_template):
+            tokens.append(token)
+            yield token
+        self.cache.put(key, "".join(tokens))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        نرخ برخورد کش به تفکیک متد
+        """
+        with self._stats_lock:
+            methods = set(self._hits) | set(self._misses)
+            result = {}
+            for method in sorted(methods):
+                hits = self._hits.get(method, 0)
+                misses = self._misses.get(method, 0)
+                result[method] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses else 0.0
+                }
+        return result
@@ -0,0 +1,478 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, Sequence, Tuple
+
+import numpy as np
+
+from memory.vector_store import RealityMemory
+from memory.retrieval import search_diverse
+from memory.timeline_index import timestamp_to_epoch, encode_cursor, decode_cursor
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+VECTOR_DTYPES = ("float16", "int8")
+_SCAN_CHUNK_ROWS = 65536
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.clip(norms, 1e-12, None)
+
+
+class _GrowableMemmap:
+    """
+    آرایه ذخیره‌شده در فایل (memory-mapped) که با رشد داده‌ها بزرگ‌تر می‌شود
+    """
+    def __init__(self, path: str, dtype: str, row_shape: Tuple[int, ...] = (), initial_capacity: int = 1024):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.row_bytes = self.dtype.itemsize * int(np.prod(row_shape, dtype=np.int64))
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.truncate(initial_capacity * self.row_bytes)
+        self.capacity = os.path.getsize(path) // self.row_bytes
+        self._open()
+
+    def _open(self):
+        self.array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(self.capacity,) + self.row_shape)
+
+    def ensure(self, rows: int):
+        if rows <= self.capacity:
+            return
+        capacity = max(rows, self.capacity * 2)
+        self.array.flush()
+        # خواننده‌هایی که نگاشت قبلی را دارند همچنان معتبر می‌مانند
+        with open(self.path, "r+b") as f:
+            f.truncate(capacity * self.row_bytes)
+        self.capacity = capacity
+        self._open()
+
+    def flush(self):
+        self.array.flush()
+
+
+class CompactRealityMemory:
+    """
+    حافظه واقعیت‌ها با بردارهای فشرده (float16 یا int8) در فایل memory-mapped
+
+    - بردارها نرمال‌شده و فشرده ذخیره می‌شوند (۲ تا ۴ برابر کوچک‌تر از float32)
+    - جستجو ابتدا روی بردارهای فشرده انجام می‌شود و سپس rerank_factor × n_results
+      نامزد برتر با بردار دقیق float32 دوباره امتیازدهی می‌شوند (اگر keep_exact فعال باشد؛
+      فایل دقیق فقط برای نامزدها خوانده می‌شود و در حافظه مقیم نمی‌ماند)
+    - متن، متادیتا و ترتیب زمانی در SQLite نگه‌داری می‌شوند
+
+    رابط آن همانند RealityMemory است.
+    """
+    def __init__(self,
+                 persist_directory: str,
+                 collection_name: str,
+                 vector_dtype: str = "float16",
+                 keep_exact: bool = True,
+                 rerank_factor: int = 4):
+        if vector_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"vector_dtype نامعتبر: {vector_dtype} (مجاز: {', '.join(VECTOR_DTYPES)})")
+
+        self.collection_name = collection_name
+        self.directory = os.path.join(persist_directory, f"{collection_name}.compact")
+        os.makedirs(self.directory, exist_ok=True)
+        self.rerank_factor = max(1, rerank_factor)
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(os.path.join(self.directory, "meta.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS realities ("
+            " row INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE, user_id TEXT NOT NULL,"
+            " ts REAL NOT NULL, document TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS realities_user_ts ON realities (user_id, ts, doc_id)")
+
+        # قالب ذخیره‌سازی هنگام ساخت تعیین و پس از آن ثابت می‌ماند
+        settings = dict(self._db.execute("SELECT key, value FROM settings").fetchall())
+        if settings:
+            if settings["vector_dtype"] != vector_dtype or settings["keep_exact"] != str(int(keep_exact)):
+                raise ValueError(
+                    f"{self.directory} با قالب {settings['vector_dtype']} "
+                    f"(keep_exact={settings['keep_exact']}) ساخته شده است"
+                )
+        else:
+            with self._db:
+                self._db.executemany("INSERT INTO settings (key, value) VALUES (?, ?)",
+                                     [("vector_dtype", vector_dtype), ("keep_exact", str(int(keep_exact)))])
+        self.vector_dtype = vector_dtype
+        self.keep_exact = keep_exact
+
+        self._rows = self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM realities").fetchone()[0]
+        self.dim: Optional[int] = int(settings["dim"]) if "dim" in settings else None
+        self._vectors = self._scales = self._exact = None
+        if self.dim is not None:
+            self._open_files()
+
+        logger.info("✅ حافظه فشرده (%s) در %s راه‌اندازی شد.", vector_dtype, self.directory)
+
+    def _open_files(self):
+        suffix = "f16" if self.vector_dtype == "float16" else "i8"
+        self._vectors = _GrowableMemmap(os.path.join(self.directory, f"vectors.{suffix}"),
+                                        self.vector_dtype, (self.dim,))
+        if self.vector_dtype == "int8":
+            self._scales = _GrowableMemmap(os.path.join(self.directory, "scales.f32"), "float32")
+        if self.keep_exact:
+            self._exact = _GrowableMemmap(os.path.join(self.directory, "exact.f32"), "float32", (self.dim,))
+
+    def _quantize(self, matrix: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.vector_dtype == "float16":
+            return matrix.astype(np.float16), None
+        # کوانتیزه‌سازی متقارن با یک ضریب برای هر بردار
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+
+    def _dequantize(self, rows) -> np.ndarray:
+        vectors = np.asarray(self._vectors.array[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= self._scales.array[rows][:, None]
+        return vectors
+
+    def _append(self,
+                ids: List[str],
+                documents: List[str],
+                metadatas: List[Dict[str, Any]],
+                embeddings: np.ndarray):
+        matrix = _normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        codes, scales = self._quantize(matrix)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                with self._db:
+                    self._db.execute("INSERT INTO settings (key, value) VALUES ('dim', ?)", (str(self.dim),))
+                self._open_files()
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"بعد بردار {matrix.shape[1]} با بعد حافظه ({self.dim}) یکسان نیست")
+
+            start, end = self._rows, self._rows + len(ids)
+            # ابتدا بردارها نوشته می‌شوند؛ سطری که در SQLite ثبت نشده باشد بعداً بازنویسی می‌شود
+            self._vectors.ensure(end)
+            self._vectors.array[start:end] = codes
+            self._vectors.flush()
+            if self._scales is not None:
+                self._scales.ensure(end)
+                self._scales.array[start:end] = scales
+                self._scales.flush()
+            if self._exact is not None:
+                self._exact.ensure(end)
+                self._exact.array[start:end] = matrix
+                self._exact.flush()
+
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO realities (row, doc_id, user_id, ts, document, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(start + i, doc_id, metadata["user_id"], timestamp_to_epoch(metadata.get("timestamp")),
+                      document, json.dumps(metadata, ensure_ascii=False))
+                     for i, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas))]
+                )
+            self._rows = end
+
+    def add_reality(self,
+                    user_id: str,
+                    text: str,
+                    embedding,
+                    analysis: Dict[str, Any]):
+        """
+        ذخیره یک "واقعیت" جدید
+        """
+        doc_id = RealityMemory._new_id(user_id)
+        metadata = RealityMemory._build_metadata(user_id, text, analysis)
+        self._append([doc_id], [text], [metadata], embedding)
+        logger.debug("✅ واقعیت جدید ذخیره شد.", extra={"user_id": user_id, "doc_id": doc_id})
+        return doc_id
+
+    def add_realities_bulk(self,
+                           records: Iterable[Dict[str, Any]],
+                           embedding_model=None,
+                           chunk_size: int = 256,
+                           on_progress: Optional[Callable[[int, float], None]] = None) -> Dict[str, Any]:
+        """
+        ورود انبوه واقعیت‌ها (همان قالب رکورد RealityMemory.add_realities_bulk)
+        """
+        records = iter(records)
+        started = time.perf_counter()
+        total = 0
+
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+
+            # شناسه تکراری در یک دسته (مانند upsert در Chroma): فقط آخرین رکورد نوشته می‌شود
+            last = {record["id"]: i for i, record in enumerate(chunk) if record.get("id")}
+            unique = [record for i, record in enumerate(chunk)
+                      if not record.get("id") or last[record["id"]] == i]
+            total += len(chunk) - len(unique)
+            chunk = unique
+
+            missing = [i for i, record in enumerate(chunk) if record.get("embedding") is None]
+            computed = {}
+            if missing:
+                if embedding_model is None:
+                    raise ValueError("برای رکوردهای بدون بردار، embedding_model لازم است")
+                computed = dict(zip(missing, embedding_model.encode_batch([chunk[i]["text"] for i in missing])))
+
+            # رکوردهای دارای id که قبلاً ذخیره شده‌اند (مثلاً بازپخش لاگ) دوباره نوشته نمی‌شوند
+            given = [record["id"] for record in chunk if record.get("id")]
+            if given:
+                stored = self._stored_ids(given)
+                kept = [i for i, record in enumerate(chunk) if record.get("id") not in stored]
+                computed = {j: computed[i] for j, i in enumerate(kept) if i in computed}
+                skipped = len(chunk) - len(kept)
+                chunk = [chunk[i] for i in kept]
+                total += skipped
+                if not chunk:
+                    continue
+
+            ids = [record.get("id") or RealityMemory._new_id(record["user_id"]) for record in chunk]
+            documents = [record["text"] for record in chunk]
+            metadatas = [dict(record["metadata"]) if record.get("metadata") else
+                         RealityMemory._build_metadata(record["user_id"], record["text"],
+                                                       record.get("analysis") or {}, record.get("timestamp"))
+                         for record in chunk]
+            embeddings = np.stack([np.asarray(computed[i] if i in computed else record["embedding"],
+                                              dtype=np.float32)
+                                   for i, record in enumerate(chunk)])
+            self._append(ids, documents, metadatas, embeddings)
+
+            total += len(chunk)
+            elapsed = time.perf_counter() - started
+            if on_progress is not None:
+                on_progress(total, elapsed)
+            else:
+                logger.info("📥 %d واقعیت وارد شد (%.0f ردیف در ثانیه)", total, total / elapsed)
+
+        elapsed = time.perf_counter() - started
+        return {
+            "rows": total,
+            "seconds": elapsed,
+            "rows_per_sec": total / elapsed if elapsed > 0 else 0.0
+        }
+
+    def count(self) -> int:
+        return self._rows
+
+    def _stored_ids(self, ids: List[str]) -> set:
+        with self._lock:
+            stored = set()
+            for start in range(0, len(ids), 500):
+                part = ids[start:start + 500]
+                stored.update(doc_id for (doc_id,) in self._db.execute(
+                    f"SELECT doc_id FROM realities WHERE doc_id IN ({','.join('?' * len(part))})", part
+                ))
+            return stored
+
+    def _top(self, rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(rows) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[best], scores[best]
+        return rows, scores
+
+    def search_similar_realities(self,
+                                 query_embedding,
+                                 user_id: Optional[str] = None,
+                                 n_results: int = 3,
+                                 include_embeddings: bool = False) -> List[Dict]:
+        """
+        جستجوی واقعیت‌های مشابه: پیمایش بردارهای فشرده و امتیازدهی دقیق نامزدها
+        """
+        with metrics.span("vector_search_seconds", store="compact"):
+            return self._search(query_embedding, user_id, n_results, include_embeddings)
+
+    def search_diverse_realities(self,
+                                 query_embedding,
+                                 user_id: Optional[str] = None,
+                                 n_results: int = 3,
+                                 candidate_multiplier: int = 4,
+                                 mmr_lambda: float = 0.7,
+                                 dedup_distance: float = 0.05,
+                                 max_distance: Optional[float] = None) -> List[Dict]:
+        """
+        جستجوی متنوع: نامزدهای بیشتر، حذف تکراری‌ها و بازچینی MMR (memory/retrieval.py)
+        """
+        return search_diverse(self, query_embedding, user_id, n_results, candidate_multiplier,
+                              mmr_lambda, dedup_distance, max_distance)
+
+    def _search(self,
+                query_embedding,
+                user_id: Optional[str],
+                n_results: int,
+                include_embeddings: bool = False) -> List[Dict]:
+        with self._lock:
+            total = self._rows
+            if self.dim is None or total == 0:
+                return []
+            if user_id:
+                rows = np.fromiter(
+                    (r for (r,) in self._db.execute("SELECT row FROM realities WHERE user_id = ?", (user_id,))),
+                    dtype=np.int64
+                )
+            else:
+                rows = None
+
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        k = n_results * self.rerank_factor
+
+        if rows is not None:
+            if len(rows) == 0:
+                return []
+            candidates, scores = self._top(rows, self._dequantize(rows) @ query, k)
+        else:
+            candidates = np.empty(0, dtype=np.int64)
+            scores = np.empty(0, dtype=np.float32)
+            for start in range(0, total, _SCAN_CHUNK_ROWS):
+                chunk_rows = np.arange(start, min(start + _SCAN_CHUNK_ROWS, total))
+                chunk_scores = self._dequantize(slice(chunk_rows[0], chunk_rows[-1] + 1)) @ query
+                candidates, scores = self._top(np.concatenate([candidates, chunk_rows]),
+                                               np.concatenate([scores, chunk_scores]), k)
+
+        if self._exact is not None:
+            order = np.argsort(candidates)  # خواندن ترتیبی از فایل دقیق
+            candidates = candidates[order]
+            scores = np.asarray(self._exact.array[candidates], dtype=np.float32) @ query
+
+        best = np.argsort(-scores)[:n_results]
+        candidates, scores = candidates[best], scores[best]
+        vectors = None
+        if include_embeddings and len(candidates):
+            vectors = (np.asarray(self._exact.array[candidates], dtype=np.float32)
+                       if self._exact is not None else self._dequantize(candidates))
+
+        with self._lock:
+            found = {
+                row: (doc_id, document, metadata)
+                for row, doc_id, document, metadata in self._db.execute(
+                    f"SELECT row, doc_id, document, metadata FROM realities "
+                    f"WHERE row IN ({','.join('?' * len(candidates))})",
+                    [int(r) for r in candidates]
+                )
+            }
+
+        results = []
+        for position, (row, score) in enumerate(zip(candidates, scores)):
+            if int(row) not in found:
+                continue
+            doc_id, document, metadata = found[int(row)]
+            results.append({
+                'id': doc_id,
+                'text': document,
+                'metadata': json.loads(metadata),
+                'distance': float(1.0 - score)
+            })
+            if vectors is not None:
+                results[-1]['embedding'] = vectors[position]
+        return results
+
+    def get_user_history(self, user_id: str, limit: int = 10) -> List[Dict]:
+        """
+        دریافت تاریخچه واقعیت‌های یک کاربر (جدیدترین‌ها اول)
+        """
+        return self.get_user_history_page(user_id, limit)["items"]
+
+    def get_user_history_page(self,
+                              user_id: str,
+                              limit: int = 10,
+                              cursor: Optional[str] = None,
+                              order: str = "desc",
+                              include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        """
+        یک صفحه از تاریخچه مرتب‌شده بر اساس زمان (همان قالب cursor در RealityMemory)
+        """
+        descending = order == "desc"
+        clauses = ["user_id = ?"]
+        params: list = [user_id]
+        if cursor:
+            ts, doc_id = decode_cursor(cursor)
+            clauses.append("(ts, doc_id) < (?, ?)" if descending else "(ts, doc_id) > (?, ?)")
+            params += [ts, doc_id]
+        direction = "DESC" if descending else "ASC"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT row, ts, doc_id, document, metadata FROM realities WHERE {' AND '.join(clauses)} "
+                f"ORDER BY ts {direction}, doc_id {direction} LIMIT ?",
+                params
+            ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][2])
+
+        embeddings = None
+        if "embeddings" in include and rows:
+            positions = [row for row, *_ in rows]
+            embeddings = (np.asarray(self._exact.array[positions], dtype=np.float32)
+                          if self._exact is not None else self._dequantize(positions))
+
+        items = []
+        for i, (row, ts, doc_id, document, metadata) in enumerate(rows):
+            entry = {'id': doc_id, 'ts': ts}
+            if "documents" in include:
+                entry['text'] = document
+            if "metadatas" in include:
+                entry['metadata'] = json.loads(metadata)
+            if embeddings is not None:
+                entry['embedding'] = embeddings[i]
+            items.append(entry)
+        return {"items": items, "next_cursor": next_cursor}
+
+    def iter_user_history(self,
+                          user_id: str,
+                          page_size: int = 200,
+                          include: Sequence[str] = ("documents", "metadatas")) -> Iterator[Dict]:
+        """
+        پیمایش کل تاریخچه کاربر از قدیمی به جدید با حافظه ثابت
+        """
+        cursor = None
+        while True:
+            page = self.get_user_history_page(user_id, page_size, cursor, "asc", include)
+            yield from page["items"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        اندازه بردارهای مقیم (پیمایش‌شده در جستجو) و حجم فایل‌ها روی دیسک
+        """
+        resident_per_vector = 0
+        if self.dim is not None:
+            resident_per_vector = self.dim * np.dtype(self.vector_dtype).itemsize
+            if self.vector_dtype == "int8":
+                resident_per_vector += 4
+        disk_bytes = sum(os.path.getsize(os.path.join(self.directory, name))
+                         for name in os.listdir(self.directory))
+        return {
+            "rows": self._rows,
+            "dim": self.dim,
+            "vector_dtype": self.vector_dtype,
+            "resident_bytes": resident_per_vector * self._rows,
+            "float32_bytes": (self.dim or 0) * 4 * self._rows,
+            "disk_bytes": disk_bytes
+        }
+
+    def close(self):
+        with self._lock:
+            for f in (self._vectors, self._scales, self._exact):
+                if f is not None:
+                    f.flush()
+            self._db.close()
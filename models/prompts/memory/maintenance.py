@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+import numpy as np
+
+from memory.vector_store import RealityMemory, _as_list
+from memory.sharded_store import ShardedRealityMemory, shard_for
+from memory.write_behind import WriteBehindMemory
+from memory.timeline_index import timestamp_to_epoch
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    """
+    سیاست نگه‌داری: کدام واقعیت‌ها خلاصه می‌شوند
+
+    فقط واقعیت‌های قدیمی‌تر از max_age_days و خارج از keep_recent واقعیت آخر هر کاربر
+    بررسی می‌شوند. واقعیت‌هایی که فاصله کسینوسی‌شان با سرگروه کمتر از cluster_distance
+    باشد یک خوشه‌اند و هر خوشه با دست‌کم min_cluster_size عضو با یک نماینده جایگزین می‌شود.
+    """
+    def __init__(self,
+                 max_age_days: float = 90,
+                 keep_recent: int = 50,
+                 cluster_distance: float = 0.15,
+                 min_cluster_size: int = 2,
+                 batch_size: int = 2000):
+        self.max_age_days = max_age_days
+        self.keep_recent = keep_recent
+        self.cluster_distance = cluster_distance
+        self.min_cluster_size = max(2, min_cluster_size)
+        self.batch_size = batch_size
+
+    def cutoff(self, now: Optional[datetime] = None) -> float:
+        return ((now or datetime.now()) - timedelta(days=self.max_age_days)).timestamp()
+
+
+def cluster_vectors(vectors: np.ndarray, max_distance: float) -> List[List[int]]:
+    """
+    خوشه‌بندی حریصانه (leader): هر بردار بدون خوشه سرگروه می‌شود و همه بردارهای
+    بدون خوشه نزدیک‌تر از max_distance به آن عضو خوشه‌اش می‌شوند. ورودی باید نرمال باشد.
+    """
+    unassigned = np.ones(len(vectors), dtype=bool)
+    clusters = []
+    for leader in range(len(vectors)):
+        if not unassigned[leader]:
+            continue
+        members = np.flatnonzero(unassigned & (vectors @ vectors[leader] >= 1.0 - max_distance))
+        unassigned[members] = False
+        clusters.append(members.tolist())
+    return clusters
+
+
+def _weight(metadata: Dict[str, Any]) -> int:
+    return int(metadata.get("merged_count", 1))
+
+
+def merge_cluster(user_id: str,
+                  ids: List[str],
+                  documents: List[str],
+                  metadatas: List[Dict[str, Any]],
+                  vectors: np.ndarray) -> Dict[str, Any]:
+    """
+    نماینده یک خوشه: بردار میانگین (وزن‌دار با تعداد اعضای خلاصه‌های قبلی)، متن
+    نزدیک‌ترین عضو به میانگین و متادیتای ادغام‌شده (شمارش حالات عاطفی و باورها)
+    """
+    weights = np.asarray([_weight(metadata) for metadata in metadatas], dtype=np.float32)
+    centroid = (vectors * weights[:, None]).sum(axis=0)
+    centroid /= max(float(np.linalg.norm(centroid)), 1e-12)
+    closest = int(np.argmax(vectors @ centroid))
+
+    emotions: Counter = Counter()
+    needs: Counter = Counter()
+    beliefs: Counter = Counter()
+    for metadata, weight in zip(metadatas, weights):
+        if "emotion_counts" in metadata:
+            emotions.update(json.loads(metadata["emotion_counts"]))
+        else:
+            emotions[metadata.get("emotional_state", "unknown")] += int(weight)
+        needs[metadata.get("cognitive_needs", "unknown")] += int(weight)
+        beliefs.update(json.loads(metadata.get("beliefs") or "[]"))
+
+    timestamps = sorted(ts for metadata in metadatas for ts in
+                        (metadata.get("first_timestamp"), metadata.get("timestamp")) if ts)
+    metadata = {
+        "user_id": user_id,
+        "timestamp": timestamps[-1] if timestamps else datetime.now().isoformat(),
+        "first_timestamp": timestamps[0] if timestamps else datetime.now().isoformat(),
+        "emotional_state": emotions.most_common(1)[0][0],
+        "emotion_counts": json.dumps(dict(emotions), ensure_ascii=False),
+        "beliefs": json.dumps([belief for belief, _ in beliefs.most_common(20)], ensure_ascii=False),
+        "cognitive_needs": needs.most_common(1)[0][0],
+        "text_sample": documents[closest][:100],
+        "merged_count": int(weights.sum()),
+        "summary": True
+    }
+    return {
+        # شناسه تازه: شناسه هیچ عضوی (از جمله خلاصه‌های قبلی) دوباره استفاده نمی‌شود
+        "id": f"{user_id}_summary_{uuid.uuid4().hex}",
+        "document": documents[closest],
+        "metadata": metadata,
+        "embedding": centroid
+    }
+
+
+def _directory_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _stores(memory, users: Optional[List[str]] = None) -> List[Tuple[RealityMemory, Optional[List[str]]]]:
+    """
+    حافظه‌های ChromaDB زیر یک حافظه (shardها، بدون لایه نوشتن با تأخیر) همراه با
+    کاربرانی که باید در هر کدام بررسی شوند (None یعنی همه کاربران آن حافظه)
+    """
+    if isinstance(memory, WriteBehindMemory):
+        memory.flush()
+        return _stores(memory.memory, users)
+    if isinstance(memory, ShardedRealityMemory):
+        if users is None:
+            return [pair for shard in memory.shards for pair in _stores(shard)]
+        # هر کاربر فقط در shard مسئول خودش بررسی می‌شود
+        owned: Dict[int, List[str]] = {}
+        for user_id in users:
+            owned.setdefault(shard_for(user_id, memory.num_shards), []).append(user_id)
+        return [pair for index in sorted(owned) for pair in _stores(memory.shards[index], owned[index])]
+    if isinstance(memory, RealityMemory):
+        return [(memory, users)]
+    logger.warning("⚠️ فشرده‌سازی برای %s پشتیبانی نمی‌شود.", type(memory).__name__)
+    return []
+
+
+def compact_user(store: RealityMemory,
+                 user_id: str,
+                 policy: RetentionPolicy,
+                 cutoff: float,
+                 dry_run: bool = False) -> Dict[str, int]:
+    """
+    خلاصه‌سازی واقعیت‌های قدیمی یک کاربر در یک مجموعه
+    """
+    report = {"scanned": 0, "removed": 0, "added": 0}
+    expired = store.timeline.expired(user_id, cutoff, policy.keep_recent)
+    for start in range(0, len(expired), policy.batch_size):
+        ids = [doc_id for _, doc_id in expired[start:start + policy.batch_size]]
+        with metrics.span("chroma_call_seconds", op="get"):
+            page = store.collection.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            continue
+        report["scanned"] += len(page["ids"])
+
+        vectors = np.asarray(page["embeddings"], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1.0)
+
+        for members in cluster_vectors(vectors, policy.cluster_distance):
+            if len(members) < policy.min_cluster_size:
+                continue
+            member_ids = [page["ids"][i] for i in members]
+            merged = merge_cluster(user_id,
+                                   member_ids,
+                                   [page["documents"][i] for i in members],
+                                   [page["metadatas"][i] for i in members],
+                                   vectors[members])
+            report["removed"] += len(members)
+            report["added"] += 1
+            if dry_run:
+                continue
+
+            # ابتدا نماینده نوشته می‌شود تا با قطع کار، داده‌ای از دست نرود
+            with metrics.span("chroma_call_seconds", op="add"):
+                store.collection.upsert(ids=[merged["id"]],
+                                        embeddings=[_as_list(merged["embedding"])],
+                                        documents=[merged["document"]],
+                                        metadatas=[merged["metadata"]])
+            store.timeline.add(user_id, timestamp_to_epoch(merged["metadata"]["timestamp"]), merged["id"])
+            with metrics.span("chroma_call_seconds", op="delete"):
+                store.collection.delete(ids=member_ids)
+            store.timeline.remove(member_ids)
+
+    if report["added"] and not dry_run and store.user_index is not None:
+        store.user_index.discard(user_id)
+    return report
+
+
+def vacuum_stores(stores: List[RealityMemory]):
+    """
+    فشرده‌سازی فایل‌های SQLite (ایندکس زمانی هر مجموعه و هر پایگاه ChromaDB یک بار) پس از حذف‌ها
+
+    VACUUM پایگاه ChromaDB از اتصال جداگانه انجام می‌شود و در تمام مدت قفل انحصاری
+    می‌گیرد؛ پیش از اجرا باید همه نویسنده‌ها (برنامه، سرویس حافظه و ...) متوقف شوند.
+    """
+    for store in stores:
+        store.timeline.vacuum()
+    for directory in sorted({store.persist_directory for store in stores}):
+        path = os.path.join(directory, "chroma.sqlite3")
+        if not os.path.exists(path):
+            continue
+        db = sqlite3.connect(path, timeout=60)
+        try:
+            db.execute("VACUUM")
+        finally:
+            db.close()
+
+
+def compact_memory(memory,
+                   policy: Optional[RetentionPolicy] = None,
+                   users: Optional[Iterable[str]] = None,
+                   vacuum: bool = True,
+                   dry_run: bool = False) -> Dict[str, Any]:
+    """
+    خلاصه‌سازی واقعیت‌های قدیمی همه کاربران (یا users) و فشرده‌سازی پایگاه
+
+    خروجی گزارش تعداد بردارها و بایت‌های آزادشده است. vacuum فقط وقتی امن است که
+    نویسنده دیگری روی پایگاه کار نکند (vacuum_stores).
+    """
+    policy = policy or RetentionPolicy()
+    started = time.perf_counter()
+    cutoff = policy.cutoff()
+    targets = _stores(memory, list(users) if users is not None else None)
+    stores = [store for store, _ in targets]
+    directories = sorted({store.persist_directory for store in stores})
+    bytes_before = sum(_directory_bytes(directory) for directory in directories)
+    vectors_before = sum(store.count() for store in stores)
+
+    totals = {"users": 0, "users_compacted": 0, "scanned": 0, "removed": 0, "added": 0}
+    for store, store_users in targets:
+        for user_id in (store_users if store_users is not None else store.timeline.users()):
+            result = compact_user(store, user_id, policy, cutoff, dry_run)
+            totals["users"] += 1
+            totals["users_compacted"] += bool(result["added"])
+            for key in ("scanned", "removed", "added"):
+                totals[key] += result[key]
+
+    if vacuum and not dry_run:
+        vacuum_stores(stores)
+
+    bytes_after = sum(_directory_bytes(directory) for directory in directories)
+    vectors_after = sum(store.count() for store in stores)
+    report = {
+        **totals,
+        "dry_run": dry_run,
+        "vectors_before": vectors_before,
+        "vectors_after": vectors_after,
+        "vectors_reclaimed": totals["removed"] - totals["added"],
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_reclaimed": bytes_before - bytes_after,
+        "seconds": time.perf_counter() - started
+    }
+    logger.info("🧹 فشرده‌سازی حافظه: %d بردار کمتر، %.1fMB آزاد شد.",
+                report["vectors_reclaimed"], report["bytes_reclaimed"] / (1024 * 1024), extra=report)
+    return report
+
+
+class MaintenanceScheduler:
+    """
+    اجرای دوره‌ای compact_memory در یک رشته پس‌زمینه
+
+    چون برنامه همزمان در پایگاه می‌نویسد، به طور پیش‌فرض VACUUM انجام نمی‌شود؛
+    فشرده‌سازی فایل‌ها با tools.compact_memory و پس از توقف برنامه انجام شود.
+    """
+    def __init__(self, memory, policy: RetentionPolicy, interval_hours: float = 24, vacuum: bool = False):
+        self.memory = memory
+        self.policy = policy
+        self.interval = interval_hours * 3600
+        self.vacuum = vacuum
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-maintenance", daemon=True)
+
+    def start(self) -> "MaintenanceScheduler":
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_report = compact_memory(self.memory, self.policy, vacuum=self.vacuum)
+            except Exception:
+                logger.exception("❌ نگه‌داری دوره‌ای حافظه ناموفق بود.")
+
+    def stop(self):
+        self._stop.set()
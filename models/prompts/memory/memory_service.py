@@ -0,0 +1,224 @@
+"""
+سرویس حافظه تک‌نویسنده: یک فرایند مالک ChromaDB و موتور مسیر است و بقیه
+فرایندها (کارگرها یا چند نمونه Streamlit) از طریق IPC محلی به آن وصل می‌شوند.
+
+اجرای مستقل:
+    python -m memory.memory_service
+"""
+import logging
+import multiprocessing
+import time
+from itertools import islice
+from multiprocessing.managers import BaseManager
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, Tuple, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+MEMORY_METHODS = (
+    "add_reality",
+    "add_realities_bulk",
+    "search_similar_realities",
+    "search_diverse_realities",
+    "get_user_history",
+    "get_user_history_page",
+    "count",
+)
+TRACKER_METHODS = (
+    "is_new_reality",
+    "observe",
+    "describe_trajectory",
+    "has_trajectory",
+)
+
+
+class _TrackerFacade:
+    """رابط ردیاب واقعیت در سمت سرویس"""
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def is_new_reality(self, current_analysis, similar_realities):
+        return self.tracker.is_new_reality(current_analysis, similar_realities)
+
+    def observe(self, user_id, embedding, current_analysis):
+        return self.tracker.observe(user_id, embedding, current_analysis)
+
+    def describe_trajectory(self, user_id):
+        return self.tracker.describe_trajectory(user_id)
+
+    def has_trajectory(self):
+        return self.tracker.trajectory is not None
+
+
+class _MemoryServer(BaseManager):
+    pass
+
+
+class _MemoryClient(BaseManager):
+    pass
+
+
+_MemoryClient.register("memory", exposed=MEMORY_METHODS)
+_MemoryClient.register("tracker", exposed=TRACKER_METHODS)
+
+
+def require_authkey(value: Optional[str]) -> bytes:
+    """
+    کلید احراز هویت سرویس حافظه
+
+    سرویس درخواست‌ها را unpickle می‌کند؛ با کلید قابل حدس هر فرایند محلی می‌تواند
+    کد دلخواه اجرا کند، پس بدون کلید (متغیر محیطی MEMORY_SERVICE_AUTHKEY) اجرا نمی‌شود.
+    """
+    if not value:
+        raise RuntimeError("متغیر محیطی MEMORY_SERVICE_AUTHKEY برای سرویس حافظه تنظیم نشده است")
+    return value.encode("utf-8")
+
+
+def serve_memory(address: Tuple[str, int], authkey: bytes):
+    """
+    اجرای سرویس حافظه در فرایند فعلی (تا پایان برنامه)
+    """
+    from pipeline import build_memory, build_tracker
+
+    memory = build_memory()
+    tracker = _TrackerFacade(build_tracker())
+    _MemoryServer.register("memory", callable=lambda: memory, exposed=MEMORY_METHODS)
+    _MemoryServer.register("tracker", callable=lambda: tracker, exposed=TRACKER_METHODS)
+
+    server = _MemoryServer(address=address, authkey=authkey).get_server()
+    logger.info("✅ سرویس حافظه روی %s:%d آماده است.", address[0], address[1])
+    server.serve_forever()
+
+
+def start_memory_service(address: Tuple[str, int],
+                         authkey: bytes,
+                         timeout: float = 60.0) -> multiprocessing.Process:
+    """
+    اجرای سرویس حافظه در یک فرایند جداگانه و انتظار تا آماده شدن آن
+    """
+    process = multiprocessing.get_context("fork").Process(
+        target=serve_memory, args=(address, authkey), name="memory-service", daemon=True
+    )
+    process.start()
+    _connect(address, authkey, timeout)
+    return process
+
+
+def _connect(address: Tuple[str, int], authkey: bytes, timeout: float) -> _MemoryClient:
+    deadline = time.monotonic() + timeout
+    while True:
+        client = _MemoryClient(address=address, authkey=authkey)
+        try:
+            client.connect()
+            return client
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class RemoteRealityMemory:
+    """
+    نماینده RealityMemory در فرایندهای کارگر؛ همه خواندن و نوشتن‌ها به سرویس حافظه می‌رود
+    """
+    def __init__(self, proxy):
+        self._proxy = proxy
+
+    def add_reality(self, user_id: str, text: str, embedding, analysis: Dict[str, Any]):
+        return self._proxy.add_reality(user_id, text, embedding, analysis)
+
+    def add_realities_bulk(self,
+                           records: Iterable[Dict[str, Any]],
+                           embedding_model=None,
+                           chunk_size: int = 256,
+                           on_progress: Optional[Callable[[int, float], None]] = None) -> Dict[str, Any]:
+        # بردارها در همین فرایند ساخته می‌شوند و فقط رکوردهای آماده فرستاده می‌شوند
+        started = time.perf_counter()
+        records = iter(records)
+        total = 0
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            missing = [r for r in chunk if r.get("embedding") is None]
+            if missing:
+                if embedding_model is None:
+                    raise ValueError("برای رکوردهای بدون بردار، embedding_model لازم است")
+                for record, vector in zip(missing, embedding_model.encode_batch([r["text"] for r in missing])):
+                    record["embedding"] = vector
+            self._proxy.add_realities_bulk(chunk, None, chunk_size, None)
+            total += len(chunk)
+            if on_progress is not None:
+                on_progress(total, time.perf_counter() - started)
+        elapsed = time.perf_counter() - started
+        return {"rows": total, "seconds": elapsed, "rows_per_sec": total / elapsed if elapsed > 0 else 0.0}
+
+    def search_similar_realities(self, query_embedding, user_id: Optional[str] = None,
+                                 n_results: int = 3) -> List[Dict]:
+        return self._proxy.search_similar_realities(query_embedding, user_id, n_results)
+
+    def search_diverse_realities(self, query_embedding, user_id: Optional[str] = None, n_results: int = 3,
+                                 candidate_multiplier: int = 4, mmr_lambda: float = 0.7,
+                                 dedup_distance: float = 0.05, max_distance: Optional[float] = None) -> List[Dict]:
+        # نامزدها و بردارهایشان در سرویس می‌مانند؛ فقط نتایج نهایی منتقل می‌شوند
+        return self._proxy.search_diverse_realities(query_embedding, user_id, n_results, candidate_multiplier,
+                                                    mmr_lambda, dedup_distance, max_distance)
+
+    def count(self) -> int:
+        return self._proxy.count()
+
+    def get_user_history(self, user_id: str, limit: int = 10) -> List[Dict]:
+        return self._proxy.get_user_history(user_id, limit)
+
+    def get_user_history_page(self, user_id: str, limit: int = 10, cursor: Optional[str] = None,
+                              order: str = "desc",
+                              include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        return self._proxy.get_user_history_page(user_id, limit, cursor, order, tuple(include))
+
+    def iter_user_history(self, user_id: str, page_size: int = 200,
+                          include: Sequence[str] = ("documents", "metadatas")) -> Iterator[Dict]:
+        # مولدها از IPC عبور نمی‌کنند؛ پیمایش صفحه به صفحه در همین فرایند انجام می‌شود
+        cursor = None
+        while True:
+            page = self.get_user_history_page(user_id, page_size, cursor, "asc", include)
+            yield from page["items"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+
+class RemoteRealityTracker:
+    """
+    نماینده RealityTracker؛ وضعیت مسیر کاربران فقط در سرویس حافظه نگه‌داری می‌شود
+    """
+    def __init__(self, proxy):
+        self._proxy = proxy
+        # TurnPipeline فقط None بودن این ویژگی را بررسی می‌کند
+        self.trajectory = True if proxy.has_trajectory() else None
+
+    def is_new_reality(self, current_analysis: Dict[str, Any], similar_realities: List[Dict]) -> bool:
+        return self._proxy.is_new_reality(current_analysis, similar_realities)
+
+    def observe(self, user_id: str, embedding, current_analysis: Dict[str, Any]) -> Dict[str, Any]:
+        return self._proxy.observe(user_id, embedding, current_analysis)
+
+    def describe_trajectory(self, user_id: str) -> str:
+        return self._proxy.describe_trajectory(user_id)
+
+
+def connect_memory_service(address: Tuple[str, int],
+                           authkey: bytes,
+                           timeout: float = 60.0) -> Tuple[RemoteRealityMemory, RemoteRealityTracker]:
+    """
+    اتصال به سرویس حافظه و برگرداندن نماینده‌های حافظه و ردیاب
+    """
+    client = _connect(address, authkey, timeout)
+    return RemoteRealityMemory(client.memory()), RemoteRealityTracker(client.tracker())
+
+
+if __name__ == "__main__":
+    from config import MEMORY_SERVICE_HOST, MEMORY_SERVICE_PORT, MEMORY_SERVICE_AUTHKEY, LOG_LEVEL, LOG_JSON
+    from utils.structured_logging import configure_logging
+
+    configure_logging(LOG_LEVEL, LOG_JSON)
+    serve_memory((MEMORY_SERVICE_HOST, MEMORY_SERVICE_PORT), require_authkey(MEMORY_SERVICE_AUTHKEY))
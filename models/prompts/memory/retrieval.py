@@ -0,0 +1,101 @@
+from typing import List, Dict, Optional
+
+import numpy as np
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def mmr_select(query: np.ndarray,
+               vectors: np.ndarray,
+               k: int,
+               mmr_lambda: float = 0.7,
+               dedup_distance: float = 0.05) -> List[int]:
+    """
+    انتخاب k بردار با maximal marginal relevance
+
+    امتیاز هر نامزد: lambda × شباهت به پرسش - (1 - lambda) × بیشترین شباهت به
+    انتخاب‌شده‌ها. نامزدی که فاصله کسینوسی‌اش با یک انتخاب‌شده کمتر از dedup_distance
+    باشد تکراری است و کنار گذاشته می‌شود. ورودی‌ها باید نرمال باشند.
+    """
+    count = len(vectors)
+    if count == 0 or k <= 0:
+        return []
+
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    redundancy = np.zeros(count, dtype=np.float32)
+    available = np.ones(count, dtype=bool)
+    selected: List[int] = []
+
+    while len(selected) < k and available.any():
+        scores = mmr_lambda * relevance - (1.0 - mmr_lambda) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        # تکراری‌های نزدیک به انتخاب جدید حذف می‌شوند
+        available &= similarity[best] < 1.0 - dedup_distance
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def diversify(query_embedding,
+              candidates: List[Dict],
+              n_results: int = 3,
+              mmr_lambda: float = 0.7,
+              dedup_distance: float = 0.05,
+              max_distance: Optional[float] = None) -> List[Dict]:
+    """
+    حذف تکراری‌ها و بازچینی MMR نامزدهای جستجو (هر نامزد کلید embedding دارد)
+
+    نامزدهای با فاصله بیشتر از max_distance پیش از بازچینی حذف می‌شوند. هر نتیجه
+    کلید duplicates دارد: تعداد نامزدهای تکراری که در آن ادغام شده‌اند. خروجی بدون
+    embedding است تا حجم انتقال کم بماند.
+    """
+    if max_distance is not None:
+        candidates = [c for c in candidates if c['distance'] is None or c['distance'] <= max_distance]
+    if not candidates:
+        return []
+
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    vectors = _normalize_rows(np.asarray([c['embedding'] for c in candidates], dtype=np.float32))
+
+    selected = mmr_select(query, vectors, n_results, mmr_lambda, dedup_distance)
+
+    # هر نامزد تکراری به نزدیک‌ترین نتیجه انتخاب‌شده نسبت داده می‌شود
+    duplicates = np.zeros(len(selected), dtype=np.int64)
+    if len(candidates) > len(selected):
+        similarity = vectors @ vectors[selected].T
+        nearest = similarity.argmax(axis=1)
+        is_duplicate = similarity[np.arange(len(candidates)), nearest] >= 1.0 - dedup_distance
+        is_duplicate[selected] = False
+        duplicates = np.bincount(nearest[is_duplicate], minlength=len(selected))
+
+    results = []
+    for position, index in enumerate(selected):
+        result = {key: value for key, value in candidates[index].items() if key != 'embedding'}
+        result['duplicates'] = int(duplicates[position])
+        results.append(result)
+    return results
+
+
+def search_diverse(memory,
+                   query_embedding,
+                   user_id: Optional[str] = None,
+                   n_results: int = 3,
+                   candidate_multiplier: int = 4,
+                   mmr_lambda: float = 0.7,
+                   dedup_distance: float = 0.05,
+                   max_distance: Optional[float] = None) -> List[Dict]:
+    """
+    جستجوی متنوع روی هر حافظه‌ای که search_similar_realities(..., include_embeddings=True) دارد
+    """
+    candidates = memory.search_similar_realities(query_embedding,
+                                                 user_id,
+                                                 n_results * max(1, candidate_multiplier),
+                                                 include_embeddings=True)
+    return diversify(query_embedding, candidates, n_results, mmr_lambda, dedup_distance, max_distance)
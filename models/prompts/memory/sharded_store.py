@@ -0,0 +1,248 @@
+import hashlib
+import logging
+import os
+import time
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, Sequence
+
+import chromadb
+from chromadb.config import Settings
+
+from memory.vector_store import RealityMemory
+from memory.compact_store import CompactRealityMemory
+from memory.retrieval import search_diverse
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(user_id: str, num_shards: int) -> int:
+    """
+    شماره shard یک کاربر (هش پایدار، مستقل از اجرای برنامه)
+    """
+    digest = hashlib.md5(user_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+class ShardedRealityMemory:
+    """
+    حافظه واقعیت‌ها تقسیم‌شده میان N مجموعه (یا N پوشه) بر اساس هش user_id
+
+    همه عملیات یک کاربر به یک shard می‌رود، پس هزینه هر جستجو به اندازه
+    همان shard بستگی دارد و با رشد تعداد کاربران ثابت می‌ماند.
+    """
+    def __init__(self,
+                 persist_directory: str,
+                 collection_name: str,
+                 num_shards: int = 8,
+                 separate_dirs: bool = False,
+                 use_user_index: bool = False,
+                 user_index_budget_mb: float = 256,
+                 storage: str = "chroma",
+                 vector_dtype: str = "float16",
+                 keep_exact: bool = True,
+                 rerank_factor: int = 4):
+        if num_shards < 1:
+            raise ValueError("num_shards باید حداقل ۱ باشد")
+
+        self.collection_name = collection_name
+        self.num_shards = num_shards
+        budget = user_index_budget_mb / num_shards
+
+        if storage == "compact":
+            # هر shard پوشه و فایل‌های بردار جداگانه خود را دارد
+            self.shards = [
+                CompactRealityMemory(persist_directory, self.shard_collection_name(collection_name, i),
+                                     vector_dtype, keep_exact, rerank_factor)
+                for i in range(num_shards)
+            ]
+        elif separate_dirs:
+            # هر shard پایگاه SQLite و ایندکس HNSW جداگانه دارد
+            self.shards = [
+                RealityMemory(os.path.join(persist_directory, f"shard_{i:03d}"), collection_name,
+                              use_user_index=use_user_index, user_index_budget_mb=budget)
+                for i in range(num_shards)
+            ]
+        else:
+            client = chromadb.PersistentClient(
+                path=persist_directory,
+                settings=Settings(anonymized_telemetry=False)
+            )
+            self.shards = [
+                RealityMemory(persist_directory, self.shard_collection_name(collection_name, i),
+                              use_user_index=use_user_index, user_index_budget_mb=budget,
+                              client=client)
+                for i in range(num_shards)
+            ]
+
+    @staticmethod
+    def shard_collection_name(collection_name: str, index: int) -> str:
+        return f"{collection_name}_s{index:03d}"
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards)
+
+    def shard(self, user_id: str) -> RealityMemory:
+        """
+        shard مسئول یک کاربر
+        """
+        return self.shards[shard_for(user_id, self.num_shards)]
+
+    def add_reality(self,
+                    user_id: str,
+                    text: str,
+                    embedding: List[float],
+                    analysis: Dict[str, Any]):
+        return self.shard(user_id).add_reality(user_id, text, embedding, analysis)
+
+    def add_realities_bulk(self,
+                           records: Iterable[Dict[str, Any]],
+                           embedding_model=None,
+                           chunk_size: int = 256,
+                           on_progress: Optional[Callable[[int, float], None]] = None) -> Dict[str, Any]:
+        """
+        ورود انبوه؛ رکوردها بر اساس shard گروه‌بندی و به صورت دسته‌ای نوشته می‌شوند
+        """
+        started = time.perf_counter()
+        buffers: List[List[Dict[str, Any]]] = [[] for _ in self.shards]
+        total = 0
+
+        def flush(index: int):
+            nonlocal total
+            if buffers[index]:
+                self.shards[index].add_realities_bulk(buffers[index], embedding_model, chunk_size,
+                                                      on_progress=lambda *_: None)
+                total += len(buffers[index])
+                buffers[index] = []
+                elapsed = time.perf_counter() - started
+                if on_progress is not None:
+                    on_progress(total, elapsed)
+                else:
+                    logger.info("📥 %d واقعیت وارد شد (%.0f ردیف در ثانیه)", total, total / elapsed)
+
+        for record in records:
+            index = shard_for(record["user_id"], self.num_shards)
+            buffers[index].append(record)
+            if len(buffers[index]) >= chunk_size:
+                flush(index)
+        for index in range(self.num_shards):
+            flush(index)
+
+        elapsed = time.perf_counter() - started
+        return {
+            "rows": total,
+            "seconds": elapsed,
+            "rows_per_sec": total / elapsed if elapsed > 0 else 0.0
+        }
+
+    def search_similar_realities(self,
+                                 query_embedding: List[float],
+                                 user_id: Optional[str] = None,
+                                 n_results: int = 3,
+                                 include_embeddings: bool = False) -> List[Dict]:
+        """
+        جستجو در shard کاربر؛ بدون user_id همه shardها جستجو و نتایج ادغام می‌شوند
+        """
+        if user_id:
+            return self.shard(user_id).search_similar_realities(query_embedding, user_id, n_results,
+                                                                include_embeddings=include_embeddings)
+
+        merged = []
+        for shard in self.shards:
+            if shard.count():
+                merged.extend(shard.search_similar_realities(query_embedding, None, n_results,
+                                                             include_embeddings=include_embeddings))
+        merged.sort(key=lambda r: r['distance'] if r['distance'] is not None else float("inf"))
+        return merged[:n_results]
+
+    def search_diverse_realities(self,
+                                 query_embedding,
+                                 user_id: Optional[str] = None,
+                                 n_results: int = 3,
+                                 candidate_multiplier: int = 4,
+                                 mmr_lambda: float = 0.7,
+                                 dedup_distance: float = 0.05,
+                                 max_distance: Optional[float] = None) -> List[Dict]:
+        """
+        جستجوی متنوع؛ نامزدهای همه shardها (یا shard کاربر) با هم بازچینی می‌شوند
+        """
+        return search_diverse(self, query_embedding, user_id, n_results, candidate_multiplier,
+                              mmr_lambda, dedup_distance, max_distance)
+
+    def get_user_history(self, user_id: str, limit: int = 10) -> List[Dict]:
+        return self.shard(user_id).get_user_history(user_id, limit)
+
+    def get_user_history_page(self,
+                              user_id: str,
+                              limit: int = 10,
+                              cursor: Optional[str] = None,
+                              order: str = "desc",
+                              include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        return self.shard(user_id).get_user_history_page(user_id, limit, cursor, order, include)
+
+    def iter_user_history(self,
+                          user_id: str,
+                          page_size: int = 200,
+                          include: Sequence[str] = ("documents", "metadatas")) -> Iterator[Dict]:
+        return self.shard(user_id).iter_user_history(user_id, page_size, include)
+
+
+def iter_collection(collection, page_size: int = 1000) -> Iterator[Dict[str, List]]:
+    """
+    خواندن صفحه به صفحه همه رکوردهای یک مجموعه ChromaDB
+    """
+    offset = 0
+    while True:
+        page = collection.get(
+            offset=offset,
+            limit=page_size,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if not page["ids"]:
+            break
+        yield page
+        offset += len(page["ids"])
+
+
+def migrate_to_shards(source_collections: List,
+                      target: ShardedRealityMemory,
+                      page_size: int = 1000,
+                      on_progress: Optional[Callable[[int, float], None]] = None) -> Dict[str, Any]:
+    """
+    انتقال رکوردها (با همان شناسه‌ها و metadata) از مجموعه‌های مبدأ به shardهای مقصد
+
+    از add_realities_bulk هر shard استفاده می‌شود تا برای shardهای Chroma و فشرده یکسان کار کند؛
+    رکوردهای دارای شناسه تکراری نمی‌سازند، پس اجرای دوباره پس از قطع شدن امن است.
+    مقصد باید نام مجموعه‌ای متفاوت از مبدأ داشته باشد.
+    """
+    started = time.perf_counter()
+    total = 0
+    for collection in source_collections:
+        for page in iter_collection(collection, page_size):
+            groups: Dict[int, List[Dict[str, Any]]] = {}
+            for doc_id, embedding, document, metadata in zip(page["ids"], page["embeddings"],
+                                                             page["documents"], page["metadatas"]):
+                groups.setdefault(shard_for(metadata["user_id"], target.num_shards), []).append({
+                    "id": doc_id,
+                    "user_id": metadata["user_id"],
+                    "text": document,
+                    "embedding": embedding,
+                    "metadata": metadata
+                })
+
+            for index, records in groups.items():
+                target.shards[index].add_realities_bulk(records, chunk_size=page_size,
+                                                        on_progress=lambda *_: None)
+
+            total += len(page["ids"])
+            elapsed = time.perf_counter() - started
+            if on_progress is not None:
+                on_progress(total, elapsed)
+            else:
+                logger.info("🔀 %d رکورد منتقل شد (%.0f ردیف در ثانیه)", total, total / elapsed)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": total,
+        "seconds": elapsed,
+        "rows_per_sec": total / elapsed if elapsed > 0 else 0.0,
+        "per_shard": [shard.count() for shard in target.shards]
+    }
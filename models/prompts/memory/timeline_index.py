@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple, Iterable
+
+
+def timestamp_to_epoch(timestamp: Optional[str]) -> float:
+    """تبدیل زمان ISO ذخیره‌شده در متادیتا به ثانیه"""
+    if not timestamp:
+        return datetime.now().timestamp()
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return datetime.now().timestamp()
+
+
+def encode_cursor(ts: float, doc_id: str) -> str:
+    return f"{ts!r}|{doc_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    ts, doc_id = cursor.split("|", 1)
+    return float(ts), doc_id
+
+
+class TimelineIndex:
+    """
+    ایندکس ثانویه زمانی (user_id, زمان، شناسه) در SQLite
+
+    ChromaDB ترتیب زمانی ندارد؛ این ایندکس صفحه‌بندی با cursor را بدون
+    وابستگی به اندازه کل مجموعه ممکن می‌کند. هر doc_id فقط یک ردیف دارد؛ نوشتن دوباره
+    یک شناسه با زمان جدید، ردیف قبلی را جایگزین می‌کند.
+    """
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS timeline ("
+            " user_id TEXT NOT NULL, ts REAL NOT NULL, doc_id TEXT NOT NULL,"
+            " PRIMARY KEY (user_id, ts, doc_id)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS timeline_doc ON timeline (doc_id)")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < 1:
+            # نسخه‌های قبلی برای شناسه‌ای که با زمان جدید دوباره نوشته می‌شد ردیف دوم می‌ساختند
+            with self._db:
+                self._db.execute(
+                    "DELETE FROM timeline WHERE EXISTS (SELECT 1 FROM timeline AS newer"
+                    " WHERE newer.doc_id = timeline.doc_id"
+                    " AND (newer.ts, newer.user_id) > (timeline.ts, timeline.user_id))"
+                )
+                self._db.execute("PRAGMA user_version = 1")
+
+    def add(self, user_id: str, ts: float, doc_id: str):
+        self.add_many([(user_id, ts, doc_id)])
+
+    def add_many(self, rows: Iterable[Tuple[str, float, str]]):
+        # کلید اصلی (user_id, ts, doc_id) است؛ ردیف قبلی شناسه با زمان دیگر باید جداگانه حذف شود
+        rows = list({doc_id: (user_id, ts, doc_id) for user_id, ts, doc_id in rows}.values())
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM timeline WHERE doc_id = ?", [(row[2],) for row in rows])
+            self._db.executemany("INSERT INTO timeline (user_id, ts, doc_id) VALUES (?, ?, ?)", rows)
+
+    def remove(self, doc_ids: List[str]):
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM timeline WHERE doc_id = ?", [(d,) for d in doc_ids])
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM timeline LIMIT 1").fetchone() is None
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM timeline WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+
+    def page(self,
+             user_id: str,
+             limit: int,
+             cursor: Optional[str] = None,
+             descending: bool = True) -> Tuple[List[Tuple[float, str]], Optional[str]]:
+        """
+        یک صفحه از (زمان، شناسه)‌های کاربر و cursor صفحه بعد
+        """
+        clauses = ["user_id = ?"]
+        params: list = [user_id]
+        if cursor:
+            ts, doc_id = decode_cursor(cursor)
+            clauses.append("(ts, doc_id) < (?, ?)" if descending else "(ts, doc_id) > (?, ?)")
+            params += [ts, doc_id]
+        direction = "DESC" if descending else "ASC"
+        sql = (f"SELECT ts, doc_id FROM timeline WHERE {' AND '.join(clauses)} "
+               f"ORDER BY ts {direction}, doc_id {direction} LIMIT ?")
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(*rows[-1])
+        return rows, next_cursor
+
+    def users(self) -> List[str]:
+        with self._lock:
+            return [user_id for (user_id,) in self._db.execute("SELECT DISTINCT user_id FROM timeline")]
+
+    def expired(self, user_id: str, before_ts: float, keep_recent: int = 0) -> List[Tuple[float, str]]:
+        """
+        (زمان، شناسه)‌های قدیمی‌تر از before_ts به ترتیب زمان، به جز keep_recent ردیف آخر کاربر
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT ts, doc_id FROM timeline WHERE user_id = ? AND ts < ? AND doc_id NOT IN ("
+                " SELECT doc_id FROM timeline WHERE user_id = ? ORDER BY ts DESC, doc_id DESC LIMIT ?)"
+                " ORDER BY ts, doc_id",
+                (user_id, before_ts, user_id, keep_recent)
+            ).fetchall()
+
+    def vacuum(self):
+        with self._lock:
+            self._db.execute("VACUUM")
+            # در حالت WAL، VACUUM در لاگ نوشته می‌شود؛ بدون checkpoint فضایی آزاد نمی‌شود
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def rebuild(self, collection, page_size: int = 1000) -> int:
+        """
+        ساخت دوباره ایندکس از روی متادیتای مجموعه ChromaDB
+        """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM timeline")
+        offset = 0
+        while True:
+            page = collection.get(offset=offset, limit=page_size, include=["metadatas"])
+            if not page["ids"]:
+                break
+            self.add_many(
+                (metadata.get("user_id", ""), timestamp_to_epoch(metadata.get("timestamp")), doc_id)
+                for doc_id, metadata in zip(page["ids"], page["metadatas"])
+            )
+            offset += len(page["ids"])
+        return offset
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,212 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Set
+
+import numpy as np
+
+
+# برآورد تقریبی حافظه متادیتای هر ردیف (بایت)
+_METADATA_OVERHEAD = 512
+
+
+class _UserVectors:
+    """
+    بردارهای نرمال‌شده یک کاربر در یک ماتریس float32 پیوسته
+
+    کاربر بدون ردیف هم با dim=0 نگه‌داری می‌شود؛ بعد ماتریس با اولین بردار تعیین می‌شود.
+    """
+    __slots__ = ("ids", "id_set", "texts", "metadatas", "matrix", "size", "text_bytes")
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.ids: List[str] = []
+        self.id_set: Set[str] = set()
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.matrix = np.empty((max(capacity, 1), dim), dtype=np.float32)
+        self.size = 0
+        self.text_bytes = 0
+
+    def append(self, doc_id: str, text: str, vector: np.ndarray, metadata: Dict[str, Any]) -> bool:
+        """افزودن یک ردیف؛ ردیف تکراری (مثلاً از تکرار یک دسته ناقص) نادیده گرفته می‌شود"""
+        if doc_id in self.id_set:
+            return False
+        if self.size == 0 and self.matrix.shape[1] != vector.shape[0]:
+            self.matrix = np.empty((self.matrix.shape[0], vector.shape[0]), dtype=np.float32)
+        if self.size == self.matrix.shape[0]:
+            grown = np.empty((self.matrix.shape[0] * 2, self.matrix.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+        self.matrix[self.size] = vector
+        self.ids.append(doc_id)
+        self.id_set.add(doc_id)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+        self.text_bytes += sys.getsizeof(text)
+        self.size += 1
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        # یک سهم ثابت هم برای خود کاربر، تا کاربران بدون ردیف هم در بودجه شمرده شوند
+        return self.matrix.nbytes + self.text_bytes + _METADATA_OVERHEAD * (self.size + 1)
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class UserVectorIndex:
+    """
+    ایندکس درون‌حافظه‌ای بردارهای هر کاربر برای جستجوی دقیق بدون ChromaDB
+
+    بردارهای هر کاربر در اولین دسترسی از ChromaDB بارگذاری می‌شوند، با هر
+    add_reality به‌روز می‌شوند و در صورت عبور از بودجه حافظه به ترتیب LRU حذف می‌شوند.
+    جستجو با یک ضرب ماتریسی انجام می‌شود و فاصله همان فاصله کسینوسی ChromaDB است.
+    """
+    def __init__(self, collection, memory_budget_mb: float = 256):
+        self.collection = collection
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._users: "OrderedDict[str, _UserVectors]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        # کاربرانی که در حین بارگذاری داده جدید گرفته‌اند
+        self._dirty: Set[str] = set()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def _load(self, user_id: str) -> _UserVectors:
+        """بارگذاری همه بردارهای یک کاربر از ChromaDB (کاربر جدید: ایندکس خالی)"""
+        results = self.collection.get(
+            where={"user_id": user_id},
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if not results["ids"]:
+            # ایندکس خالی هم نگه‌داری می‌شود تا جستجوهای بعدی کاربر جدید به ChromaDB نروند
+            return _UserVectors(0)
+
+        matrix = np.asarray(results["embeddings"], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1.0)
+
+        entry = _UserVectors(matrix.shape[1], capacity=len(results["ids"]) * 2)
+        for doc_id, text, vector, metadata in zip(results["ids"], results["documents"],
+                                                  matrix, results["metadatas"]):
+            entry.append(doc_id, text, vector, metadata)
+        return entry
+
+    def _get(self, user_id: str) -> _UserVectors:
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return entry
+            loading = self._loading.setdefault(user_id, threading.Lock())
+
+        with loading:
+            with self._lock:
+                entry = self._users.get(user_id)
+                if entry is not None:
+                    return entry
+
+            entry = self._load(user_id)
+
+            with self._lock:
+                self._loading.pop(user_id, None)
+                self.loads += 1
+                if user_id in self._dirty:
+                    # داده جدیدی در حین بارگذاری رسیده؛ دفعه بعد دوباره بارگذاری می‌شود
+                    self._dirty.discard(user_id)
+                else:
+                    self._users[user_id] = entry
+                    self._bytes += entry.nbytes
+                    self._evict(keep=user_id)
+        return entry
+
+    def _evict(self, keep: Optional[str] = None):
+        """حذف LRU کاربران تا رسیدن به بودجه حافظه"""
+        while self._bytes > self.memory_budget and len(self._users) > 1:
+            user_id, entry = next(iter(self._users.items()))
+            if user_id == keep:
+                self._users.move_to_end(user_id)
+                user_id, entry = next(iter(self._users.items()))
+            del self._users[user_id]
+            self._bytes -= entry.nbytes
+            self.evictions += 1
+
+    def add(self, user_id: str, doc_id: str, text: str, embedding, metadata: Dict[str, Any]):
+        """
+        افزودن یک بردار جدید؛ فقط برای کاربرانی که در حافظه هستند
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                before = entry.nbytes
+                entry.append(doc_id, text, _normalize(embedding), metadata)
+                self._bytes += entry.nbytes - before
+                self._evict(keep=user_id)
+            elif user_id in self._loading:
+                self._dirty.add(user_id)
+
+    def discard(self, user_id: str):
+        """
+        حذف یک کاربر از حافظه (مثلاً پس از حذف یا ادغام داده‌هایش)
+        """
+        with self._lock:
+            entry = self._users.pop(user_id, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+            elif user_id in self._loading:
+                self._dirty.add(user_id)
+
+    def search(self, user_id: str, query_embedding, n_results: int = 3,
+               include_embeddings: bool = False) -> List[Dict]:
+        """
+        جستجوی دقیق top-k میان بردارهای یک کاربر
+        """
+        entry = self._get(user_id)
+        if n_results <= 0:
+            return []
+
+        with self._lock:
+            size = entry.size
+            if size == 0:
+                return []
+            matrix = entry.matrix[:size]
+            ids, texts, metadatas = entry.ids, entry.texts, entry.metadatas
+
+        scores = matrix @ _normalize(query_embedding)
+        k = min(n_results, size)
+        if k < size:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+
+        results = [{
+            'id': ids[i],
+            'text': texts[i],
+            'metadata': metadatas[i],
+            'distance': float(1.0 - scores[i])
+        } for i in top]
+        if include_embeddings:
+            for result, i in zip(results, top):
+                result['embedding'] = matrix[i]
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "bytes": self._bytes,
+                "budget_bytes": self.memory_budget,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions
+            }
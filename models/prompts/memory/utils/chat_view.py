@@ -0,0 +1,73 @@
+from collections import Counter
+from typing import List, Dict, Any
+
+
+# رنگ پس‌زمینه و برچسب هر نقش در گفتگو
+_MESSAGE_STYLES = {
+    "user": ("#e3f2fd", "شما"),
+    "assistant": ("#f3e5f5", "دستیار"),
+}
+
+
+def message_html(role: str, content: str) -> str:
+    """
+    HTML یک پیام گفتگو
+    """
+    background, label = _MESSAGE_STYLES.get(role, _MESSAGE_STYLES["assistant"])
+    return f"""
+    <div style="background-color: {background}; padding: 0.5rem 1rem; border-radius: 15px; margin-bottom: 0.5rem; text-align: right;">
+        <b>{label}:</b> {content}
+    </div>
+    """
+
+
+def make_message(role: str, content: str) -> Dict[str, Any]:
+    """
+    پیام تاریخچه همراه با HTML ساخته‌شده (فقط یک بار ساخته می‌شود)
+    """
+    return {"role": role, "content": content, "html": message_html(role, content)}
+
+
+def cached_html(message: Dict[str, Any]) -> str:
+    """
+    HTML ذخیره‌شده پیام؛ برای پیام‌های قدیمی بدون HTML، یک بار ساخته و نگه‌داری می‌شود
+    """
+    html = message.get("html")
+    if html is None:
+        html = message["html"] = message_html(message["role"], message["content"])
+    return html
+
+
+def window_start(total: int, window_size: int, pages: int) -> int:
+    """
+    اندیس اولین پیام قابل نمایش وقتی فقط window_size × (pages + 1) پیام آخر نشان داده می‌شود
+    """
+    return max(0, total - window_size * (pages + 1))
+
+
+def render_window(history: List[Dict[str, Any]], start: int) -> str:
+    """
+    HTML پیام‌های پنجره قابل نمایش در یک بلوک
+    """
+    return "".join(cached_html(message) for message in history[start:])
+
+
+class EmotionCounter:
+    """
+    شمارش تدریجی حالات عاطفی جلسه؛ version با هر تغییر زیاد می‌شود
+    تا نمودار فقط در صورت تغییر دوباره ساخته شود
+    """
+    def __init__(self, emotions=()):
+        self.counts = Counter(emotions)
+        self.version = 0
+
+    def add(self, emotion: str):
+        self.counts[emotion] += 1
+        self.version += 1
+
+    def reset(self):
+        self.counts.clear()
+        self.version += 1
+
+    def __bool__(self) -> bool:
+        return bool(self.counts)
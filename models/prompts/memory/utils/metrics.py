@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Tuple, Callable
+
+
+class _NoopSpan:
+    """span خالی وقتی اندازه‌گیری غیرفعال است (بدون هیچ کار اضافه)"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("registry", "key", "started")
+
+    def __init__(self, registry: "MetricsRegistry", key: Tuple):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry._observe(self.key, time.perf_counter() - self.started)
+        return False
+
+
+class _Summary:
+    """تعداد، مجموع و پنجره آخرین مقدارها برای محاسبه صدک‌ها"""
+    __slots__ = ("count", "total", "window")
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total = 0.0
+        self.window = deque(maxlen=window)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class MetricsRegistry:
+    """
+    جمع‌آوری زمان مراحل (ثانیه) در حافظه فرایند
+
+    هر معیار با نام و برچسب‌ها مشخص می‌شود، مثلاً
+    turn_stage_seconds{stage="search"}. صدک‌ها از پنجره آخرین window مقدار
+    محاسبه می‌شوند. وقتی enabled خاموش است، span یک شیء ثابت و بی‌اثر برمی‌گرداند.
+    """
+    def __init__(self, enabled: bool = False, window: int = 2048):
+        self.enabled = enabled
+        self.window = window
+        self._summaries: Dict[Tuple, _Summary] = {}
+        self._gauges: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, window: int = None):
+        self.enabled = enabled
+        if window:
+            self.window = window
+
+    def span(self, name: str, **labels):
+        """
+        اندازه‌گیری زمان یک بلوک: with metrics.span("turn_stage_seconds", stage="search"): ...
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, (name, tuple(sorted(labels.items()))))
+
+    def wrap(self, name: str, func: Callable, **labels) -> Callable:
+        """
+        نسخه زمان‌دار یک تابع (برای ارسال به executor)؛ در حالت غیرفعال خود تابع
+        """
+        if not self.enabled:
+            return func
+        key = (name, tuple(sorted(labels.items())))
+
+        def timed(*args, **kwargs):
+            with _Span(self, key):
+                return func(*args, **kwargs)
+        return timed
+
+    def observe(self, name: str, seconds: float, **labels):
+        if self.enabled:
+            self._observe((name, tuple(sorted(labels.items()))), seconds)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """
+        مقدار لحظه‌ای (مثلاً حجم حافظه جلسه‌ها)؛ هر بار جایگزین مقدار قبلی می‌شود
+        """
+        if self.enabled:
+            with self._lock:
+                self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def gauges(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = sorted(self._gauges.items())
+        return [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in items]
+
+    def _observe(self, key: Tuple, seconds: float):
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = _Summary(self.window)
+            summary.count += 1
+            summary.total += seconds
+            summary.window.append(seconds)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        وضعیت فعلی همه معیارها با صدک‌های ۵۰، ۹۵ و ۹۹ (ثانیه)
+        """
+        with self._lock:
+            items = [(key, summary.count, summary.total, sorted(summary.window))
+                     for key, summary in self._summaries.items()]
+        snapshot = []
+        for (name, labels), count, total, window in sorted(items):
+            entry = {"name": name, "labels": dict(labels), "count": count, "sum": total}
+            if window:
+                entry.update(p50=_percentile(window, 0.50),
+                             p95=_percentile(window, 0.95),
+                             p99=_percentile(window, 0.99))
+            snapshot.append(entry)
+        return snapshot
+
+    def render_prometheus(self) -> str:
+        """
+        خروجی متنی قالب Prometheus (نوع summary)
+        """
+        lines = []
+        declared = set()
+        for entry in self.snapshot():
+            name = entry["name"]
+            if name not in declared:
+                lines.append(f"# TYPE {name} summary")
+                declared.add(name)
+            labels = [f'{key}="{value}"' for key, value in entry["labels"].items()]
+            for quantile in ("p50", "p95", "p99"):
+                if quantile in entry:
+                    q_labels = ",".join(labels + [f'quantile="0.{quantile[1:]}"'])
+                    lines.append(f"{name}{{{q_labels}}} {entry[quantile]:.6f}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {entry['sum']:.6f}")
+            lines.append(f"{name}_count{suffix} {entry['count']}")
+        for entry in self.gauges():
+            name = entry["name"]
+            if name not in declared:
+                lines.append(f"# TYPE {name} gauge")
+                declared.add(name)
+            labels = ",".join(f'{key}="{value}"' for key, value in entry["labels"].items())
+            lines.append(f"{name}{{{labels}}} {entry['value']}" if labels else f"{name} {entry['value']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._summaries.clear()
+            self._gauges.clear()
+
+
+# معیارهای مشترک همه اجزای فرایند
+metrics = MetricsRegistry()
+
+
+def start_metrics_server(port: int,
+                         registry: MetricsRegistry = metrics,
+                         host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    سرور HTTP پس‌زمینه برای خواندن معیارها در مسیر /metrics
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -1,11 +1,17 @@
+import logging
 from typing import Dict, Any, List, Optional
 
+from utils.trajectory import TrajectoryEngine
+
+logger = logging.getLogger(__name__)
+
 class RealityTracker:
     """
     تشخیص تغییر واقعیت و مدیریت سفر شناختی کاربر
     """
-    def __init__(self, similarity_threshold: float = 0.6):
+    def __init__(self, similarity_threshold: float = 0.6, trajectory: Optional[TrajectoryEngine] = None):
         self.threshold = similarity_threshold
+        self.trajectory = trajectory
     
     def is_new_reality(self, 
                        current_analysis: Dict[str, Any], 
@@ -15,7 +21,7 @@ class RealityTracker:
         """
         # اگر هیچ واقعیت مشابهی نباشد، قطعاً جدید است
         if not similar_realities:
-            print("🔍 واقعیت جدید تشخیص داده شد (بدون سابقه)")
+            logger.debug("🔍 واقعیت جدید تشخیص داده شد (بدون سابقه)")
             return True
         
         # بررسی فاصله (distance) نزدیکترین واقعیت
@@ -24,12 +30,53 @@ class RealityTracker:
         # در ChromaDB، distance کمتر به معنای شباهت بیشتر است
         # برای cosine similarity، distance=0 یعنی کاملاً مشابه
         if closest_distance > (1 - self.threshold):
-            print(f"🔍 واقعیت جدید تشخیص داده شد (فاصله: {closest_distance})")
+            logger.debug("🔍 واقعیت جدید تشخیص داده شد", extra={"distance": closest_distance})
             return True
         else:
-            print(f"🔍 ادامه واقعیت قبلی (فاصله: {closest_distance})")
+            logger.debug("🔍 ادامه واقعیت قبلی", extra={"distance": closest_distance})
             return False
     
+    def observe(self,
+                user_id: str,
+                embedding: List[float],
+                current_analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        ثبت یک نوبت در موتور مسیر و تشخیص واقعیت جدید بدون مراجعه به پایگاه برداری
+        """
+        # خواندن نوبت قبلی و به‌روزرسانی با هم زیر قفل کاربر انجام می‌شوند
+        observation = self.trajectory.update(
+            user_id, embedding, current_analysis,
+            describe=lambda previous: self.get_reality_shift_description(current_analysis, previous)
+        )
+        
+        if observation["is_new_reality"]:
+            logger.debug("🔍 واقعیت جدید تشخیص داده شد",
+                         extra={"user_id": user_id, "centroid_distance": observation['distance']})
+        else:
+            logger.debug("🔍 ادامه واقعیت قبلی",
+                         extra={"user_id": user_id, "centroid_distance": observation['distance']})
+        return observation
+    
+    def describe_trajectory(self, user_id: str) -> str:
+        """
+        توصیف کلی اینکه واقعیت کاربر در طول زمان چگونه تغییر کرده است
+        """
+        if self.trajectory is None:
+            return ""
+        
+        summary = self.trajectory.summary(user_id)
+        if not summary["turns"]:
+            return "هنوز تعاملی ثبت نشده است"
+        
+        parts = [f"{summary['turns']} نوبت در {summary['segments']} بخش واقعیت"]
+        if summary["dominant_emotions"]:
+            parts.append("حالات غالب: " + ", ".join(f"{e} ({n})" for e, n in summary["dominant_emotions"]))
+        if summary["dominant_beliefs"]:
+            parts.append("باورهای غالب: " + ", ".join(f"{b} ({n})" for b, n in summary["dominant_beliefs"]))
+        for shift in summary["recent_shifts"]:
+            parts.append(f"نوبت {shift['turn']}: {shift['description']}")
+        return " | ".join(parts)
+    
     def get_reality_shift_description(self, 
                                       current: Dict[str, Any], 
                                       previous: Optional[Dict[str, Any]]) -> str:
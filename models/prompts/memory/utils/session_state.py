@@ -0,0 +1,284 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from typing import List, Dict, Any, Optional, Callable, Iterator
+
+from utils.metrics import metrics
+
+
+def estimate_bytes(item: Dict[str, Any]) -> int:
+    """برآورد تقریبی حافظه یک پیام یا ردیف تاریخچه (دیکشنری با مقدارهای ساده)"""
+    return sys.getsizeof(item) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in item.items())
+
+
+class SessionSpillStore:
+    """
+    لاگ فشرده SQLite برای بخش قدیمی تاریخچه جلسه‌ها
+
+    هر ردیف با (کلید جلسه، نوع تاریخچه، شماره ترتیب) ذخیره می‌شود تا هر بازه
+    از تاریخچه با یک پرس‌وجوی بازه‌ای بازخوانی شود.
+    """
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS spilled ("
+            " session TEXT NOT NULL, kind TEXT NOT NULL, seq INTEGER NOT NULL, payload TEXT NOT NULL,"
+            " PRIMARY KEY (session, kind, seq)) WITHOUT ROWID"
+        )
+
+    def append(self, session: str, kind: str, start: int, items: List[Dict[str, Any]]):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO spilled (session, kind, seq, payload) VALUES (?, ?, ?, ?)",
+                [(session, kind, start + i, json.dumps(item, ensure_ascii=False)) for i, item in enumerate(items)]
+            )
+
+    def load(self, session: str, kind: str, start: int, end: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT payload FROM spilled WHERE session = ? AND kind = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (session, kind, start, end)
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def truncate(self, session: str, kind: str, start: int = 0):
+        """حذف ردیف‌های از start به بعد (برای بازگرداندن به حافظه یا پاک کردن تاریخچه)"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM spilled WHERE session = ? AND kind = ? AND seq >= ?",
+                             (session, kind, start))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM spilled")
+
+
+class BoundedHistory:
+    """
+    تاریخچه جلسه با پنجره محدود در حافظه
+
+    مثل یک لیست رفتار می‌کند (append، len، اندیس و برش)، اما فقط آخرین ردیف‌ها در
+    حافظه می‌مانند: وقتی تعداد ردیف‌های مقیم از max_resident بیشتر شود، قدیمی‌ترها تا
+    keep_resident ردیف در SessionSpillStore نوشته می‌شوند و هنگام خواندن از همان‌جا
+    بازخوانی می‌شوند. کلید html (قابل بازسازی) ذخیره نمی‌شود.
+    """
+    def __init__(self,
+                 store: SessionSpillStore,
+                 session: str,
+                 kind: str,
+                 max_resident: int = 60,
+                 keep_resident: int = 30,
+                 on_change: Optional[Callable[["BoundedHistory"], None]] = None):
+        self.store = store
+        self.session = session
+        self.kind = kind
+        self.max_resident = max(1, max_resident)
+        self.keep_resident = max(0, min(keep_resident, self.max_resident))
+        self.on_change = on_change
+        self._items: List[Dict[str, Any]] = []
+        self._offset = 0  # تعداد ردیف‌های منتقل‌شده به دیسک
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._offset + len(self._items)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @property
+    def resident_count(self) -> int:
+        return len(self._items)
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._bytes
+
+    def append(self, item: Dict[str, Any]):
+        with self._lock:
+            self._items.append(item)
+            self._bytes += estimate_bytes(item)
+            if len(self._items) > self.max_resident:
+                self.spill(self.keep_resident)
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def spill(self, keep: int = 0) -> int:
+        """
+        انتقال ردیف‌های قدیمی به دیسک تا فقط keep ردیف آخر در حافظه بماند
+        """
+        with self._lock:
+            count = len(self._items) - max(0, keep)
+            if count <= 0:
+                return 0
+            moved = self._items[:count]
+            self.store.append(self.session, self.kind, self._offset,
+                              [{key: value for key, value in item.items() if key != "html"} for item in moved])
+            del self._items[:count]
+            self._offset += count
+            self._bytes -= sum(estimate_bytes(item) for item in moved)
+            return count
+
+    def rehydrate(self, count: int) -> int:
+        """
+        بازگرداندن ردیف‌های آخر منتقل‌شده به حافظه تا دست‌کم count ردیف مقیم باشد
+        """
+        with self._lock:
+            missing = min(self._offset, count - len(self._items))
+            if missing <= 0:
+                return 0
+            start = self._offset - missing
+            restored = self.store.load(self.session, self.kind, start, self._offset)
+            self.store.truncate(self.session, self.kind, start)
+            self._items[:0] = restored
+            self._offset = start
+            self._bytes += sum(estimate_bytes(item) for item in restored)
+            return missing
+
+    def _read(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            result = []
+            if start < self._offset:
+                result.extend(self.store.load(self.session, self.kind, start, min(stop, self._offset)))
+            if stop > self._offset:
+                result.extend(self._items[max(0, start - self._offset):stop - self._offset])
+            return result
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            items = self._read(start, stop) if start < stop else []
+            return items[::step] if step != 1 else items
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("اندیس خارج از تاریخچه")
+        return self._read(index, index + 1)[0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self[:])
+
+    def clear(self):
+        with self._lock:
+            self.store.truncate(self.session, self.kind)
+            self._items = []
+            self._offset = 0
+            self._bytes = 0
+        if self.on_change is not None:
+            self.on_change(self)
+
+
+class SessionStateManager:
+    """
+    مدیر تاریخچه همه جلسه‌های یک سرور با بودجه حافظه مشترک
+
+    هر جلسه تاریخچه‌های BoundedHistory خود را از این مدیر می‌گیرد. وقتی مجموع
+    حافظه مقیم از بودجه بیشتر شود، تاریخچه جلسه‌هایی که مدت بیشتری بی‌استفاده
+    بوده‌اند کامل به دیسک منتقل می‌شوند و با بازگشت کاربر (touch) پنجره آخر دوباره
+    بارگذاری می‌شود. مدیر فقط ارجاع ضعیف نگه می‌دارد؛ با پایان جلسه Streamlit،
+    تاریخچه و ردیف‌های دیسکی آن پاک می‌شوند.
+    """
+    def __init__(self,
+                 spill_path: str,
+                 memory_budget_mb: float = 64,
+                 window: int = 30,
+                 max_resident: int = 60):
+        self.store = SessionSpillStore(spill_path)
+        # ردیف‌های جلسه‌های قبلی سرور دیگر در دسترس نیستند
+        self.store.clear()
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.window = window
+        self.max_resident = max(max_resident, window)
+        self._histories: Dict[str, "weakref.WeakValueDictionary[str, BoundedHistory]"] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.spilled_sessions = 0
+
+    def history(self, session: str, kind: str) -> BoundedHistory:
+        """
+        تاریخچه (مثلاً chat یا reality) یک جلسه
+        """
+        with self._lock:
+            histories = self._histories.get(session)
+            if histories is None:
+                histories = self._histories[session] = weakref.WeakValueDictionary()
+                self._last_seen[session] = time.monotonic()
+            history = histories.get(kind)
+            if history is None:
+                history = BoundedHistory(self.store, session, kind, self.max_resident, self.window,
+                                         on_change=lambda _: self.enforce_budget())
+                histories[kind] = history
+                weakref.finalize(history, self._forget, session, kind)
+        return history
+
+    def _forget(self, session: str, kind: str):
+        self.store.truncate(session, kind)
+        with self._lock:
+            histories = self._histories.get(session)
+            if histories is not None:
+                histories.pop(kind, None)
+            if histories is not None and not histories:
+                del self._histories[session]
+                self._last_seen.pop(session, None)
+
+    def _session_histories(self, session: str) -> List[BoundedHistory]:
+        histories = self._histories.get(session)
+        return list(histories.values()) if histories is not None else []
+
+    def touch(self, session: str):
+        """
+        ثبت فعالیت جلسه و بازگرداندن پنجره آخر تاریخچه‌هایش به حافظه
+        """
+        with self._lock:
+            self._last_seen[session] = time.monotonic()
+            histories = self._session_histories(session)
+        for history in histories:
+            history.rehydrate(self.window)
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            histories = [h for session in self._histories for h in self._session_histories(session)]
+        return sum(history.resident_bytes for history in histories)
+
+    def enforce_budget(self):
+        """
+        انتقال تاریخچه جلسه‌های کم‌استفاده‌تر به دیسک تا رسیدن به بودجه حافظه
+        """
+        total = self.resident_bytes()
+        if total > self.memory_budget:
+            with self._lock:
+                sessions = sorted(self._last_seen, key=self._last_seen.get)
+            for session in sessions:
+                with self._lock:
+                    histories = self._session_histories(session)
+                for history in histories:
+                    before = history.resident_bytes
+                    if history.spill(0):
+                        total -= before - history.resident_bytes
+                self.spilled_sessions += 1
+                if total <= self.memory_budget:
+                    break
+        metrics.set_gauge("session_resident_bytes", total)
+        metrics.set_gauge("session_count", len(self._histories))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            histories = [h for session in self._histories for h in self._session_histories(session)]
+            sessions = len(self._histories)
+        return {
+            "sessions": sessions,
+            "resident_bytes": sum(h.resident_bytes for h in histories),
+            "resident_items": sum(h.resident_count for h in histories),
+            "spilled_items": sum(len(h) - h.resident_count for h in histories),
+            "budget_bytes": self.memory_budget,
+            "spilled_sessions": self.spilled_sessions
+        }
@@ -0,0 +1,70 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable
+
+
+class StartupTimer:
+    """
+    ثبت زمان هر مرحله راه‌اندازی (import، بارگذاری مدل، باز کردن حافظه و ...)
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def mark_once(self, name: str):
+        """
+        ثبت زمان سپری‌شده از شروع تا اولین رسیدن به این نقطه
+        """
+        with self._lock:
+            self.stages.setdefault(name, time.perf_counter() - self.started)
+
+    def breakdown(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.stages)
+
+
+class BackgroundLoader:
+    """
+    اجرای یک تابع سازنده سنگین در thread پس‌زمینه تا رابط کاربری منتظر آن نماند
+    """
+    def __init__(self, factory: Callable[[StartupTimer], Any], timer: Optional[StartupTimer] = None):
+        self.timer = timer or StartupTimer()
+        self.value = None
+        self.error: Optional[BaseException] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(factory,),
+                                        name="background-loader", daemon=True)
+        self._thread.start()
+
+    def _run(self, factory: Callable[[StartupTimer], Any]):
+        try:
+            with self.timer.stage("total_load"):
+                self.value = factory(self.timer)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._ready.set()
+
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def result(self, timeout: Optional[float] = None):
+        """
+        انتظار برای پایان بارگذاری و برگرداندن نتیجه (یا بالا بردن خطای آن)
+        """
+        if not self._ready.wait(timeout):
+            raise TimeoutError("بارگذاری هنوز تمام نشده است")
+        if self.error is not None:
+            raise self.error
+        return self.value
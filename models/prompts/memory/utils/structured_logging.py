@@ -0,0 +1,51 @@
+import json
+import logging
+from datetime import datetime
+
+
+# ویژگی‌های استاندارد LogRecord که جزو فیلدهای ساخت‌یافته نیستند
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    هر رکورد لاگ به صورت یک خط JSON همراه فیلدهای extra
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RESERVED})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    قالب خوانا: زمان، سطح، نام، پیام و سپس فیلدهای extra به صورت key=value
+    """
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RESERVED)
+        return f"{line} {fields}" if fields else line
+
+
+def configure_logging(level: str = "INFO", json_format: bool = False):
+    """
+    تنظیم لاگ ریشه برنامه (فراخوانی دوباره فقط سطح و قالب را به‌روز می‌کند)
+    """
+    root = logging.getLogger()
+    handler = next((h for h in root.handlers if getattr(h, "_reality_handler", False)), None)
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler._reality_handler = True
+        root.addHandler(handler)
+    handler.setFormatter(JsonFormatter() if json_format else KeyValueFormatter())
+    root.setLevel(level)
@@ -0,0 +1,287 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+import numpy as np
+
+
+class UserTrajectory:
+    """
+    خلاصه تجمعی مسیر شناختی یک کاربر که با هر نوبت در O(1) به‌روز می‌شود
+    """
+    def __init__(self, max_shift_log: int = 50, max_segments: int = 100):
+        self.turns = 0
+        self.centroid: Optional[np.ndarray] = None  # میانگین متحرک نمایی بردارهای بخش فعلی
+        self.emotion_counts: Dict[str, int] = {}
+        self.belief_counts: Dict[str, int] = {}
+        self.last_analysis: Optional[Dict[str, Any]] = None
+        self.segment_start = 0
+        self.segment_count = 0
+        self.segments = deque(maxlen=max_segments)  # شماره نوبت شروع آخرین بخش‌ها
+        self.shift_log = deque(maxlen=max_shift_log)
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "emotion_counts": self.emotion_counts,
+            "belief_counts": self.belief_counts,
+            "last_analysis": self.last_analysis,
+            "segment_start": self.segment_start,
+            "segment_count": self.segment_count,
+            "segments": list(self.segments),
+            "shift_log": list(self.shift_log)
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], centroid: Optional[bytes],
+                   max_shift_log: int = 50, max_segments: int = 100) -> "UserTrajectory":
+        trajectory = cls(max_shift_log, max_segments)
+        trajectory.turns = state["turns"]
+        trajectory.emotion_counts = state["emotion_counts"]
+        trajectory.belief_counts = state["belief_counts"]
+        trajectory.last_analysis = state["last_analysis"]
+        trajectory.segment_start = state["segment_start"]
+        trajectory.segments.extend(state["segments"])
+        trajectory.segment_count = state.get("segment_count", len(state["segments"]))
+        trajectory.shift_log.extend(state["shift_log"])
+        if centroid:
+            trajectory.centroid = np.frombuffer(centroid, dtype=np.float32).copy()
+        return trajectory
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class TrajectoryEngine:
+    """
+    موتور مسیر واقعیت هر کاربر
+
+    به جای مقایسه با نزدیک‌ترین همسایه در پایگاه برداری، هر نوبت با مرکز
+    متحرک بخش فعلی مقایسه می‌شود؛ شمارش حالات و باورها، بخش‌ها و رویدادهای
+    تغییر به صورت تدریجی نگه‌داری و در SQLite ذخیره می‌شوند. فقط max_users کاربر
+    اخیر در حافظه می‌مانند و بقیه با مراجعه دوباره از SQLite خوانده می‌شوند (بدون path،
+    وضعیت کاربر حذف‌شده از حافظه از دست می‌رود).
+
+    نوبت‌های یک کاربر با قفل همان کاربر پشت سر هم اجرا می‌شوند و کاربران مختلف منتظر
+    هم نمی‌مانند. وضعیت هر نوبت فقط در صف ثبت قرار می‌گیرد و هر flush_every کاربر
+    تغییرکرده یا هر flush_interval ثانیه (و در close) یک‌جا در SQLite نوشته می‌شود.
+    """
+    def __init__(self,
+                 similarity_threshold: float = 0.6,
+                 alpha: float = 0.3,
+                 path: Optional[str] = None,
+                 max_shift_log: int = 50,
+                 max_segments: int = 100,
+                 max_users: int = 10000,
+                 flush_every: int = 64,
+                 flush_interval: float = 2.0,
+                 lock_stripes: int = 64):
+        self.threshold = similarity_threshold
+        self.alpha = alpha
+        self.max_shift_log = max_shift_log
+        self.max_segments = max_segments
+        self.max_users = max(1, max_users)
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._users: "OrderedDict[str, UserTrajectory]" = OrderedDict()
+        # _lock فقط از فهرست کاربران و صف ثبت محافظت می‌کند؛ به‌روزرسانی هر کاربر با قفل خود او
+        self._lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(max(1, lock_stripes))]
+        # آخرین وضعیت ثبت‌نشده هر کاربر: (state به صورت JSON، centroid)
+        self._pending: Dict[str, Tuple[str, Optional[bytes]]] = {}
+
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db_lock = threading.Lock()
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS trajectories ("
+                " user_id TEXT PRIMARY KEY, state TEXT NOT NULL, centroid BLOB)"
+            )
+            self._stop = threading.Event()
+            self._flusher = threading.Thread(target=self._run, name="trajectory-flusher", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        return self._user_locks[hash(user_id) % len(self._user_locks)]
+
+    def get(self, user_id: str) -> UserTrajectory:
+        """
+        وضعیت مسیر یک کاربر (از حافظه یا دیسک)
+        """
+        with self._user_lock(user_id):
+            return self._get(user_id)
+
+    def _get(self, user_id: str) -> UserTrajectory:
+        # فراخواننده قفل همین کاربر را در دست دارد، پس وضعیت او در این فاصله تغییر نمی‌کند
+        with self._lock:
+            trajectory = self._users.get(user_id)
+            if trajectory is not None:
+                self._users.move_to_end(user_id)
+                return trajectory
+            row = self._pending.get(user_id)
+
+        if row is None and self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT state, centroid FROM trajectories WHERE user_id = ?", (user_id,)
+                ).fetchone()
+        if row is not None:
+            trajectory = UserTrajectory.from_state(json.loads(row[0]), row[1],
+                                                   self.max_shift_log, self.max_segments)
+        else:
+            trajectory = UserTrajectory(self.max_shift_log, self.max_segments)
+
+        with self._lock:
+            self._users[user_id] = trajectory
+            # آخرین وضعیت هر نوبت در صف ثبت یا SQLite است؛ کنار گذاشتن قدیمی‌ترین کاربر امن است
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return trajectory
+
+    def update(self,
+               user_id: str,
+               embedding,
+               analysis: Dict[str, Any],
+               shift_description: str = "",
+               describe: Optional[Callable[[Optional[Dict[str, Any]]], str]] = None) -> Dict[str, Any]:
+        """
+        ثبت یک نوبت و برگرداندن نتیجه (واقعیت جدید؟، فاصله از مرکز بخش فعلی)
+
+        describe (اختیاری) با تحلیل نوبت قبلی کاربر و زیر همان قفل فراخوانی می‌شود تا
+        توصیف تغییر با نوبت‌های همزمان همان کاربر ناسازگار نشود.
+        """
+        vector = _normalize(embedding)
+
+        with self._user_lock(user_id):
+            trajectory = self._get(user_id)
+            if describe is not None:
+                shift_description = describe(trajectory.last_analysis)
+
+            if trajectory.centroid is None:
+                distance = None
+                is_new = True
+            else:
+                distance = float(1.0 - np.dot(vector, _normalize(trajectory.centroid)))
+                is_new = distance > (1 - self.threshold)
+
+            if is_new:
+                # شروع بخش جدید: مرکز از همین نوبت آغاز می‌شود
+                trajectory.segment_start = trajectory.turns
+                trajectory.segments.append(trajectory.turns)
+                trajectory.segment_count += 1
+                trajectory.centroid = vector.copy()
+                if trajectory.turns > 0:
+                    trajectory.shift_log.append({
+                        "turn": trajectory.turns,
+                        "timestamp": datetime.now().isoformat(),
+                        "distance": distance,
+                        "description": shift_description
+                    })
+            else:
+                trajectory.centroid = (1 - self.alpha) * trajectory.centroid + self.alpha * vector
+
+            emotion = analysis.get("emotional_state", "نامشخص")
+            trajectory.emotion_counts[emotion] = trajectory.emotion_counts.get(emotion, 0) + 1
+            for belief in analysis.get("beliefs", []):
+                trajectory.belief_counts[belief] = trajectory.belief_counts.get(belief, 0) + 1
+            trajectory.last_analysis = {
+                "emotional_state": analysis.get("emotional_state"),
+                "beliefs": list(analysis.get("beliefs", []))
+            }
+            trajectory.turns += 1
+
+            due = self._persist(user_id, trajectory)
+            result = {
+                "is_new_reality": is_new,
+                "distance": distance,
+                "turn": trajectory.turns - 1,
+                "segment": trajectory.segment_count,
+                "shift_description": shift_description
+            }
+
+        if due:
+            self.flush()
+        return result
+
+    def _persist(self, user_id: str, trajectory: UserTrajectory) -> bool:
+        """قرار دادن وضعیت فعلی کاربر در صف ثبت؛ True یعنی زمان نوشتن صف رسیده است"""
+        if self._db is None:
+            return False
+        centroid = trajectory.centroid.astype(np.float32).tobytes() if trajectory.centroid is not None else None
+        row = (json.dumps(trajectory.to_state(), ensure_ascii=False), centroid)
+        with self._lock:
+            self._pending[user_id] = row
+            return len(self._pending) >= self.flush_every
+
+    def flush(self):
+        """
+        نوشتن وضعیت‌های ثبت‌نشده در یک تراکنش SQLite
+        """
+        if self._db is None:
+            return
+        with self._db_lock:
+            if self._db is None:
+                return
+            with self._lock:
+                rows = dict(self._pending)
+            if not rows:
+                return
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO trajectories (user_id, state, centroid) VALUES (?, ?, ?)",
+                    [(user_id, state, centroid) for user_id, (state, centroid) in rows.items()]
+                )
+            with self._lock:
+                # وضعیتی که در این فاصله دوباره تغییر کرده در صف می‌ماند
+                for user_id, row in rows.items():
+                    if self._pending.get(user_id) is row:
+                        del self._pending[user_id]
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def summary(self, user_id: str, top: int = 3) -> Dict[str, Any]:
+        """
+        خلاصه مسیر کاربر: حالات و باورهای غالب، تعداد بخش‌ها و آخرین تغییرها
+        """
+        with self._user_lock(user_id):
+            trajectory = self._get(user_id)
+            emotions = sorted(trajectory.emotion_counts.items(), key=lambda kv: -kv[1])
+            beliefs = sorted(trajectory.belief_counts.items(), key=lambda kv: -kv[1])
+            return {
+                "turns": trajectory.turns,
+                "segments": trajectory.segment_count,
+                "current_segment_turns": trajectory.turns - trajectory.segment_start,
+                "dominant_emotions": emotions[:top],
+                "dominant_beliefs": beliefs[:top],
+                "recent_shifts": list(trajectory.shift_log)[-top:]
+            }
+
+    def close(self):
+        """
+        نوشتن وضعیت‌های باقی‌مانده و بستن پایگاه
+        """
+        if self._db is None:
+            return
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+            self._db = None
+        atexit.unregister(self.close)
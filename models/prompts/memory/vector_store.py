@@ -1,16 +1,40 @@
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, Sequence
 import json
+import logging
+import os
+import time
+import uuid
+from itertools import islice
 from datetime import datetime
 
+from memory.user_index import UserVectorIndex
+from memory.timeline_index import TimelineIndex, timestamp_to_epoch
+from memory.retrieval import search_diverse
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _as_list(embedding) -> List[float]:
+    """تبدیل بردار numpy به لیست برای ChromaDB"""
+    return embedding.tolist() if hasattr(embedding, "tolist") else list(embedding)
+
 class RealityMemory:
     """
     ذخیره‌سازی و بازیابی "واقعیت‌های" کاربر در ChromaDB
     """
-    def __init__(self, persist_directory: str, collection_name: str):
-        # راه‌اندازی کلاینت ChromaDB
-        self.client = chromadb.PersistentClient(
+    def __init__(self,
+                 persist_directory: str,
+                 collection_name: str,
+                 use_user_index: bool = False,
+                 user_index_budget_mb: float = 256,
+                 client=None):
+        self.persist_directory = persist_directory
+        
+        # راه‌اندازی کلاینت ChromaDB (یا استفاده از کلاینت مشترک، مثلاً بین shardها)
+        self.client = client or chromadb.PersistentClient(
             path=persist_directory,
             settings=Settings(anonymized_telemetry=False)
         )
@@ -21,7 +45,17 @@ class RealityMemory:
             metadata={"hnsw:space": "cosine"}  # استفاده از شباهت کسینوسی
         )
         
-        print(f"✅ پایگاه داده در {persist_directory} راه‌اندازی شد.")
+        # ایندکس ثانویه زمانی برای تاریخچه مرتب و صفحه‌بندی‌شده
+        self.timeline = TimelineIndex(os.path.join(persist_directory, f"{collection_name}_timeline.sqlite3"))
+        if self.timeline.is_empty() and self.collection.count() > 0:
+            rebuilt = self.timeline.rebuild(self.collection)
+            logger.info("🕒 ایندکس زمانی برای %d واقعیت ساخته شد.", rebuilt)
+        
+        # ایندکس درون‌حافظه‌ای هر کاربر برای جستجوی سریع بدون ChromaDB
+        self.user_index = UserVectorIndex(self.collection, user_index_budget_mb) if use_user_index else None
+        
+        logger.info("✅ پایگاه داده در %s راه‌اندازی شد.", persist_directory,
+                    extra={"collection": collection_name})
     
     def add_reality(self, 
                     user_id: str, 
@@ -32,44 +66,147 @@ class RealityMemory:
         ذخیره یک "واقعیت" جدید در پایگاه داده
         """
         # ایجاد یک شناسه یکتا
-        doc_id = f"{user_id}_{datetime.now().timestamp()}"
+        doc_id = self._new_id(user_id)
         
         # متادیتا: اطلاعات همراه بردار
-        metadata = {
+        metadata = self._build_metadata(user_id, text, analysis)
+        
+        # اضافه کردن به ChromaDB
+        with metrics.span("chroma_call_seconds", op="add"):
+            self.collection.add(
+                embeddings=[_as_list(embedding)],
+                documents=[text],
+                metadatas=[metadata],
+                ids=[doc_id]
+            )
+        self.timeline.add(user_id, timestamp_to_epoch(metadata["timestamp"]), doc_id)
+        
+        if self.user_index is not None:
+            self.user_index.add(user_id, doc_id, text, embedding, metadata)
+        
+        logger.debug("✅ واقعیت جدید ذخیره شد.", extra={"user_id": user_id, "doc_id": doc_id})
+        return doc_id
+    
+    def add_realities_bulk(self,
+                           records: Iterable[Dict[str, Any]],
+                           embedding_model=None,
+                           chunk_size: int = 256,
+                           on_progress: Optional[Callable[[int, float], None]] = None) -> Dict[str, Any]:
+        """
+        ورود انبوه واقعیت‌ها (مثلاً انتقال گفتگوهای قدیمی)
+        
+        هر رکورد: {"user_id", "text", "analysis"?, "embedding"?, "timestamp"?, "id"?, "metadata"?}
+        رکوردها به صورت جریانی و در دسته‌های chunk_size خوانده می‌شوند؛ رکوردهای بدون
+        بردار با embedding_model.encode_batch تبدیل می‌شوند. رکوردهای دارای id با upsert
+        نوشته می‌شوند تا نوشتن دوباره (مثلاً بازپخش لاگ) تکراری نسازد. metadata (مثلاً هنگام
+        انتقال بین حافظه‌ها) بدون تغییر ذخیره می‌شود و analysis/timestamp را نادیده می‌گیرد.
+        """
+        records = iter(records)
+        started = time.perf_counter()
+        total = 0
+        
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            
+            missing = [i for i, record in enumerate(chunk) if record.get("embedding") is None]
+            computed = {}
+            if missing:
+                if embedding_model is None:
+                    raise ValueError("برای رکوردهای بدون بردار، embedding_model لازم است")
+                vectors = embedding_model.encode_batch([chunk[i]["text"] for i in missing])
+                computed = dict(zip(missing, vectors))
+            
+            ids, embeddings, documents, metadatas = [], [], [], []
+            for i, record in enumerate(chunk):
+                user_id = record["user_id"]
+                ids.append(record.get("id") or self._new_id(user_id))
+                embeddings.append(_as_list(computed[i] if i in computed else record["embedding"]))
+                documents.append(record["text"])
+                metadatas.append(dict(record["metadata"]) if record.get("metadata") else
+                                 self._build_metadata(user_id,
+                                                      record["text"],
+                                                      record.get("analysis") or {},
+                                                      record.get("timestamp")))
+            
+            write = self.collection.upsert if any("id" in record for record in chunk) else self.collection.add
+            with metrics.span("chroma_call_seconds", op="add_bulk"):
+                write(
+                    embeddings=embeddings,
+                    documents=documents,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+            self.timeline.add_many(
+                (metadata["user_id"], timestamp_to_epoch(metadata["timestamp"]), doc_id)
+                for doc_id, metadata in zip(ids, metadatas)
+            )
+            
+            if self.user_index is not None:
+                for doc_id, text, embedding, metadata in zip(ids, documents, embeddings, metadatas):
+                    self.user_index.add(metadata["user_id"], doc_id, text, embedding, metadata)
+            
+            total += len(chunk)
+            elapsed = time.perf_counter() - started
+            if on_progress is not None:
+                on_progress(total, elapsed)
+            else:
+                logger.info("📥 %d واقعیت وارد شد (%.0f ردیف در ثانیه)", total, total / elapsed)
+        
+        elapsed = time.perf_counter() - started
+        return {
+            "rows": total,
+            "seconds": elapsed,
+            "rows_per_sec": total / elapsed if elapsed > 0 else 0.0
+        }
+    
+    def count(self) -> int:
+        return self.collection.count()
+    
+    @staticmethod
+    def _new_id(user_id: str) -> str:
+        """شناسه یکتا، بدون برخورد حتی در درج‌های همزمان"""
+        return f"{user_id}_{uuid.uuid4().hex}"
+    
+    @staticmethod
+    def _build_metadata(user_id: str,
+                        text: str,
+                        analysis: Dict[str, Any],
+                        timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """ساخت متادیتای ذخیره‌شده همراه بردار"""
+        return {
             "user_id": user_id,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": timestamp or datetime.now().isoformat(),
             "emotional_state": analysis.get("emotional_state", "unknown"),
             "beliefs": json.dumps(analysis.get("beliefs", [])),  # JSON string
             "cognitive_needs": analysis.get("cognitive_needs", "unknown"),
             "text_sample": text[:100]  # بخشی از متن برای نمایش
         }
-        
-        # اضافه کردن به ChromaDB
-        self.collection.add(
-            embeddings=[embedding],
-            documents=[text],
-            metadatas=[metadata],
-            ids=[doc_id]
-        )
-        
-        print(f"✅ واقعیت جدید برای کاربر {user_id} ذخیره شد.")
-        return doc_id
     
     def search_similar_realities(self, 
                                   query_embedding: List[float], 
                                   user_id: Optional[str] = None,
-                                  n_results: int = 3) -> List[Dict]:
+                                  n_results: int = 3,
+                                  include_embeddings: bool = False) -> List[Dict]:
         """
-        جستجوی واقعیت‌های مشابه
+        جستجوی واقعیت‌های مشابه (با include_embeddings بردار هر نتیجه هم برگردانده می‌شود)
         """
+        # برای یک کاربر مشخص، جستجو در ایندکس درون‌حافظه‌ای انجام می‌شود
+        if user_id and self.user_index is not None:
+            with metrics.span("vector_search_seconds", store="user_index"):
+                return self.user_index.search(user_id, query_embedding, n_results, include_embeddings)
+        
         # فیلتر بر اساس user_id اگر داده شده باشد
         where_filter = {"user_id": user_id} if user_id else None
         
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=where_filter
-        )
+        with metrics.span("chroma_call_seconds", op="query"):
+            results = self.collection.query(
+                query_embeddings=[_as_list(query_embedding)],
+                n_results=n_results,
+                where=where_filter,
+                include=["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+            )
         
         # تبدیل نتایج به فرمت مناسب
         formatted_results = []
@@ -81,25 +218,86 @@ class RealityMemory:
                     'metadata': results['metadatas'][0][i],
                     'distance': results['distances'][0][i] if results['distances'] else None
                 })
+                if include_embeddings:
+                    formatted_results[-1]['embedding'] = results['embeddings'][0][i]
         
         return formatted_results
     
+    def search_diverse_realities(self,
+                                 query_embedding,
+                                 user_id: Optional[str] = None,
+                                 n_results: int = 3,
+                                 candidate_multiplier: int = 4,
+                                 mmr_lambda: float = 0.7,
+                                 dedup_distance: float = 0.05,
+                                 max_distance: Optional[float] = None) -> List[Dict]:
+        """
+        جستجوی متنوع: دریافت candidate_multiplier برابر نامزد، حذف نتایج دورتر از
+        max_distance و تکراری‌ها، و بازچینی MMR (memory/retrieval.py)
+        """
+        return search_diverse(self, query_embedding, user_id, n_results, candidate_multiplier,
+                              mmr_lambda, dedup_distance, max_distance)
+    
     def get_user_history(self, user_id: str, limit: int = 10) -> List[Dict]:
         """
-        دریافت تاریخچه واقعیت‌های یک کاربر
+        دریافت تاریخچه واقعیت‌های یک کاربر (جدیدترین‌ها اول)
         """
-        results = self.collection.get(
-            where={"user_id": user_id},
-            limit=limit
-        )
+        return self.get_user_history_page(user_id, limit)["items"]
+    
+    def get_user_history_page(self,
+                              user_id: str,
+                              limit: int = 10,
+                              cursor: Optional[str] = None,
+                              order: str = "desc",
+                              include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        """
+        یک صفحه از تاریخچه مرتب‌شده بر اساس زمان
+        
+        include مشخص می‌کند کدام بخش‌ها (documents، metadatas، embeddings) خوانده شوند؛
+        برای صفحه بعد، next_cursor را دوباره به عنوان cursor بفرستید.
+        """
+        rows, next_cursor = self.timeline.page(user_id, limit, cursor, descending=(order == "desc"))
+        return {
+            "items": self._fetch_ordered(rows, include),
+            "next_cursor": next_cursor
+        }
+    
+    def iter_user_history(self,
+                          user_id: str,
+                          page_size: int = 200,
+                          include: Sequence[str] = ("documents", "metadatas")) -> Iterator[Dict]:
+        """
+        پیمایش کل تاریخچه کاربر از قدیمی به جدید با حافظه ثابت (برای خروجی گرفتن)
+        """
+        cursor = None
+        while True:
+            rows, cursor = self.timeline.page(user_id, page_size, cursor, descending=False)
+            yield from self._fetch_ordered(rows, include)
+            if cursor is None:
+                break
+    
+    def _fetch_ordered(self, rows: List, include: Sequence[str]) -> List[Dict]:
+        """خواندن رکوردهای یک صفحه از ChromaDB به همان ترتیب ایندکس زمانی"""
+        if not rows:
+            return []
+        
+        ids = [doc_id for _, doc_id in rows]
+        with metrics.span("chroma_call_seconds", op="get"):
+            results = self.collection.get(ids=ids, include=list(include))
+        position = {doc_id: i for i, doc_id in enumerate(results['ids'])}
         
         history = []
-        if results['ids']:
-            for i in range(len(results['ids'])):
-                history.append({
-                    'id': results['ids'][i],
-                    'text': results['documents'][i],
-                    'metadata': results['metadatas'][i]
-                })
+        for ts, doc_id in rows:
+            i = position.get(doc_id)
+            if i is None:
+                continue
+            entry = {'id': doc_id, 'ts': ts}
+            if "documents" in include:
+                entry['text'] = results['documents'][i]
+            if "metadatas" in include:
+                entry['metadata'] = results['metadatas'][i]
+            if "embeddings" in include:
+                entry['embedding'] = results['embeddings'][i]
+            history.append(entry)
         
         return history
@@ -0,0 +1,349 @@
+import atexit
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, Sequence
+
+import numpy as np
+
+from memory.vector_store import RealityMemory
+from memory.retrieval import search_diverse
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_vector(embedding) -> str:
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+
+class AppendOnlyLog:
+    """
+    لاگ الحاقی پایدار رکوردهای در انتظار (یک خط JSON برای هر رکورد)
+
+    لاگ در چند بخش (segment) نوشته می‌شود: پیش از هر نوشتن گروهی، بخش فعلی بسته
+    و بخش تازه‌ای باز می‌شود تا پس از ثبت در حافظه بتوان بخش‌های بسته را حذف کرد.
+    """
+    def __init__(self, directory: str, fsync: bool = True):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        segments = self.segments()
+        self._number = int(os.path.basename(segments[-1]).split(".")[0]) + 1 if segments else 1
+        self._file = self._open(self._number)
+
+    def _open(self, number: int):
+        return open(os.path.join(self.directory, f"{number:08d}.log"), "a", encoding="utf-8")
+
+    def segments(self) -> List[str]:
+        return sorted(os.path.join(self.directory, name)
+                      for name in os.listdir(self.directory) if name.endswith(".log"))
+
+    def append(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def rotate(self) -> List[str]:
+        """
+        بستن بخش فعلی و شروع بخش تازه؛ خروجی مسیر بخش‌های بسته‌شده است
+        """
+        with self._lock:
+            self._file.close()
+            self._number += 1
+            self._file = self._open(self._number)
+            current = self._file.name
+        return [path for path in self.segments() if path != current]
+
+    @staticmethod
+    def read(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # خط ناقص آخر (قطع برق هنگام نوشتن) هرگز تأیید نشده بود
+                        logger.warning("⚠️ خط ناقص در لاگ نادیده گرفته شد.", extra={"segment": path})
+
+    @staticmethod
+    def remove(paths: Iterable[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class WriteBehindMemory:
+    """
+    نوشتن با تأخیر (write-behind) روی هر حافظه واقعیت‌ها
+
+    add_reality رکورد را در لاگ الحاقی پایدار و صف درون‌حافظه‌ای محدود می‌گذارد و
+    بلافاصله برمی‌گردد؛ یک رشته پس‌زمینه هر batch_size رکورد یا هر flush_interval_ms
+    آن‌ها را یک‌جا با add_realities_bulk (upsert با شناسه ثابت) در حافظه اصلی ثبت می‌کند.
+    جستجوهای کاربر رکوردهای در انتظار را هم می‌بینند. در شروع، لاگ باقی‌مانده از
+    اجرای قبلی بازپخش می‌شود، پس با قطع ناگهانی برنامه چیزی از دست نمی‌رود.
+    """
+    def __init__(self,
+                 memory,
+                 log_directory: str,
+                 max_pending: int = 10000,
+                 batch_size: int = 256,
+                 flush_interval_ms: float = 50,
+                 fsync: bool = True):
+        self.memory = memory
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+
+        self._log = AppendOnlyLog(log_directory, fsync)
+        self._replay(self._log.rotate())
+
+        # رکوردهای ثبت‌نشده به ترتیب ورود؛ تا پایان ثبت در حافظه اصلی قابل جستجو می‌مانند
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flushing = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _replay(self, segments: List[str]):
+        """ثبت رکوردهای لاگ اجرای قبلی (تکراری‌ها با upsert نادیده گرفته می‌شوند)"""
+        if not segments:
+            return
+        result = self.memory.add_realities_bulk(
+            (dict(record, embedding=_decode_vector(record["embedding"]))
+             for record in AppendOnlyLog.read(segments)),
+            chunk_size=self.batch_size,
+            on_progress=lambda *_: None
+        )
+        AppendOnlyLog.remove(segments)
+        if result["rows"]:
+            logger.info("♻️ %d واقعیت از لاگ نوشتن با تأخیر بازپخش شد.", result["rows"])
+
+    def add_reality(self,
+                    user_id: str,
+                    text: str,
+                    embedding,
+                    analysis: Dict[str, Any]):
+        """
+        ذخیره یک "واقعیت" جدید (ثبت نهایی در پس‌زمینه)
+        """
+        doc_id = RealityMemory._new_id(user_id)
+        metadata = RealityMemory._build_metadata(user_id, text, analysis)
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+
+        with self._cond:
+            # صف پر است: تا خالی شدن بخشی از آن صبر می‌کنیم (فشار معکوس)
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._cond.wait()
+            self._log.append({
+                "id": doc_id,
+                "user_id": user_id,
+                "text": text,
+                "analysis": analysis,
+                "timestamp": metadata["timestamp"],
+                "embedding": _encode_vector(vector)
+            })
+            self._pending[doc_id] = {
+                "id": doc_id,
+                "user_id": user_id,
+                "text": text,
+                "analysis": analysis,
+                "timestamp": metadata["timestamp"],
+                "embedding": vector,
+                "metadata": metadata
+            }
+            if len(self._pending) - self._flushing >= self.batch_size:
+                self._cond.notify_all()
+
+        logger.debug("✅ واقعیت جدید در صف ذخیره قرار گرفت.", extra={"user_id": user_id, "doc_id": doc_id})
+        return doc_id
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed and not self._pending:
+                    return
+            if not self.flush() and not self._closed:
+                # خطا در ثبت: رکوردها در صف و لاگ می‌مانند و بعداً دوباره تلاش می‌شود
+                time.sleep(max(self.flush_interval, 1.0))
+            elif self._closed:
+                return
+
+    def flush(self) -> bool:
+        """
+        ثبت گروهی همه رکوردهای در انتظار در حافظه اصلی
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> bool:
+        with self._cond:
+            if not self._pending:
+                return True
+            batch = list(self._pending.values())
+            self._flushing = len(batch)
+            segments = self._log.rotate()
+
+        try:
+            with metrics.span("write_behind_flush_seconds"):
+                self.memory.add_realities_bulk(
+                    ({key: record[key] for key in ("id", "user_id", "text", "analysis", "timestamp", "embedding")}
+                     for record in batch),
+                    chunk_size=self.batch_size,
+                    on_progress=lambda *_: None
+                )
+        except Exception:
+            logger.exception("❌ ثبت گروهی واقعیت‌ها ناموفق بود.", extra={"records": len(batch)})
+            with self._cond:
+                self._flushing = 0
+            return False
+
+        AppendOnlyLog.remove(segments)
+        with self._cond:
+            for record in batch:
+                self._pending.pop(record["id"], None)
+            self._flushing = 0
+            self._cond.notify_all()
+        metrics.observe("write_behind_batch_records", len(batch))
+        return True
+
+    def add_realities_bulk(self,
+                           records: Iterable[Dict[str, Any]],
+                           embedding_model=None,
+                           chunk_size: int = 256,
+                           on_progress: Optional[Callable[[int, float], None]] = None) -> Dict[str, Any]:
+        """
+        ورود انبوه مستقیم در حافظه اصلی (پس از ثبت رکوردهای در انتظار)
+        """
+        self.flush()
+        return self.memory.add_realities_bulk(records, embedding_model, chunk_size, on_progress)
+
+    def count(self) -> int:
+        """تعداد تقریبی (رکوردهای در حال ثبت ممکن است یک بار اضافه شمرده شوند)"""
+        with self._cond:
+            pending = len(self._pending)
+        return self.memory.count() + pending
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def search_similar_realities(self,
+                                 query_embedding,
+                                 user_id: Optional[str] = None,
+                                 n_results: int = 3,
+                                 include_embeddings: bool = False) -> List[Dict]:
+        """
+        جستجو در حافظه اصلی و رکوردهای در انتظار (فاصله کسینوسی مانند ChromaDB)
+        """
+        with self._cond:
+            pending = [record for record in self._pending.values()
+                       if user_id is None or record["user_id"] == user_id]
+        results = self.memory.search_similar_realities(query_embedding, user_id, n_results,
+                                                       include_embeddings=include_embeddings)
+        if not pending:
+            return results
+
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        matrix = np.stack([record["embedding"] for record in pending])
+        norms = np.linalg.norm(matrix, axis=1) * max(float(np.linalg.norm(query)), 1e-12)
+        distances = 1.0 - (matrix @ query) / np.maximum(norms, 1e-12)
+
+        seen = {result["id"] for result in results}
+        merged = list(results)
+        for record, distance in zip(pending, distances):
+            if record["id"] not in seen:
+                merged.append({
+                    'id': record["id"],
+                    'text': record["text"],
+                    'metadata': record["metadata"],
+                    'distance': float(distance)
+                })
+                if include_embeddings:
+                    merged[-1]['embedding'] = record["embedding"]
+        merged.sort(key=lambda r: r['distance'] if r['distance'] is not None else float("inf"))
+        return merged[:n_results]
+
+    def search_diverse_realities(self,
+                                 query_embedding,
+                                 user_id: Optional[str] = None,
+                                 n_results: int = 3,
+                                 candidate_multiplier: int = 4,
+                                 mmr_lambda: float = 0.7,
+                                 dedup_distance: float = 0.05,
+                                 max_distance: Optional[float] = None) -> List[Dict]:
+        """
+        جستجوی متنوع روی حافظه اصلی و رکوردهای در انتظار
+        """
+        return search_diverse(self, query_embedding, user_id, n_results, candidate_multiplier,
+                              mmr_lambda, dedup_distance, max_distance)
+
+    def _settle(self, user_id: str):
+        """پیش از خواندن تاریخچه، رکوردهای در انتظار این کاربر ثبت می‌شوند"""
+        with self._cond:
+            waiting = any(record["user_id"] == user_id for record in self._pending.values())
+        if waiting:
+            self.flush()
+
+    def get_user_history(self, user_id: str, limit: int = 10) -> List[Dict]:
+        self._settle(user_id)
+        return self.memory.get_user_history(user_id, limit)
+
+    def get_user_history_page(self,
+                              user_id: str,
+                              limit: int = 10,
+                              cursor: Optional[str] = None,
+                              order: str = "desc",
+                              include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        self._settle(user_id)
+        return self.memory.get_user_history_page(user_id, limit, cursor, order, include)
+
+    def iter_user_history(self,
+                          user_id: str,
+                          page_size: int = 200,
+                          include: Sequence[str] = ("documents", "metadatas")) -> Iterator[Dict]:
+        self._settle(user_id)
+        return self.memory.iter_user_history(user_id, page_size, include)
+
+    def close(self):
+        """
+        ثبت رکوردهای باقی‌مانده و توقف رشته پس‌زمینه
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        self.flush()
+        self._log.close()
+        atexit.unregister(self.close)
+        close = getattr(self.memory, "close", None)
+        if close is not None:
+            close()
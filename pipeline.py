@@ -0,0 +1,426 @@
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+
+from config import *
+from models.embedding_model import PersianEmbeddingModel
+from models.embedding_batcher import EmbeddingBatcher
+from models.embedding_cache import EmbeddingCache, CachedEmbeddingModel
+from memory.vector_store import RealityMemory
+from memory.sharded_store import ShardedRealityMemory
+from memory.compact_store import CompactRealityMemory
+from memory.write_behind import WriteBehindMemory
+from memory.maintenance import RetentionPolicy, MaintenanceScheduler
+from models.llm_interface import LLMInterface
+from models.llm_backends import OpenAICompatibleBackend
+from models.llm_cache import TTLCache, MemoizedLLM
+from utils.reality_tracker import RealityTracker
+from utils.trajectory import TrajectoryEngine
+from utils.startup import StartupTimer
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def load_embedding_model() -> PersianEmbeddingModel:
+    """
+    مدل embedding با backend تعیین‌شده در config.py
+
+    اگر بررسی دقت فعال باشد و انحراف backend از مدل float32 بیش از حد مجاز
+    باشد، همان مدل float32 استفاده می‌شود. نتیجه بررسی برای هر (مدل، backend) در
+    EMBEDDING_ACCURACY_RECORD_PATH ذخیره می‌شود تا مدل مرجع فقط یک بار بارگذاری شود.
+    """
+    if EMBEDDING_BACKEND == "torch" or not EMBEDDING_ACCURACY_CHECK:
+        return PersianEmbeddingModel(EMBEDDING_MODEL, EMBEDDING_SNAPSHOT_DIR, EMBEDDING_BACKEND)
+
+    from models.embedding_accuracy import (check_backend, is_acceptable, accuracy_key,
+                                           load_accuracy_report, save_accuracy_report)
+    key = accuracy_key(EMBEDDING_MODEL, EMBEDDING_BACKEND, SIMILARITY_THRESHOLD)
+    report = load_accuracy_report(EMBEDDING_ACCURACY_RECORD_PATH, key)
+    reference = None
+    model = None
+    if report is None:
+        model = PersianEmbeddingModel(EMBEDDING_MODEL, EMBEDDING_SNAPSHOT_DIR, EMBEDDING_BACKEND)
+        reference = PersianEmbeddingModel(EMBEDDING_MODEL, EMBEDDING_SNAPSHOT_DIR, "torch")
+        report = check_backend(reference, model, similarity_threshold=SIMILARITY_THRESHOLD)
+        save_accuracy_report(EMBEDDING_ACCURACY_RECORD_PATH, key, report)
+
+    if not is_acceptable(report, EMBEDDING_MAX_DRIFT, EMBEDDING_MIN_AGREEMENT):
+        logger.warning("⚠️ انحراف backend %s بیش از حد مجاز است (انحراف %.3f، توافق %.1f%%)؛ "
+                       "از مدل float32 استفاده می‌شود.", EMBEDDING_BACKEND,
+                       report['pairwise_drift_max'], report['decision_agreement'] * 100, extra=report)
+        return reference or PersianEmbeddingModel(EMBEDDING_MODEL, EMBEDDING_SNAPSHOT_DIR, "torch")
+    logger.info("✅ backend %s: %.1f× سریع‌تر، توافق تصمیم‌ها %.1f%%", EMBEDDING_BACKEND,
+                report['speedup'], report['decision_agreement'] * 100, extra=report)
+    return model or PersianEmbeddingModel(EMBEDDING_MODEL, EMBEDDING_SNAPSHOT_DIR, EMBEDDING_BACKEND)
+
+
+def build_embedding_model(model: Optional[PersianEmbeddingModel] = None):
+    """
+    مدل embedding با دسته‌بندی و کش طبق config.py (مدل از پیش بارگذاری‌شده قابل ارسال است)
+    """
+    embedding_model = model or load_embedding_model()
+    if EMBEDDING_MICRO_BATCHING:
+        embedding_model = EmbeddingBatcher(embedding_model,
+                                           EMBEDDING_MAX_BATCH_SIZE,
+                                           EMBEDDING_MAX_WAIT_MS)
+    if EMBEDDING_CACHE_ENABLED:
+        # بردارهای هر backend جداگانه کش می‌شوند
+        cache_key = EMBEDDING_MODEL if EMBEDDING_BACKEND == "torch" else f"{EMBEDDING_MODEL}:{EMBEDDING_BACKEND}"
+        cache = EmbeddingCache(cache_key,
+                               EMBEDDING_CACHE_PATH,
+                               EMBEDDING_CACHE_MEMORY_ITEMS)
+        embedding_model = CachedEmbeddingModel(embedding_model, cache)
+    return embedding_model
+
+
+def build_memory():
+    """
+    حافظه واقعیت‌ها (تکی یا shard‌شده، با یا بدون نوشتن با تأخیر) طبق config.py
+    """
+    memory = _build_store()
+    if MEMORY_WRITE_BEHIND:
+        memory = WriteBehindMemory(memory, MEMORY_WRITE_BEHIND_DIR,
+                                   max_pending=MEMORY_WRITE_BEHIND_MAX_PENDING,
+                                   batch_size=MEMORY_WRITE_BEHIND_BATCH,
+                                   flush_interval_ms=MEMORY_WRITE_BEHIND_INTERVAL_MS,
+                                   fsync=MEMORY_WRITE_BEHIND_FSYNC)
+    if MEMORY_MAINTENANCE_ENABLED:
+        policy = RetentionPolicy(MEMORY_RETENTION_DAYS, MEMORY_RETENTION_KEEP_RECENT,
+                                 MEMORY_COMPACTION_DISTANCE, MEMORY_COMPACTION_MIN_CLUSTER)
+        MaintenanceScheduler(memory, policy, MEMORY_MAINTENANCE_INTERVAL_HOURS).start()
+    return memory
+
+
+def _build_store():
+    if MEMORY_NUM_SHARDS > 1:
+        return ShardedRealityMemory(CHROMA_PERSIST_DIR, COLLECTION_NAME,
+                                    MEMORY_NUM_SHARDS, MEMORY_SHARD_SEPARATE_DIRS,
+                                    use_user_index=MEMORY_USER_INDEX,
+                                    user_index_budget_mb=MEMORY_USER_INDEX_BUDGET_MB,
+                                    storage=MEMORY_STORAGE,
+                                    vector_dtype=MEMORY_VECTOR_DTYPE,
+                                    keep_exact=MEMORY_KEEP_EXACT_VECTORS,
+                                    rerank_factor=MEMORY_RERANK_FACTOR)
+    if MEMORY_STORAGE == "compact":
+        return CompactRealityMemory(CHROMA_PERSIST_DIR, COLLECTION_NAME,
+                                    MEMORY_VECTOR_DTYPE, MEMORY_KEEP_EXACT_VECTORS,
+                                    MEMORY_RERANK_FACTOR)
+    return RealityMemory(CHROMA_PERSIST_DIR, COLLECTION_NAME,
+                         use_user_index=MEMORY_USER_INDEX,
+                         user_index_budget_mb=MEMORY_USER_INDEX_BUDGET_MB)
+
+
+def build_llm():
+    """
+    رابط مدل زبانی با backend و کش طبق config.py
+    """
+    backend = None
+    if not USE_LOCAL_LLM:
+        backend = OpenAICompatibleBackend(OPENAI_API_KEY,
+                                          base_url=LLM_BASE_URL,
+                                          model=LLM_MODEL,
+                                          timeout=LLM_TIMEOUT,
+                                          max_retries=LLM_MAX_RETRIES,
+                                          max_concurrency=LLM_MAX_CONCURRENCY)
+    llm = LLMInterface(OPENAI_API_KEY, USE_LOCAL_LLM, backend=backend)
+    if LLM_CACHE_ENABLED:
+        llm = MemoizedLLM(llm, TTLCache(LLM_CACHE_MAX_ITEMS,
+                                        LLM_CACHE_TTL_SECONDS,
+                                        LLM_CACHE_PATH))
+    return llm
+
+
+def build_tracker() -> RealityTracker:
+    """
+    ردیاب واقعیت با موتور مسیر طبق config.py
+    """
+    trajectory = None
+    if TRAJECTORY_ENABLED:
+        trajectory = TrajectoryEngine(SIMILARITY_THRESHOLD, TRAJECTORY_ALPHA, TRAJECTORY_PATH,
+                                      max_users=TRAJECTORY_MAX_USERS,
+                                      flush_every=TRAJECTORY_FLUSH_EVERY,
+                                      flush_interval=TRAJECTORY_FLUSH_INTERVAL_SECONDS)
+    return RealityTracker(SIMILARITY_THRESHOLD, trajectory)
+
+
+class TurnPipeline:
+    """
+    موتور پردازش یک نوبت گفتگو، مستقل از رابط کاربری Streamlit
+
+    مراحل هر نوبت:
+    تحلیل واقعیت ← تبدیل به بردار ← جستجوی مشابه‌ها ← تشخیص تغییر ← ذخیره ← تولید پاسخ
+    """
+    def __init__(self,
+                 embedding_model: PersianEmbeddingModel,
+                 memory: RealityMemory,
+                 llm: LLMInterface,
+                 tracker: RealityTracker,
+                 system_prompt: str = "",
+                 top_k: int = TOP_K_RESULTS,
+                 retrieval_mode: str = RETRIEVAL_MODE):
+        self.embedding_model = embedding_model
+        self.memory = memory
+        self.llm = llm
+        self.tracker = tracker
+        self.system_prompt = system_prompt
+        self.top_k = top_k
+        self.retrieval_mode = retrieval_mode
+
+    @classmethod
+    def from_config(cls, system_prompt: str = "", timer: Optional[StartupTimer] = None) -> "TurnPipeline":
+        """
+        ساخت موتور با تنظیمات config.py (زمان هر مرحله در timer ثبت می‌شود)
+        """
+        # اندازه‌گیری زمان مراحل و فراخوانی‌های حافظه (در حالت خاموش بدون هزینه)
+        metrics.configure(METRICS_ENABLED, METRICS_WINDOW)
+        timer = timer or StartupTimer()
+        with timer.stage("embedding_model"):
+            embedding_model = build_embedding_model()
+        with timer.stage("memory"):
+            if MEMORY_SERVICE_ENABLED:
+                # چند نمونه برنامه یک حافظه و یک موتور مسیر مشترک دارند
+                from memory.memory_service import connect_memory_service, require_authkey
+                memory, tracker = connect_memory_service((MEMORY_SERVICE_HOST, MEMORY_SERVICE_PORT),
+                                                         require_authkey(MEMORY_SERVICE_AUTHKEY))
+            else:
+                memory, tracker = build_memory(), build_tracker()
+        with timer.stage("llm"):
+            llm = build_llm()
+        return cls(embedding_model, memory, llm, tracker, system_prompt)
+
+    def process_turn(self,
+                     user_id: str,
+                     text: str,
+                     on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """
+        پردازش کامل یک پیام کاربر و برگرداندن پاسخ و تحلیل
+
+        اگر on_token داده شود، توکن‌های پاسخ به محض دریافت به آن فرستاده می‌شوند.
+        """
+        with metrics.span("turn_seconds"):
+            # مرحله 1: تحلیل واقعیت
+            with metrics.span("turn_stage_seconds", stage="analyze"):
+                analysis = self.llm.analyze_reality(text, "")
+
+            # مرحله 2: تبدیل به بردار
+            with metrics.span("turn_stage_seconds", stage="encode"):
+                embedding = self.embedding_model.encode(text)
+
+            return self._complete_turn(user_id, text, analysis, embedding, on_token)
+
+    def process_turns(self, turns: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        پردازش دسته‌ای چند پیام به صورت (user_id, text)
+
+        بردارها با یک فراخوانی encode_batch ساخته می‌شوند؛ بقیه مراحل به ترتیب
+        اجرا می‌شوند تا پیام‌های بعدی یک کاربر، پیام‌های قبلی او را در حافظه ببینند.
+        """
+        if not turns:
+            return []
+
+        texts = [text for _, text in turns]
+        analyses = [self.llm.analyze_reality(text, "") for text in texts]
+        embeddings = self.embedding_model.encode_batch(texts)
+
+        return [
+            self._complete_turn(user_id, text, analysis, embedding)
+            for (user_id, text), analysis, embedding in zip(turns, analyses, embeddings)
+        ]
+
+    def search(self, user_id: str, embedding: List[float]) -> List[Dict]:
+        """
+        بازیابی واقعیت‌های مشابه کاربر طبق RETRIEVAL_MODE
+        """
+        if self.retrieval_mode == "diverse":
+            max_distance = 1 - SIMILARITY_THRESHOLD if RETRIEVAL_APPLY_THRESHOLD else None
+            return self.memory.search_diverse_realities(embedding, user_id, self.top_k,
+                                                        RETRIEVAL_CANDIDATE_MULTIPLIER,
+                                                        RETRIEVAL_MMR_LAMBDA,
+                                                        RETRIEVAL_DEDUP_DISTANCE,
+                                                        max_distance)
+        return self.memory.search_similar_realities(
+            embedding,
+            user_id=user_id,
+            n_results=self.top_k
+        )
+
+    def detect_shift(self,
+                     user_id: str,
+                     analysis: Dict[str, Any],
+                     embedding: List[float],
+                     similar: List[Dict]) -> Tuple[bool, Optional[str]]:
+        """
+        تشخیص واقعیت جدید؛ با موتور مسیر از وضعیت تجمعی کاربر و در غیر این صورت از نزدیک‌ترین همسایه
+        """
+        if self.tracker.trajectory is not None:
+            observation = self.tracker.observe(user_id, embedding, analysis)
+            return observation["is_new_reality"], observation["shift_description"]
+        return self.tracker.is_new_reality(analysis, similar), None
+
+    def _complete_turn(self,
+                       user_id: str,
+                       text: str,
+                       analysis: Dict[str, Any],
+                       embedding: List[float],
+                       on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """مراحل ۳ تا ۶ یک نوبت، پس از آماده شدن تحلیل و بردار"""
+        # مرحله 3: جستجوی مشابه‌ها
+        with metrics.span("turn_stage_seconds", stage="search"):
+            similar = self.search(user_id, embedding)
+
+        # مرحله 4: تشخیص تغییر
+        with metrics.span("turn_stage_seconds", stage="detect_shift"):
+            is_new, shift = self.detect_shift(user_id, analysis, embedding, similar)
+
+        # مرحله 5: ذخیره در حافظه
+        with metrics.span("turn_stage_seconds", stage="add_reality"):
+            doc_id = self.memory.add_reality(user_id, text, embedding, analysis)
+
+        # مرحله 6: تولید پاسخ
+        with metrics.span("turn_stage_seconds", stage="generate"):
+            if on_token is None:
+                response = self.llm.generate_response(text, analysis, similar, self.system_prompt)
+            else:
+                tokens = []
+                for token in self.llm.stream_response(text, analysis, similar, self.system_prompt):
+                    tokens.append(token)
+                    on_token(token)
+                response = "".join(tokens)
+
+        return {
+            "user_id": user_id,
+            "text": text,
+            "analysis": analysis,
+            "similar": similar,
+            "is_new_reality": is_new,
+            "shift_description": shift,
+            "doc_id": doc_id,
+            "response": response,
+            "timestamp": datetime.now().isoformat()
+        }
+
+
+class AsyncTurnPipeline:
+    """
+    نسخه asyncio موتور پردازش برای اجرای همزمان نوبت‌های چند کاربر
+
+    تحلیل و تبدیل به بردار همزمان اجرا می‌شوند، مراحل مسدودکننده در executor
+    اجرا می‌شوند و ذخیره در حافظه خارج از مسیر بحرانی پاسخ انجام می‌شود.
+    """
+    def __init__(self,
+                 pipeline: TurnPipeline,
+                 max_workers: int = 8,
+                 max_in_flight: int = 64):
+        self.pipeline = pipeline
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="turn")
+        self.max_in_flight = max_in_flight
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # آخرین نوشتن در حال انجام برای هر کاربر
+        self._pending_writes: Dict[str, asyncio.Task] = {}
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def process_turn(self, user_id: str, text: str) -> Dict[str, Any]:
+        """
+        پردازش یک پیام کاربر به صورت ناهمگام
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async with self._semaphore:
+            p = self.pipeline
+
+            # مرحله 1 و 2: تحلیل و تبدیل به بردار به صورت همزمان
+            analysis, embedding = await asyncio.gather(
+                self._run(metrics.wrap("turn_stage_seconds", p.llm.analyze_reality, stage="analyze"), text, ""),
+                self._run(metrics.wrap("turn_stage_seconds", p.embedding_model.encode, stage="encode"), text)
+            )
+
+            # نوشتن قبلی همین کاربر باید پیش از جستجو دیده شود
+            previous_write = self._pending_writes.get(user_id)
+            if previous_write is not None:
+                await asyncio.wait([previous_write])
+
+            # مرحله 3: جستجوی مشابه‌ها
+            similar = await self._run(
+                metrics.wrap("turn_stage_seconds", p.search, stage="search"), user_id, embedding
+            )
+
+            # مرحله 4: تشخیص تغییر
+            is_new, shift = await self._run(
+                metrics.wrap("turn_stage_seconds", p.detect_shift, stage="detect_shift"),
+                user_id, analysis, embedding, similar
+            )
+
+            # مرحله 5: ذخیره در حافظه بدون انتظار برای پایان آن
+            write = asyncio.ensure_future(
+                self._run(metrics.wrap("turn_stage_seconds", p.memory.add_reality, stage="add_reality"),
+                          user_id, text, embedding, analysis)
+            )
+            self._pending_writes[user_id] = write
+            write.add_done_callback(lambda task: self._forget_write(user_id, task))
+
+            # مرحله 6: تولید پاسخ
+            response = await self._run(
+                metrics.wrap("turn_stage_seconds", p.llm.generate_response, stage="generate"),
+                text, analysis, similar, p.system_prompt
+            )
+
+        return {
+            "user_id": user_id,
+            "text": text,
+            "analysis": analysis,
+            "similar": similar,
+            "is_new_reality": is_new,
+            "shift_description": shift,
+            "doc_id": None,
+            "response": response,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    async def process_turns(self, turns: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        پردازش همزمان چند پیام به صورت (user_id, text)
+        """
+        return list(await asyncio.gather(
+            *(self.process_turn(user_id, text) for user_id, text in turns)
+        ))
+
+    async def drain(self):
+        """
+        انتظار برای پایان همه نوشتن‌های در حال انجام
+        """
+        pending = list(self._pending_writes.values())
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def close(self):
+        await self.drain()
+        self.executor.shutdown(wait=True)
+
+    def _forget_write(self, user_id: str, task: asyncio.Task):
+        if self._pending_writes.get(user_id) is task:
+            del self._pending_writes[user_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("❌ ذخیره واقعیت ناموفق بود", extra={"user_id": user_id},
+                         exc_info=task.exception())
+
+
+def to_reality_entry(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    تبدیل خروجی یک نوبت به ردیف تاریخچه واقعیت‌ها برای نمایش
+    """
+    analysis = result["analysis"]
+    return {
+        "timestamp": result["timestamp"],
+        "emotional_state": analysis.get("emotional_state", "نامشخص"),
+        "beliefs": ", ".join(analysis.get("beliefs", [])),
+        "cognitive_needs": analysis.get("cognitive_needs", ""),
+        "is_new_reality": result["is_new_reality"]
+    }
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# ماژول‌ها با نام‌های memory.* و utils.* وارد می‌شوند (models/prompts/memory و زیرپوشه utils آن)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "models", "prompts"), os.path.join(ROOT, "models", "prompts", "memory")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from memory.compact_store import CompactRealityMemory
+
+
+def _records(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "id": f"doc{i}",
+            "user_id": f"u{i % 3}",
+            "text": f"واقعیت {i}",
+            "embedding": rng.standard_normal(32).tolist()
+        }
+        for i in range(count)
+    ]
+
+
+def _top(memory, query, user_id=None):
+    return [(r["id"], round(r["distance"], 5))
+            for r in memory.search_similar_realities(query, user_id=user_id, n_results=5)]
+
+
+@pytest.mark.parametrize("vector_dtype", ["float16", "int8"])
+def test_reopened_store_returns_the_same_top_k(tmp_path, vector_dtype):
+    memory = CompactRealityMemory(str(tmp_path), "realities", vector_dtype)
+    memory.add_realities_bulk(_records(200), chunk_size=64, on_progress=lambda *_: None)
+    queries = np.random.default_rng(1).standard_normal((4, 32))
+    before = [(_top(memory, q), _top(memory, q, "u1")) for q in queries]
+    memory.close()
+
+    reopened = CompactRealityMemory(str(tmp_path), "realities", vector_dtype)
+    assert reopened.count() == 200
+    assert [(_top(reopened, q), _top(reopened, q, "u1")) for q in queries] == before
+    reopened.close()
+
+
+def test_duplicate_ids_in_one_chunk_keep_the_last_record(tmp_path):
+    memory = CompactRealityMemory(str(tmp_path), "realities")
+    first, second = _records(2)
+    second = dict(second, id=first["id"], user_id=first["user_id"])
+
+    report = memory.add_realities_bulk([first, second], on_progress=lambda *_: None)
+    assert (report["rows"], memory.count()) == (2, 1)
+    assert [item["text"] for item in memory.iter_user_history(first["user_id"])] == [second["text"]]
+    memory.close()
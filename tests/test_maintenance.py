@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from memory.vector_store import RealityMemory
+from memory.sharded_store import ShardedRealityMemory
+from memory.maintenance import RetentionPolicy, compact_memory
+
+
+def _old_records(user_id, count, seed, days=200):
+    rng = np.random.default_rng(seed)
+    base = np.ones(16)
+    return [
+        {
+            "user_id": user_id,
+            "text": f"واقعیت قدیمی {seed}-{i}",
+            "embedding": (base + 0.01 * rng.standard_normal(16)).tolist(),
+            "timestamp": (datetime.now() - timedelta(days=days, minutes=i)).isoformat()
+        }
+        for i in range(count)
+    ]
+
+
+def test_compacting_twice_keeps_summary(tmp_path):
+    memory = RealityMemory(str(tmp_path), "realities")
+    policy = RetentionPolicy(max_age_days=90, keep_recent=0)
+
+    memory.add_realities_bulk(_old_records("u1", 5, seed=1), on_progress=lambda *_: None)
+    first = compact_memory(memory, policy)
+    assert (first["removed"], first["added"], memory.count()) == (5, 1, 1)
+
+    memory.add_realities_bulk(_old_records("u1", 3, seed=2), on_progress=lambda *_: None)
+    second = compact_memory(memory, policy)
+    assert (second["removed"], second["added"], memory.count()) == (4, 1, 1)
+
+    history = memory.get_user_history("u1")
+    assert len(history) == 1
+    assert history[0]["metadata"]["merged_count"] == 8
+
+
+def test_users_are_compacted_in_their_own_shard(tmp_path):
+    memory = ShardedRealityMemory(str(tmp_path), "realities", 4)
+    for user_id in ("u1", "u2"):
+        memory.add_realities_bulk(_old_records(user_id, 4, seed=3), on_progress=lambda *_: None)
+
+    report = compact_memory(memory, RetentionPolicy(max_age_days=90, keep_recent=0), users=["u1"])
+    assert (report["users"], report["removed"], report["added"]) == (1, 4, 1)
+    assert sum(shard.count() for shard in memory.shards) == 5
@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+from memory.timeline_index import TimelineIndex
+
+
+def _walk(timeline, user_id, limit, descending=True):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = timeline.page(user_id, limit, cursor, descending)
+        seen.extend(doc_id for _, doc_id in rows)
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_cursor_paging_has_no_duplicates_or_gaps(tmp_path, descending):
+    timeline = TimelineIndex(str(tmp_path / "timeline.sqlite3"))
+    # زمان‌های تکراری تا ترتیب دوم (doc_id) هم آزموده شود
+    timeline.add_many(("u1", float(i // 3), f"doc{i:02d}") for i in range(25))
+    timeline.add_many(("u2", float(i), f"other{i}") for i in range(5))
+
+    # نوشتن دوباره یک شناسه با زمان جدید جای ردیف قبلی را می‌گیرد
+    timeline.add("u1", 100.0, "doc04")
+    timeline.add_many([("u1", 50.0, "doc05"), ("u1", 60.0, "doc05")])
+
+    for limit in (1, 4, 7, 25, 30):
+        seen = _walk(timeline, "u1", limit, descending)
+        assert len(seen) == len(set(seen)) == 25
+    assert timeline.count("u1") == 25
+    newest = _walk(timeline, "u1", 2, True)
+    assert newest[:2] == ["doc04", "doc05"]
+    timeline.close()
+
+
+def test_duplicate_rows_from_older_files_are_removed_on_open(tmp_path):
+    path = str(tmp_path / "timeline.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE timeline (user_id TEXT NOT NULL, ts REAL NOT NULL, doc_id TEXT NOT NULL,"
+               " PRIMARY KEY (user_id, ts, doc_id)) WITHOUT ROWID")
+    db.executemany("INSERT INTO timeline VALUES (?, ?, ?)",
+                   [("u1", 1.0, "a"), ("u1", 5.0, "a"), ("u1", 2.0, "b")])
+    db.commit()
+    db.close()
+
+    timeline = TimelineIndex(path)
+    assert timeline.page("u1", 10)[0] == [(5.0, "a"), (2.0, "b")]
+    timeline.close()
@@ -0,0 +1,72 @@
+import threading
+
+import numpy as np
+
+from memory.vector_store import RealityMemory
+from memory.user_index import UserVectorIndex
+
+
+def _records(user_id, count, seed):
+    rng = np.random.default_rng(seed)
+    return [{"user_id": user_id, "text": f"واقعیت {user_id}-{i}", "embedding": rng.standard_normal(16).tolist()}
+            for i in range(count)]
+
+
+def _ids(results):
+    return [result["id"] for result in results]
+
+
+def test_evicted_user_is_reloaded_with_new_rows(tmp_path):
+    # بودجه فقط برای یک کاربر کافی است
+    memory = RealityMemory(str(tmp_path), "realities", use_user_index=True, user_index_budget_mb=0.005)
+    plain = RealityMemory(str(tmp_path), "realities")
+    for seed, user_id in enumerate(("u1", "u2")):
+        memory.add_realities_bulk(_records(user_id, 5, seed), on_progress=lambda *_: None)
+    query = np.random.default_rng(9).standard_normal(16)
+
+    memory.search_similar_realities(query, "u1")
+    memory.search_similar_realities(query, "u2")
+    assert memory.user_index.stats()["evictions"] >= 1
+
+    # کاربر حذف‌شده از حافظه در این فاصله داده جدید می‌گیرد
+    doc_id = memory.add_reality("u1", "واقعیت تازه", query.tolist(), {"emotional_state": "آرام"})
+    results = memory.search_similar_realities(query, "u1")
+    assert results[0]["id"] == doc_id
+    assert _ids(results) == _ids(plain.search_similar_realities(query, "u1"))
+    assert memory.user_index.stats()["loads"] == 3
+
+
+class _BlockingCollection:
+    """مجموعه‌ای که نتیجه get را تا اجازه آزمون برنمی‌گرداند"""
+    def __init__(self, collection):
+        self.collection = collection
+        self.loading = threading.Event()
+        self.release = threading.Event()
+
+    def get(self, **kwargs):
+        results = self.collection.get(**kwargs)
+        self.loading.set()
+        self.release.wait(timeout=10)
+        return results
+
+
+def test_rows_added_during_a_load_are_not_lost(tmp_path):
+    memory = RealityMemory(str(tmp_path), "realities")
+    memory.add_realities_bulk(_records("u1", 3, seed=0), on_progress=lambda *_: None)
+    collection = _BlockingCollection(memory.collection)
+    index = UserVectorIndex(collection)
+    query = np.random.default_rng(9).standard_normal(16)
+
+    searcher = threading.Thread(target=index.search, args=("u1", query))
+    searcher.start()
+    assert collection.loading.wait(timeout=10)
+
+    # ردیف جدید پس از خواندن مجموعه و پیش از ثبت ایندکس کاربر می‌رسد
+    doc_id = memory.add_reality("u1", "واقعیت تازه", query.tolist(), {"emotional_state": "آرام"})
+    index.add("u1", doc_id, "واقعیت تازه", query, {"user_id": "u1"})
+
+    collection.release.set()
+    searcher.join(timeout=10)
+
+    assert index.search("u1", query, 1)[0]["id"] == doc_id
+    assert index.stats()["loads"] == 2
@@ -0,0 +1,42 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from memory.vector_store import RealityMemory
+from memory.compact_store import CompactRealityMemory
+from memory.write_behind import WriteBehindMemory
+
+STORES = {
+    "chroma": lambda path: RealityMemory(path, "realities"),
+    "compact": lambda path: CompactRealityMemory(path, "realities")
+}
+
+
+def _history_ids(memory, user_id):
+    return [item["id"] for item in memory.iter_user_history(user_id)]
+
+
+@pytest.mark.parametrize("storage", sorted(STORES))
+def test_replaying_an_already_flushed_log_adds_no_duplicates(tmp_path, storage):
+    store_dir, log_dir, backup_dir = (str(tmp_path / name) for name in ("store", "log", "backup"))
+    rng = np.random.default_rng(0)
+
+    memory = WriteBehindMemory(STORES[storage](store_dir), log_dir, flush_interval_ms=60000)
+    doc_ids = [memory.add_reality("u1", f"واقعیت {i}", rng.standard_normal(16), {"emotional_state": "آرام"})
+               for i in range(5)]
+
+    # قطع برنامه پس از ثبت در حافظه و پیش از حذف لاگ: بخش‌های لاگ پس از close برگردانده می‌شوند
+    shutil.copytree(log_dir, backup_dir)
+    memory.close()
+    for name in os.listdir(backup_dir):
+        shutil.copy(os.path.join(backup_dir, name), log_dir)
+
+    for _ in range(2):
+        reopened = WriteBehindMemory(STORES[storage](store_dir), log_dir, flush_interval_ms=60000)
+        assert sorted(_history_ids(reopened, "u1")) == sorted(doc_ids)
+        assert reopened.count() == len(doc_ids)
+        reopened.close()
+        for name in os.listdir(backup_dir):
+            shutil.copy(os.path.join(backup_dir, name), log_dir)
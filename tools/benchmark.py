@@ -0,0 +1,312 @@
+"""
+بنچمارک سرتاسری مراحل یک نوبت گفتگو
+
+برای هر اندازه حافظه، پایگاه موقتی با پیکره مصنوعی پر می‌شود و سپس زمان هر
+مرحله (analyze_reality، encode، encode_batch، search_similar_realities،
+search_diverse_realities، is_new_reality، add_reality، generate_response) و کل
+نوبت در سطوح مختلف همزمانی اندازه‌گیری می‌شود. نتیجه JSON است و می‌تواند با یک baseline مقایسه شود؛ در
+صورت کندتر شدن بیش از حد مجاز، کد خروج ۱ برمی‌گردد.
+
+اجرا:
+    python -m tools.benchmark --sizes 1000,10000,100000 --concurrency 1,4,16 --output bench.json
+    python -m tools.benchmark --baseline bench_baseline.json --tolerance 0.2
+    python -m tools.benchmark --embedder real --llm stub --sizes 1000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Callable
+
+import numpy as np
+
+from config import *
+from models.llm_interface import LLMInterface
+from utils.reality_tracker import RealityTracker
+from pipeline import TurnPipeline
+from tools.fakes import FakeEmbeddingModel
+from tools.synthetic_corpus import generate_messages, generate_records
+
+
+@contextlib.contextmanager
+def _quiet():
+    """ساکت کردن پیام‌های وضعیت اجزا هنگام اندازه‌گیری"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """
+    خلاصه آماری زمان‌ها (میلی‌ثانیه)
+    """
+    values = np.asarray(samples_ms, dtype=np.float64)
+    if values.size == 0:
+        return {"n": 0}
+    return {
+        "n": int(values.size),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max())
+    }
+
+
+def _timed(samples: Dict[str, List[float]], stage: str, fn: Callable, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.setdefault(stage, []).append((time.perf_counter() - started) * 1000.0)
+    return result
+
+
+def make_embedder(kind: str):
+    if kind == "real":
+        from pipeline import load_embedding_model
+        return load_embedding_model()
+    return FakeEmbeddingModel()
+
+
+def make_llm(kind: str, stub_server=None) -> LLMInterface:
+    if kind == "stub":
+        from models.llm_backends import OpenAICompatibleBackend
+        from tools.stub_llm_server import base_url_of
+
+        backend = OpenAICompatibleBackend("stub", base_url=base_url_of(stub_server), model="stub",
+                                          max_concurrency=64)
+        return LLMInterface(use_local=False, backend=backend)
+    return LLMInterface(use_local=True)
+
+
+def build_bench_memory(storage: str, directory: str, user_index: bool, write_behind: bool = False):
+    if storage == "compact":
+        from memory.compact_store import CompactRealityMemory
+        memory = CompactRealityMemory(directory, "bench", MEMORY_VECTOR_DTYPE, MEMORY_KEEP_EXACT_VECTORS,
+                                      MEMORY_RERANK_FACTOR)
+    else:
+        from memory.vector_store import RealityMemory
+        memory = RealityMemory(directory, "bench", use_user_index=user_index)
+    if write_behind:
+        from memory.write_behind import WriteBehindMemory
+        memory = WriteBehindMemory(memory, os.path.join(directory, "write_behind"),
+                                   MEMORY_WRITE_BEHIND_MAX_PENDING, MEMORY_WRITE_BEHIND_BATCH,
+                                   MEMORY_WRITE_BEHIND_INTERVAL_MS, MEMORY_WRITE_BEHIND_FSYNC)
+    return memory
+
+
+def run_size(size: int, args, embedder, llm) -> Dict[str, Any]:
+    """
+    بنچمارک یک اندازه حافظه
+    """
+    directory = tempfile.mkdtemp(prefix=f"bench_{size}_", dir=args.work_dir)
+    memory = None
+    try:
+        with _quiet():
+            memory = build_bench_memory(args.storage, directory, args.user_index, args.write_behind)
+
+        # پر کردن حافظه با پیکره مصنوعی
+        num_users = max(1, size // args.realities_per_user)
+        started = time.perf_counter()
+
+        def with_analysis(records):
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) == 1024:
+                    for r, analysis in zip(batch, llm.analyze_many([r["text"] for r in batch])):
+                        r["analysis"] = analysis
+                    yield from batch
+                    batch = []
+            for r, analysis in zip(batch, llm.analyze_many([r["text"] for r in batch])):
+                r["analysis"] = analysis
+            yield from batch
+
+        memory.add_realities_bulk(with_analysis(generate_records(size, num_users, args.seed)),
+                                  embedding_model=embedder, chunk_size=2048,
+                                  on_progress=lambda *_: None)
+        preload_seconds = time.perf_counter() - started
+        print(f"📦 اندازه {size}: {preload_seconds:.1f} ثانیه بارگذاری ({size / preload_seconds:.0f} ردیف در ثانیه)")
+
+        rng = random.Random(args.seed + size)
+        queries = generate_messages(args.queries, seed=args.seed + 1)
+        users = [f"user_{rng.randrange(num_users):06d}" for _ in queries]
+        tracker = RealityTracker(SIMILARITY_THRESHOLD)
+
+        # زمان هر مرحله، به ترتیب اجرای یک نوبت
+        samples: Dict[str, List[float]] = {}
+        with _quiet():
+            embeddings = []
+            for user_id, text in zip(users, queries):
+                analysis = _timed(samples, "analyze_reality", llm.analyze_reality, text, "")
+                embedding = _timed(samples, "encode", embedder.encode, text)
+                embeddings.append(embedding)
+                similar = _timed(samples, "search_user", memory.search_similar_realities,
+                                 embedding, user_id=user_id, n_results=TOP_K_RESULTS)
+                _timed(samples, "search_global", memory.search_similar_realities,
+                       embedding, user_id=None, n_results=TOP_K_RESULTS)
+                _timed(samples, "is_new_reality", tracker.is_new_reality, analysis, similar)
+                _timed(samples, "add_reality", memory.add_reality, user_id, text, embedding, analysis)
+                _timed(samples, "generate_response", llm.generate_response, text, analysis, similar, "")
+            # هزینه بازیابی متنوع (نامزدهای بیشتر + حذف تکراری + MMR) در برابر top-k ساده،
+            # هر دو پس از گرم شدن ایندکس کاربران
+            for user_id, embedding in zip(users, embeddings):
+                _timed(samples, "search_topk_warm", memory.search_similar_realities,
+                       embedding, user_id=user_id, n_results=TOP_K_RESULTS)
+                _timed(samples, "search_diverse", memory.search_diverse_realities,
+                       embedding, user_id, TOP_K_RESULTS, RETRIEVAL_CANDIDATE_MULTIPLIER,
+                       RETRIEVAL_MMR_LAMBDA, RETRIEVAL_DEDUP_DISTANCE)
+            for start in range(0, len(queries), args.batch_size):
+                batch = queries[start:start + args.batch_size]
+                _timed(samples, "encode_batch", embedder.encode_batch, batch)
+
+        stages = {stage: summarize(values) for stage, values in samples.items()}
+
+        # کل نوبت در سطوح مختلف همزمانی
+        pipeline = TurnPipeline(embedder, memory, llm, tracker, "", TOP_K_RESULTS)
+        concurrency: Dict[str, Any] = {}
+        for level in args.concurrency:
+            latencies: List[float] = []
+
+            def one_turn(turn):
+                started = time.perf_counter()
+                pipeline.process_turn(*turn)
+                latencies.append((time.perf_counter() - started) * 1000.0)
+
+            turns = list(zip(users, queries))
+            with _quiet():
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=level) as pool:
+                    list(pool.map(one_turn, turns))
+                elapsed = time.perf_counter() - started
+            concurrency[str(level)] = dict(summarize(latencies), turns_per_sec=len(turns) / elapsed)
+            print(f"   همزمانی {level}: {len(turns) / elapsed:.1f} نوبت در ثانیه، "
+                  f"p95 = {concurrency[str(level)]['p95']:.1f}ms")
+
+        return {
+            "size": size,
+            "users": num_users,
+            "preload_seconds": preload_seconds,
+            "preload_rows_per_sec": size / preload_seconds if preload_seconds > 0 else 0.0,
+            "stages": stages,
+            "concurrency": concurrency
+        }
+    finally:
+        if args.write_behind and memory is not None:
+            memory.close()
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> List[Dict[str, Any]]:
+    """
+    مقایسه p95 هر مرحله و توان عملیاتی هر سطح همزمانی با baseline
+
+    خروجی فهرست پسرفت‌هاست (p95 بیشتر یا توان عملیاتی کمتر از حد مجاز)
+    """
+    regressions = []
+    base_by_size = {entry["size"]: entry for entry in baseline.get("results", [])}
+    for entry in results["results"]:
+        base = base_by_size.get(entry["size"])
+        if base is None:
+            continue
+        for stage, stats in entry["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if base_stats and base_stats.get("p95") and stats.get("p95", 0) > base_stats["p95"] * (1 + tolerance):
+                regressions.append({"size": entry["size"], "metric": f"{stage}.p95",
+                                    "baseline": base_stats["p95"], "current": stats["p95"]})
+        for level, stats in entry["concurrency"].items():
+            base_stats = base["concurrency"].get(level)
+            if not base_stats:
+                continue
+            if stats["p95"] > base_stats["p95"] * (1 + tolerance):
+                regressions.append({"size": entry["size"], "metric": f"concurrency_{level}.p95",
+                                    "baseline": base_stats["p95"], "current": stats["p95"]})
+            if stats["turns_per_sec"] < base_stats["turns_per_sec"] / (1 + tolerance):
+                regressions.append({"size": entry["size"], "metric": f"concurrency_{level}.turns_per_sec",
+                                    "baseline": base_stats["turns_per_sec"], "current": stats["turns_per_sec"]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک سرتاسری مراحل نوبت گفتگو")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="اندازه‌های حافظه، جداشده با کاما (تا 1000000)")
+    parser.add_argument("--concurrency", default="1,4,16", help="سطوح همزمانی، جداشده با کاما")
+    parser.add_argument("--queries", type=int, default=200, help="تعداد نوبت‌های اندازه‌گیری در هر اندازه")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--realities-per-user", type=int, default=50)
+    parser.add_argument("--embedder", choices=["fake", "real"], default="fake")
+    parser.add_argument("--llm", choices=["local", "stub"], default="local")
+    parser.add_argument("--storage", choices=["chroma", "compact"], default=MEMORY_STORAGE)
+    parser.add_argument("--user-index", action="store_true", default=MEMORY_USER_INDEX)
+    parser.add_argument("--write-behind", action="store_true", default=MEMORY_WRITE_BEHIND,
+                        help="درج با صف و ثبت گروهی در پس‌زمینه")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="پوشه پایگاه‌های موقت")
+    parser.add_argument("--keep", action="store_true", help="پایگاه‌های موقت پاک نشوند")
+    parser.add_argument("--output", default=None, help="فایل JSON نتایج")
+    parser.add_argument("--baseline", default=None, help="فایل JSON نتایج مرجع برای مقایسه")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="کندی مجاز نسبت به baseline (0.2 = ۲۰٪)")
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+
+    stub_server = None
+    if args.llm == "stub":
+        from tools.stub_llm_server import start_stub_server
+        stub_server = start_stub_server()
+
+    embedder = make_embedder(args.embedder)
+    llm = make_llm(args.llm, stub_server)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedder": args.embedder,
+            "llm": args.llm,
+            "storage": args.storage,
+            "user_index": args.user_index,
+            "write_behind": args.write_behind,
+            "queries": args.queries,
+            "seed": args.seed
+        },
+        "results": [run_size(size, args, embedder, llm) for size in args.sizes]
+    }
+
+    if stub_server is not None:
+        stub_server.shutdown()
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"💾 نتایج در {args.output} ذخیره شد.")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} پسرفت نسبت به baseline:")
+            for regression in regressions:
+                print(f"   اندازه {regression['size']} - {regression['metric']}: "
+                      f"{regression['baseline']:.2f} ← {regression['current']:.2f}")
+            sys.exit(1)
+        print("✅ پسرفتی نسبت به baseline دیده نشد.")
+
+
+if __name__ == "__main__":
+    main()
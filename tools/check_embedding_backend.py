@@ -0,0 +1,41 @@
+"""
+مقایسه دقت و سرعت backendهای PersianEmbeddingModel با مدل float32
+
+اجرا:
+    python -m tools.check_embedding_backend --backend int8 --texts samples.txt
+"""
+import argparse
+import json
+
+from config import *
+from models.embedding_model import PersianEmbeddingModel, EMBEDDING_BACKENDS
+from models.embedding_accuracy import DEFAULT_SAMPLE_TEXTS, check_backend, is_acceptable
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بررسی انحراف backend مدل embedding نسبت به float32")
+    parser.add_argument("--backend", choices=[b for b in EMBEDDING_BACKENDS if b != "torch"], default="int8")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--texts", default=None, help="فایل متنی با یک جمله در هر خط (پیش‌فرض: نمونه داخلی)")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = DEFAULT_SAMPLE_TEXTS
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    reference = PersianEmbeddingModel(args.model, EMBEDDING_SNAPSHOT_DIR, "torch")
+    candidate = PersianEmbeddingModel(args.model, EMBEDDING_SNAPSHOT_DIR, args.backend)
+    report = check_backend(reference, candidate, texts, SIMILARITY_THRESHOLD, args.repeats)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if is_acceptable(report, EMBEDDING_MAX_DRIFT, EMBEDDING_MIN_AGREEMENT):
+        print(f"✅ backend {args.backend} در محدوده مجاز است ({report['speedup']:.1f}× سریع‌تر).")
+    else:
+        print(f"⚠️ backend {args.backend} بیش از حد مجاز منحرف است "
+              f"({report['decision_flips']} تصمیم از {report['pairs']} جفت تغییر کرد).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+نگه‌داری حافظه واقعیت‌ها: خلاصه‌سازی واقعیت‌های قدیمی و فشرده‌سازی پایگاه
+
+واقعیت‌های قدیمی‌تر از --max-age-days هر کاربر (به جز --keep-recent واقعیت آخر) خوشه‌بندی
+می‌شوند و هر خوشه مشابه با یک واقعیت خلاصه جایگزین می‌شود؛ سپس فایل‌های SQLite فشرده می‌شوند.
+پیش از اجرا (بدون --no-vacuum یا --dry-run) برنامه و سرویس حافظه را متوقف کنید.
+
+مثال‌ها:
+    # پیش‌نمایش بدون تغییر
+    python -m tools.compact_memory --dry-run
+
+    # حافظه ۸ shard، فقط واقعیت‌های قدیمی‌تر از ۳۰ روز
+    python -m tools.compact_memory --shards 8 --max-age-days 30
+"""
+import argparse
+
+from config import *
+from utils.structured_logging import configure_logging
+from memory.vector_store import RealityMemory
+from memory.sharded_store import ShardedRealityMemory
+from memory.maintenance import RetentionPolicy, compact_memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="خلاصه‌سازی واقعیت‌های قدیمی و فشرده‌سازی حافظه")
+    parser.add_argument("--persist-dir", default=CHROMA_PERSIST_DIR)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--shards", type=int, default=MEMORY_NUM_SHARDS if MEMORY_NUM_SHARDS > 1 else 0,
+                        help="تعداد shardها (۰ یعنی یک مجموعه تکی)")
+    parser.add_argument("--separate-dirs", action="store_true", default=MEMORY_SHARD_SEPARATE_DIRS)
+    parser.add_argument("--max-age-days", type=float, default=MEMORY_RETENTION_DAYS)
+    parser.add_argument("--keep-recent", type=int, default=MEMORY_RETENTION_KEEP_RECENT)
+    parser.add_argument("--cluster-distance", type=float, default=MEMORY_COMPACTION_DISTANCE)
+    parser.add_argument("--min-cluster-size", type=int, default=MEMORY_COMPACTION_MIN_CLUSTER)
+    parser.add_argument("--user", action="append", default=None, help="فقط این کاربر (قابل تکرار)")
+    parser.add_argument("--dry-run", action="store_true", help="فقط گزارش، بدون تغییر پایگاه")
+    parser.add_argument("--no-vacuum", action="store_true", help="فایل‌های SQLite فشرده نشوند")
+    args = parser.parse_args()
+    configure_logging(LOG_LEVEL, LOG_JSON)
+
+    if args.shards:
+        memory = ShardedRealityMemory(args.persist_dir, args.collection, args.shards, args.separate_dirs)
+    else:
+        memory = RealityMemory(args.persist_dir, args.collection)
+
+    policy = RetentionPolicy(args.max_age_days, args.keep_recent, args.cluster_distance, args.min_cluster_size)
+    report = compact_memory(memory, policy, users=args.user, vacuum=not args.no_vacuum, dry_run=args.dry_run)
+
+    prefix = "🔍 (پیش‌نمایش) " if args.dry_run else "✅ "
+    print(f"{prefix}{report['scanned']} واقعیت قدیمی از {report['users']} کاربر بررسی شد؛ "
+          f"{report['removed']} واقعیت در {report['added']} خلاصه ادغام شد "
+          f"({report['users_compacted']} کاربر، {report['seconds']:.1f} ثانیه).")
+    print(f"📊 بردارها: {report['vectors_before']} ← {report['vectors_after']} | "
+          f"حجم: {report['bytes_before'] / (1024 * 1024):.1f}MB ← {report['bytes_after'] / (1024 * 1024):.1f}MB "
+          f"({report['bytes_reclaimed'] / (1024 * 1024):.1f}MB آزاد شد)")
+
+
+if __name__ == "__main__":
+    main()
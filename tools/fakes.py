@@ -0,0 +1,50 @@
+"""
+جایگزین‌های سبک اجزای سنگین برای بنچمارک و آزمون بار بدون دانلود مدل
+"""
+import hashlib
+import time
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+
+class FakeEmbeddingModel:
+    """
+    مدل embedding قطعی بر پایه هش واژه‌ها (مجموع بردار تصادفی هر واژه)
+
+    متن‌های با واژه‌های مشترک بردارهای نزدیک دارند، پس جستجو و تشخیص تغییر
+    رفتاری شبیه مدل واقعی دارند. cost_ms هزینه محاسبه هر متن را شبیه‌سازی می‌کند.
+    """
+    def __init__(self, dim: int = 384, cost_ms: float = 0.0):
+        self.dim = dim
+        self.cost_ms = cost_ms
+        self.model_name = f"fake-{dim}"
+        self.backend = "fake"
+        self._word_vector = lru_cache(maxsize=100000)(self._make_word_vector)
+
+    def _make_word_vector(self, word: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:8], "big")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+
+    def _vector(self, text: str) -> np.ndarray:
+        words = text.split() or [""]
+        vector = np.sum([self._word_vector(word) for word in words], axis=0)
+        return (vector / max(float(np.linalg.norm(vector)), 1e-12)).astype(np.float32)
+
+    def _spend(self, count: int):
+        if self.cost_ms > 0:
+            time.sleep(self.cost_ms * count / 1000.0)
+
+    def encode(self, text: str) -> np.ndarray:
+        self._spend(1)
+        return self._vector(text)
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        self._spend(len(texts))
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.stack([self._vector(text) for text in texts])
+
+    def encode_array(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self.encode_batch(texts)
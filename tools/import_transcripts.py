@@ -0,0 +1,61 @@
+"""
+ورود انبوه گفتگوهای قدیمی به حافظه واقعیت‌ها
+
+ورودی: فایل JSONL که هر خط آن {"user_id": ..., "text": ..., "timestamp"?: ...} است.
+رکوردهای بدون analysis با واژگان LLMInterface تحلیل می‌شوند. حافظه (shardها، ذخیره‌سازی
+فشرده، نوشتن با تأخیر) و مدل embedding (backend و کش) مانند برنامه از config.py ساخته می‌شوند.
+
+اجرا:
+    python -m tools.import_transcripts sessions.jsonl --chunk-size 512
+"""
+import argparse
+import json
+from itertools import islice
+from typing import Dict, Any, Iterator
+
+from config import *
+from utils.structured_logging import configure_logging
+from models.llm_interface import LLMInterface
+from pipeline import build_embedding_model, build_memory
+
+
+def read_records(path: str, llm: LLMInterface, chunk_size: int) -> Iterator[Dict[str, Any]]:
+    """خواندن جریانی رکوردها و افزودن تحلیل به صورت دسته‌ای"""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = (json.loads(line) for line in f if line.strip())
+        while True:
+            chunk = list(islice(lines, chunk_size))
+            if not chunk:
+                break
+            pending = [record for record in chunk if not record.get("analysis")]
+            for record, analysis in zip(pending, llm.analyze_many([r["text"] for r in pending])):
+                record["analysis"] = analysis
+            yield from chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ورود انبوه گفتگوهای قدیمی")
+    parser.add_argument("path", help="فایل JSONL رکوردها")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    args = parser.parse_args()
+    configure_logging(LOG_LEVEL, LOG_JSON)
+
+    embedding_model = build_embedding_model()
+    memory = build_memory()
+    llm = LLMInterface(use_local=True)
+
+    try:
+        report = memory.add_realities_bulk(
+            read_records(args.path, llm, args.chunk_size),
+            embedding_model=embedding_model,
+            chunk_size=args.chunk_size
+        )
+    finally:
+        if MEMORY_WRITE_BEHIND:
+            memory.close()
+    print(f"✅ {report['rows']} واقعیت در {report['seconds']:.1f} ثانیه وارد شد "
+          f"({report['rows_per_sec']:.0f} ردیف در ثانیه).")
+
+
+if __name__ == "__main__":
+    main()
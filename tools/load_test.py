@@ -0,0 +1,251 @@
+"""
+آزمون بار چندکاربره روی موتور پردازش نوبت‌ها (بدون رابط Streamlit)
+
+هزاران جلسه کودک به صورت همزمان شبیه‌سازی می‌شوند: هر جلسه پیام فارسی مصنوعی
+می‌فرستد، منتظر پاسخ می‌ماند و پس از زمان فکر کردن (توزیع نمایی) پیام بعدی را
+می‌فرستد. مدل embedding قطعی و LLM محلی یا سرور stub به جای اجزای واقعی
+استفاده می‌شوند تا حافظه و بازیابی به تنهایی زیر فشار قرار گیرند. در هر بازه،
+توان عملیاتی، صدک‌های تأخیر، حافظه مقیم فرایند و اندازه حافظه واقعیت‌ها گزارش می‌شود.
+
+اجرا:
+    python -m tools.load_test --sessions 2000 --duration 120 --think-time 3
+    python -m tools.load_test --sessions 500 --llm stub --storage compact --write-behind --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Any
+
+from config import *
+from utils.reality_tracker import RealityTracker
+from pipeline import TurnPipeline, AsyncTurnPipeline
+from tools.benchmark import summarize, make_embedder, make_llm, build_bench_memory, _quiet
+from tools.fakes import FakeEmbeddingModel
+from tools.synthetic_corpus import generate_message, generate_records
+
+
+def rss_mb() -> float:
+    """
+    حافظه مقیم فعلی فرایند (مگابایت)؛ در سیستم‌های بدون /proc بیشینه آن
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+class LoadStats:
+    """
+    نتایج نوبت‌ها؛ برای هر بازه نمونه‌برداری جداگانه و برای کل آزمون
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.latencies: List[float] = []
+        self.window: List[float] = []
+        self.errors = 0
+        self.window_errors = 0
+        self.error_types: Counter = Counter()
+        self.active_sessions = 0
+        self.timeline: List[Dict[str, Any]] = []
+        self._last_sample = self.started
+
+    def record(self, latency_ms: float):
+        self.latencies.append(latency_ms)
+        self.window.append(latency_ms)
+
+    def record_error(self, error: Exception):
+        self.errors += 1
+        self.window_errors += 1
+        self.error_types[f"{type(error).__name__}: {str(error)[:120]}"] += 1
+
+    def sample(self, memory) -> Dict[str, Any]:
+        now = time.perf_counter()
+        interval = now - self._last_sample
+        stats = summarize(self.window)
+        entry = {
+            "elapsed": round(now - self.started, 2),
+            "turns": len(self.window),
+            "turns_per_sec": len(self.window) / interval if interval > 0 else 0.0,
+            "p50": stats.get("p50"),
+            "p95": stats.get("p95"),
+            "p99": stats.get("p99"),
+            "errors": self.window_errors,
+            "active_sessions": self.active_sessions,
+            "rss_mb": rss_mb(),
+            "realities": memory.count()
+        }
+        self.timeline.append(entry)
+        self.window = []
+        self.window_errors = 0
+        self._last_sample = now
+        return entry
+
+
+async def run_session(index: int,
+                      pipeline: AsyncTurnPipeline,
+                      stats: LoadStats,
+                      args,
+                      deadline: float):
+    """
+    یک جلسه کودک: پیام، انتظار پاسخ، زمان فکر کردن، تا پایان آزمون
+    """
+    rng = random.Random(args.seed * 1000003 + index)
+    user_id = f"child_{index:06d}"
+    # ورود تدریجی جلسه‌ها در طول ramp_up
+    await asyncio.sleep(rng.uniform(0, args.ramp_up))
+
+    stats.active_sessions += 1
+    turns = 0
+    try:
+        while time.perf_counter() < deadline and (not args.turns_per_session or turns < args.turns_per_session):
+            text = generate_message(rng, args.max_clauses, args.clause_rate)
+            started = time.perf_counter()
+            try:
+                await pipeline.process_turn(user_id, text)
+                stats.record((time.perf_counter() - started) * 1000.0)
+            except Exception as error:
+                stats.record_error(error)
+            turns += 1
+            think = rng.expovariate(1.0 / args.think_time) if args.think_time > 0 else 0.0
+            await asyncio.sleep(min(think, max(0.0, deadline - time.perf_counter())))
+    finally:
+        stats.active_sessions -= 1
+
+
+async def sampler(stats: LoadStats, memory, interval: float, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        entry = stats.sample(memory)
+        print(f"⏱️ {entry['elapsed']:7.1f}s | {entry['turns_per_sec']:7.1f} نوبت/ثانیه | "
+              f"p95 {entry['p95'] or 0:8.1f}ms | p99 {entry['p99'] or 0:8.1f}ms | "
+              f"جلسه فعال {entry['active_sessions']:5d} | خطا {entry['errors']:3d} | "
+              f"RSS {entry['rss_mb']:7.1f}MB | واقعیت‌ها {entry['realities']}")
+
+
+async def run_load(args, pipeline: AsyncTurnPipeline, memory) -> LoadStats:
+    stats = LoadStats()
+    deadline = stats.started + args.duration
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(sampler(stats, memory, args.sample_interval, stop))
+    await asyncio.gather(*(run_session(i, pipeline, stats, args, deadline) for i in range(args.sessions)))
+    # نوشتن‌های خارج از مسیر پاسخ هم باید تمام شوند
+    await pipeline.close()
+    stop.set()
+    await monitor
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="آزمون بار چندکاربره موتور پردازش نوبت‌ها")
+    parser.add_argument("--sessions", type=int, default=1000, help="تعداد جلسه‌های همزمان")
+    parser.add_argument("--duration", type=float, default=60.0, help="مدت آزمون (ثانیه)")
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="مدت ورود تدریجی جلسه‌ها (ثانیه)")
+    parser.add_argument("--think-time", type=float, default=3.0, help="میانگین زمان فکر کردن میان پیام‌ها (ثانیه)")
+    parser.add_argument("--turns-per-session", type=int, default=0, help="حداکثر نوبت هر جلسه (۰ یعنی بدون حد)")
+    parser.add_argument("--max-clauses", type=int, default=4, help="حداکثر جمله‌های هر پیام")
+    parser.add_argument("--clause-rate", type=float, default=1.2,
+                        help="نرخ توزیع نمایی تعداد جمله‌ها (کمتر یعنی پیام‌های بلندتر)")
+    parser.add_argument("--preload", type=int, default=0, help="تعداد واقعیت‌های اولیه در حافظه")
+    parser.add_argument("--embedder", choices=["fake", "real"], default="fake")
+    parser.add_argument("--embed-cost-ms", type=float, default=0.0, help="هزینه شبیه‌سازی‌شده هر embedding جعلی")
+    parser.add_argument("--llm", choices=["local", "stub"], default="local")
+    parser.add_argument("--stub-first-token-delay", type=float, default=0.05)
+    parser.add_argument("--stub-token-delay", type=float, default=0.01)
+    parser.add_argument("--storage", choices=["chroma", "compact"], default=MEMORY_STORAGE)
+    parser.add_argument("--user-index", action="store_true", default=MEMORY_USER_INDEX)
+    parser.add_argument("--write-behind", action="store_true", default=MEMORY_WRITE_BEHIND)
+    parser.add_argument("--retrieval", choices=["topk", "diverse"], default=RETRIEVAL_MODE)
+    parser.add_argument("--workers", type=int, default=16, help="رشته‌های executor مراحل مسدودکننده")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="حداکثر نوبت‌های در حال پردازش")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="فاصله گزارش‌ها (ثانیه)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="پوشه پایگاه موقت")
+    parser.add_argument("--keep", action="store_true", help="پایگاه موقت پاک نشود")
+    parser.add_argument("--output", default=None, help="فایل JSON نتایج")
+    args = parser.parse_args()
+
+    stub_server = None
+    if args.llm == "stub":
+        from tools.stub_llm_server import start_stub_server
+        stub_server = start_stub_server(first_token_delay=args.stub_first_token_delay,
+                                        token_delay=args.stub_token_delay)
+
+    embedder = FakeEmbeddingModel(cost_ms=args.embed_cost_ms) if args.embedder == "fake" else make_embedder("real")
+    llm = make_llm(args.llm, stub_server)
+
+    directory = tempfile.mkdtemp(prefix="load_", dir=args.work_dir)
+    memory = None
+    try:
+        with _quiet():
+            memory = build_bench_memory(args.storage, directory, args.user_index, args.write_behind)
+        if args.preload:
+            memory.add_realities_bulk(generate_records(args.preload, max(1, args.sessions), args.seed),
+                                      embedding_model=embedder, chunk_size=2048, on_progress=lambda *_: None)
+
+        pipeline = TurnPipeline(embedder, memory, llm, RealityTracker(SIMILARITY_THRESHOLD), "",
+                                TOP_K_RESULTS, args.retrieval)
+        async_pipeline = AsyncTurnPipeline(pipeline, max_workers=args.workers, max_in_flight=args.max_in_flight)
+
+        rss_start = rss_mb()
+        print(f"🚀 {args.sessions} جلسه به مدت {args.duration:.0f} ثانیه (RSS اولیه {rss_start:.1f}MB)")
+        stats = asyncio.run(run_load(args, async_pipeline, memory))
+        elapsed = time.perf_counter() - stats.started
+
+        results = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                **{key: value for key, value in vars(args).items() if key not in ("output", "work_dir", "keep")}
+            },
+            "summary": {
+                "turns": len(stats.latencies),
+                "errors": stats.errors,
+                "error_types": dict(stats.error_types.most_common(10)),
+                "seconds": elapsed,
+                "turns_per_sec": len(stats.latencies) / elapsed if elapsed > 0 else 0.0,
+                "latency_ms": summarize(stats.latencies),
+                "rss_start_mb": rss_start,
+                "rss_end_mb": rss_mb(),
+                "rss_growth_mb": rss_mb() - rss_start,
+                "realities": memory.count()
+            },
+            "timeline": stats.timeline
+        }
+    finally:
+        if args.write_behind and memory is not None:
+            memory.close()
+        if stub_server is not None:
+            stub_server.shutdown()
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    summary = results["summary"]
+    print(f"✅ {summary['turns']} نوبت در {summary['seconds']:.1f} ثانیه "
+          f"({summary['turns_per_sec']:.1f} نوبت در ثانیه)، p95 = {summary['latency_ms'].get('p95', 0):.1f}ms، "
+          f"p99 = {summary['latency_ms'].get('p99', 0):.1f}ms، رشد حافظه {summary['rss_growth_mb']:.1f}MB، "
+          f"خطا {summary['errors']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 نتایج در {args.output} ذخیره شد.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+انتقال حافظه واقعیت‌ها از یک مجموعه (یا مجموعه‌ای از shardها) به N shard جدید
+
+مثال‌ها:
+    # مجموعه تکی فعلی ← ۸ shard
+    python -m tools.rebalance_shards --shards 8
+
+    # ۸ shard ← ۳۲ shard با نام جدید (پس از اتمام، COLLECTION_NAME را تغییر دهید)
+    python -m tools.rebalance_shards --source-shards 8 --target-collection user_realities_v2 --shards 32
+
+    # مجموعه تکی ← ۴ shard با ذخیره‌سازی فشرده
+    python -m tools.rebalance_shards --shards 4 --storage compact --target-collection user_realities_compact
+"""
+import argparse
+
+from config import *
+from utils.structured_logging import configure_logging
+from memory.vector_store import RealityMemory
+from memory.sharded_store import ShardedRealityMemory, migrate_to_shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="انتقال و توزیع دوباره حافظه میان shardها")
+    parser.add_argument("--persist-dir", default=CHROMA_PERSIST_DIR)
+    parser.add_argument("--source-collection", default=COLLECTION_NAME)
+    parser.add_argument("--source-shards", type=int, default=0,
+                        help="تعداد shardهای مبدأ (۰ یعنی یک مجموعه تکی)")
+    parser.add_argument("--source-separate-dirs", action="store_true")
+    parser.add_argument("--target-collection", default=COLLECTION_NAME)
+    parser.add_argument("--shards", type=int, required=True, help="تعداد shardهای مقصد")
+    parser.add_argument("--separate-dirs", action="store_true", help="هر shard در پوشه جداگانه")
+    parser.add_argument("--storage", choices=["chroma", "compact"], default=MEMORY_STORAGE,
+                        help="نوع ذخیره‌سازی shardهای مقصد")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+    configure_logging(LOG_LEVEL, LOG_JSON)
+
+    if args.source_shards:
+        source = ShardedRealityMemory(args.persist_dir, args.source_collection,
+                                      args.source_shards, args.source_separate_dirs)
+        source_collections = [shard.collection for shard in source.shards]
+    else:
+        source_collections = [RealityMemory(args.persist_dir, args.source_collection).collection]
+
+    source_names = {collection.name for collection in source_collections}
+    target_names = {
+        args.target_collection if args.separate_dirs
+        else ShardedRealityMemory.shard_collection_name(args.target_collection, i)
+        for i in range(args.shards)
+    }
+    if (args.source_shards and args.source_separate_dirs == args.separate_dirs
+            and source_names & target_names):
+        parser.error("مجموعه مقصد با مبدأ هم‌نام است؛ --target-collection دیگری انتخاب کنید")
+
+    target = ShardedRealityMemory(args.persist_dir, args.target_collection,
+                                  args.shards, args.separate_dirs,
+                                  storage=args.storage,
+                                  vector_dtype=MEMORY_VECTOR_DTYPE,
+                                  keep_exact=MEMORY_KEEP_EXACT_VECTORS,
+                                  rerank_factor=MEMORY_RERANK_FACTOR)
+    report = migrate_to_shards(source_collections, target, args.page_size)
+
+    print(f"✅ {report['rows']} رکورد در {report['seconds']:.1f} ثانیه منتقل شد "
+          f"({report['rows_per_sec']:.0f} ردیف در ثانیه).")
+    print(f"📊 توزیع میان shardها: {report['per_shard']}")
+
+
+if __name__ == "__main__":
+    main()
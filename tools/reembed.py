@@ -0,0 +1,219 @@
+"""
+بازسازی آفلاین حافظه: تحلیل و embedding دوباره همه واقعیت‌ها
+
+پس از تغییر EMBEDDING_MODEL یا واژگان تحلیل، همه رکوردها از مجموعه فعلی
+خوانده می‌شوند، در دسته‌های بزرگ روی همه هسته‌ها دوباره پردازش می‌شوند، در
+مجموعه جدیدی نوشته می‌شوند و در پایان جای مجموعه فعلی را می‌گیرند.
+پیشرفت در فایل checkpoint ذخیره می‌شود و اجرای دوباره از همان‌جا ادامه می‌دهد.
+
+در حین اجرا نوشتن در حافظه (برنامه اصلی) باید متوقف باشد.
+
+این ابزار فقط یک مجموعه ChromaDB را بازسازی می‌کند: ذخیره‌سازی فشرده (MEMORY_STORAGE = "compact")
+پشتیبانی نمی‌شود و حافظه shard‌شده باید shard به shard با --persist-dir و --collection همان
+shard بازسازی شود.
+
+اجرا:
+    python -m tools.reembed --workers 8 --batch-size 512
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+from config import *
+from utils.structured_logging import configure_logging
+from memory.vector_store import RealityMemory
+
+
+# نمونه‌های مدل در هر فرایند کارگر
+_worker_model = None
+_worker_llm = None
+
+
+def _init_worker(model_name: str, lexicon_path: Optional[str]):
+    global _worker_model, _worker_llm
+    from models.embedding_model import PersianEmbeddingModel
+    from models.llm_interface import LLMInterface
+
+    _worker_model = PersianEmbeddingModel(model_name)
+    _worker_llm = LLMInterface(use_local=True, lexicon_path=lexicon_path)
+
+
+def _process_batch(ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    تحلیل و embedding دوباره یک دسته در فرایند کارگر
+
+    کلیدهای دیگر متادیتا (مثلاً merged_count و emotion_counts خلاصه‌های فشرده‌سازی) حفظ
+    می‌شوند؛ فیلدهای تحلیل خلاصه‌ها هم که از چند نوبت جمع شده‌اند، دوباره تحلیل نمی‌شوند.
+    """
+    analyses = _worker_llm.analyze_many(documents)
+    embeddings = _worker_model.encode_array(documents, batch_size=64)
+    new_metadatas = []
+    for document, metadata, analysis in zip(documents, metadatas, analyses):
+        if metadata.get("summary"):
+            new_metadatas.append(dict(metadata))
+            continue
+        rebuilt = RealityMemory._build_metadata(metadata["user_id"], document, analysis, metadata.get("timestamp"))
+        new_metadatas.append({**metadata, **rebuilt})
+    return {
+        "ids": ids,
+        "embeddings": np.asarray(embeddings, dtype=np.float32),
+        "documents": documents,
+        "metadatas": new_metadatas
+    }
+
+
+class Checkpoint:
+    """وضعیت قابل ادامه کار در یک فایل JSON (نوشتن اتمی با rename)"""
+    def __init__(self, path: str):
+        self.path = path
+        self.state: Dict[str, Any] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def save(self, **changes):
+        self.state.update(changes)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def rebuild(persist_directory: str,
+            collection_name: str,
+            model_name: str,
+            lexicon_path: Optional[str] = None,
+            workers: Optional[int] = None,
+            batch_size: int = 512,
+            checkpoint_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    اجرای کامل کار بازسازی؛ در صورت وجود checkpoint از همان نقطه ادامه می‌دهد
+    """
+    workers = workers or os.cpu_count() or 1
+    checkpoint = Checkpoint(checkpoint_path or os.path.join(persist_directory, f"{collection_name}_reembed.json"))
+    client = chromadb.PersistentClient(path=persist_directory,
+                                       settings=Settings(anonymized_telemetry=False))
+
+    state = checkpoint.state
+    if state and (state.get("model_name") != model_name or state.get("collection") != collection_name):
+        raise ValueError(f"checkpoint موجود برای مدل/مجموعه دیگری است: {checkpoint.path}")
+    if not state:
+        checkpoint.save(collection=collection_name,
+                        model_name=model_name,
+                        target=f"{collection_name}_rebuild_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                        offset=0,
+                        phase="copy",
+                        elapsed=0.0)
+        state = checkpoint.state
+
+    target = client.get_or_create_collection(name=state["target"], metadata={"hnsw:space": "cosine"})
+    total = state.get("offset", 0)
+    started = time.perf_counter() - state.get("elapsed", 0.0)
+    processed_this_run = 0
+    run_started = time.perf_counter()
+
+    if state["phase"] == "copy":
+        source = client.get_collection(collection_name)
+        total = source.count()
+        print(f"♻️ بازسازی {total} واقعیت با {workers} فرایند (شروع از {state['offset']})...")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_name, lexicon_path)) as pool:
+            offset = state["offset"]
+            pending = []
+            # حداکثر دو دسته در صف هر کارگر تا حافظه محدود بماند
+            max_pending = workers * 2
+
+            def write_oldest():
+                nonlocal processed_this_run
+                page_end, future = pending.pop(0)
+                result = future.result()
+                target.upsert(
+                    ids=result["ids"],
+                    embeddings=result["embeddings"].tolist(),
+                    documents=result["documents"],
+                    metadatas=result["metadatas"]
+                )
+                processed_this_run += len(result["ids"])
+                checkpoint.save(offset=page_end, elapsed=time.perf_counter() - started)
+                rate = processed_this_run / (time.perf_counter() - run_started)
+                print(f"📦 {page_end}/{total} ({rate:.0f} سند در ثانیه، {rate / workers:.1f} به ازای هر هسته)")
+
+            while True:
+                page = source.get(offset=offset, limit=batch_size, include=["documents", "metadatas"])
+                if not page["ids"]:
+                    break
+                offset += len(page["ids"])
+                pending.append((offset, pool.submit(_process_batch, page["ids"],
+                                                    page["documents"], page["metadatas"])))
+                if len(pending) >= max_pending:
+                    write_oldest()
+            while pending:
+                write_oldest()
+
+        checkpoint.save(phase="swap", elapsed=time.perf_counter() - started)
+
+    # جایگزینی: مجموعه فعلی بایگانی و مجموعه جدید هم‌نام آن می‌شود
+    archived = state.get("archived") or f"{collection_name}_old_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    checkpoint.save(archived=archived)
+    names = {c.name for c in client.list_collections()}
+    if collection_name in names and state["target"] in names:
+        client.get_collection(collection_name).modify(name=archived)
+    if state["target"] in {c.name for c in client.list_collections()}:
+        client.get_collection(state["target"]).modify(name=collection_name)
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "documents": total,
+        "seconds": elapsed,
+        "docs_per_sec": processed_this_run / (time.perf_counter() - run_started) if processed_this_run else 0.0,
+        "workers": workers,
+        "archived_collection": archived
+    }
+    report["docs_per_sec_per_core"] = report["docs_per_sec"] / workers
+    checkpoint.clear()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="تحلیل و embedding دوباره همه واقعیت‌های ذخیره‌شده")
+    parser.add_argument("--persist-dir", default=CHROMA_PERSIST_DIR)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--lexicon", default=None, help="فایل واژگان تحلیل (پیش‌فرض: واژگان داخلی)")
+    parser.add_argument("--workers", type=int, default=None, help="تعداد فرایندها (پیش‌فرض: همه هسته‌ها)")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--checkpoint", default=None)
+    args = parser.parse_args()
+    configure_logging(LOG_LEVEL, LOG_JSON)
+
+    if MEMORY_STORAGE == "compact":
+        parser.error("ذخیره‌سازی فشرده (MEMORY_STORAGE = \"compact\") پشتیبانی نمی‌شود")
+    if (MEMORY_NUM_SHARDS > 1 and args.persist_dir == CHROMA_PERSIST_DIR
+            and args.collection == COLLECTION_NAME):
+        parser.error("حافظه shard‌شده است؛ هر shard را جداگانه با --persist-dir و --collection آن بازسازی کنید")
+
+    report = rebuild(args.persist_dir, args.collection, args.model, args.lexicon,
+                     args.workers, args.batch_size, args.checkpoint)
+    print(f"✅ {report['documents']} سند در {report['seconds']:.1f} ثانیه بازسازی شد "
+          f"({report['docs_per_sec']:.0f} سند در ثانیه، {report['docs_per_sec_per_core']:.1f} به ازای هر هسته).")
+    print(f"🗄️ مجموعه قبلی با نام {report['archived_collection']} بایگانی شد.")
+    if TRAJECTORY_ENABLED:
+        print(f"⚠️ اگر مدل embedding تغییر کرده، مرکزهای ذخیره‌شده در {TRAJECTORY_PATH} مربوط به مدل قبلی هستند.")
+
+
+if __name__ == "__main__":
+    main()
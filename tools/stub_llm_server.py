@@ -0,0 +1,204 @@
+"""
+سرور محلی سازگار با OpenAI برای آزمایش و اندازه‌گیری بدون اتصال به اینترنت
+
+اجرا:
+    python -m tools.stub_llm_server --port 8001
+    python -m tools.stub_llm_server --measure --requests 50 --concurrency 8
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+
+STUB_REPLY = "این یک پاسخ آزمایشی از سرور محلی است. درباره {topic} بیشتر بگو، چه چیزی برایت مهم‌تر است؟"
+
+
+def _reply_tokens(messages: List[Dict[str, str]]) -> List[str]:
+    """پاسخ قطعی بر اساس آخرین پیام کاربر، تقسیم‌شده به توکن‌ها"""
+    last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    topic = " ".join(last_user.split()[:3]) or "این موضوع"
+    words = STUB_REPLY.format(topic=topic).split(" ")
+    return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    first_token_delay = 0.05
+    token_delay = 0.01
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        tokens = _reply_tokens(request.get("messages", []))
+        model = request.get("model", "stub")
+        created = int(time.time())
+
+        if not request.get("stream"):
+            time.sleep(self.first_token_delay + self.token_delay * len(tokens))
+            self._send_json(200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data: str):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):X}\r\n".encode("ascii") + payload + b"\r\n")
+            self.wfile.flush()
+
+        time.sleep(self.first_token_delay)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_delay)
+            send_event(json.dumps({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+            }, ensure_ascii=False))
+        send_event(json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        }))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_stub_server(host: str = "127.0.0.1",
+                      port: int = 0,
+                      first_token_delay: float = 0.05,
+                      token_delay: float = 0.01) -> ThreadingHTTPServer:
+    """
+    راه‌اندازی سرور در یک thread پس‌زمینه؛ آدرس پایه: http://host:port/v1
+    """
+    handler = type("ConfiguredStubLLMHandler", (StubLLMHandler,), {
+        "first_token_delay": first_token_delay,
+        "token_delay": token_delay
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
+
+
+def base_url_of(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def measure(base_url: str, requests: int = 50, concurrency: int = 8) -> Dict[str, Any]:
+    """
+    اندازه‌گیری زمان تا اولین توکن و توان عملیاتی backend در برابر سرور
+    """
+    from models.llm_backends import OpenAICompatibleBackend
+
+    backend = OpenAICompatibleBackend("stub", base_url=base_url, model="stub",
+                                      max_concurrency=concurrency)
+    messages = [{"role": "user", "content": "چرا آسمان آبی است؟"}]
+
+    def one_request():
+        started = time.perf_counter()
+        first_token: Optional[float] = None
+        tokens = 0
+        for _ in backend.stream(messages):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            tokens += 1
+        return first_token, time.perf_counter() - started, tokens
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: one_request(), range(requests)))
+    elapsed = time.perf_counter() - started
+    backend.close()
+
+    ttft = sorted(r[0] for r in results if r[0] is not None)
+    total_tokens = sum(r[2] for r in results)
+
+    def pct(values, q):
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000.0 if values else None
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "ttft_ms_p50": pct(ttft, 0.50),
+        "ttft_ms_p95": pct(ttft, 0.95),
+        "requests_per_sec": requests / elapsed,
+        "tokens_per_sec": total_tokens / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="سرور محلی سازگار با OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token-delay", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--measure", action="store_true", help="اجرای سرور و اندازه‌گیری TTFT و توان عملیاتی")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.measure:
+        server = start_stub_server(args.host, 0, args.first_token_delay, args.token_delay)
+        print(json.dumps(measure(base_url_of(server), args.requests, args.concurrency), indent=2))
+        server.shutdown()
+        return
+
+    server = ThreadingHTTPServer((args.host, args.port), type("ConfiguredStubLLMHandler", (StubLLMHandler,), {
+        "first_token_delay": args.first_token_delay,
+        "token_delay": args.token_delay
+    }))
+    print(f"✅ سرور آزمایشی LLM روی http://{args.host}:{args.port}/v1 آماده است.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
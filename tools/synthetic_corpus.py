@@ -0,0 +1,78 @@
+"""
+پیکره مصنوعی پیام‌های فارسی برای بنچمارک و آزمون بار
+
+جمله‌ها از قالب‌هایی با واژه‌های حالات، باورها و موضوعات ساخته می‌شوند تا
+تحلیلگر واژگانی و تشخیص تغییر واقعیت روی داده‌ای شبیه گفتگوی واقعی کار کنند.
+خروجی با seed ثابت قابل تکرار است.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterator, Optional
+
+
+SUBJECTS = ["من", "دوستم", "برادرم", "خواهرم", "معلمم", "مادرم", "پدرم", "هم‌کلاسی‌ام"]
+FEELINGS = [
+    "خیلی خوشحالم", "احساس غم دارم", "سردرگم هستم", "می‌ترسم", "کنجکاوم",
+    "عصبانی هستم", "خسته‌ام", "امیدوارم", "نگرانم", "هیجان‌زده‌ام",
+]
+BELIEFS = [
+    "فکر می‌کنم", "باور دارم", "مطمئنم", "به نظرم", "شاید", "حس می‌کنم",
+]
+TOPICS = [
+    "مدرسه", "امتحان فردا", "دوستی", "خانواده", "آسمان و ستاره‌ها", "حیوانات",
+    "بازی", "آینده", "کتابی که خواندم", "سفر تابستان", "ورزش", "نقاشی",
+]
+CLAIMS = [
+    "همه چیز درست می‌شود", "هیچ‌کس مرا درک نمی‌کند", "دنیا جای عجیبی است",
+    "باید روش جدیدی را امتحان کنم", "اشتباه کردن اشکالی ندارد", "آدم‌ها با هم فرق دارند",
+    "تلاش کردن مهم‌تر از نتیجه است", "بعضی چیزها را نمی‌شود تغییر داد",
+]
+QUESTIONS = [
+    "چرا {topic} این‌قدر سخت است؟", "چطور می‌شود درباره {topic} بیشتر دانست؟",
+    "آیا بقیه هم درباره {topic} همین حس را دارند؟", "چه کار کنم که {topic} بهتر شود؟",
+]
+REASONS = ["چون", "برای اینکه", "وقتی که", "از وقتی که"]
+
+
+def _clause(rng: random.Random) -> str:
+    kind = rng.random()
+    topic = rng.choice(TOPICS)
+    if kind < 0.35:
+        return f"{rng.choice(SUBJECTS)} درباره {topic} {rng.choice(FEELINGS)}"
+    if kind < 0.65:
+        return f"{rng.choice(BELIEFS)} {rng.choice(CLAIMS)}"
+    if kind < 0.85:
+        return rng.choice(QUESTIONS).format(topic=topic)
+    return f"{rng.choice(FEELINGS)} {rng.choice(REASONS)} {topic} {rng.choice(CLAIMS)}"
+
+
+def generate_message(rng: random.Random, max_clauses: int = 4, clause_rate: float = 1.2) -> str:
+    """
+    یک پیام با ۱ تا max_clauses جمله (پیام‌های کوتاه رایج‌ترند)
+
+    تعداد جمله‌ها ۱ + توزیع نمایی با نرخ clause_rate است؛ نرخ کمتر یعنی پیام‌های بلندتر.
+    """
+    clauses = min(max_clauses, 1 + int(rng.expovariate(clause_rate)))
+    return "؛ ".join(_clause(rng) for _ in range(clauses))
+
+
+def generate_messages(count: int, seed: int = 0, max_clauses: int = 4) -> List[str]:
+    rng = random.Random(seed)
+    return [generate_message(rng, max_clauses) for _ in range(count)]
+
+
+def generate_records(count: int,
+                     num_users: int = 1000,
+                     seed: int = 0,
+                     start: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """
+    رکوردهای {"user_id", "text", "timestamp"} برای ورود انبوه به حافظه
+    """
+    rng = random.Random(seed)
+    now = start or datetime(2024, 1, 1)
+    for i in range(count):
+        yield {
+            "user_id": f"user_{rng.randrange(num_users):06d}",
+            "text": generate_message(rng),
+            "timestamp": (now + timedelta(seconds=i)).isoformat()
+        }
@@ -0,0 +1,90 @@
+import gc
+import multiprocessing
+import os
+import secrets
+from typing import List, Dict, Any, Optional, Tuple
+
+from config import *
+from models.embedding_model import PersianEmbeddingModel
+from memory.memory_service import start_memory_service, connect_memory_service, require_authkey
+from pipeline import TurnPipeline, build_embedding_model, build_llm, load_embedding_model
+
+
+# مدل در فرایند والد بارگذاری می‌شود و کارگرها پس از fork آن را به اشتراک می‌گذارند
+_shared_embedding_model: Optional[PersianEmbeddingModel] = None
+_worker_pipeline: Optional[TurnPipeline] = None
+
+
+def _init_worker(address: Tuple[str, int], authkey: bytes, system_prompt: str):
+    global _worker_pipeline
+    try:
+        import torch
+        # هر کارگر یک هسته؛ از رقابت threadهای torch جلوگیری می‌کند
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    memory, tracker = connect_memory_service(address, authkey)
+    _worker_pipeline = TurnPipeline(build_embedding_model(_shared_embedding_model),
+                                    memory, build_llm(), tracker, system_prompt)
+
+
+def _process_turn(user_id: str, text: str) -> Dict[str, Any]:
+    return _worker_pipeline.process_turn(user_id, text)
+
+
+class TurnWorkerPool:
+    """
+    اجرای نوبت‌ها روی چند فرایند با یک مدل مشترک و یک سرویس حافظه تک‌نویسنده
+
+    - سرویس حافظه (مالک ChromaDB) پیش از بارگذاری مدل در فرایندی جداگانه اجرا می‌شود
+    - مدل embedding یک بار در والد بارگذاری و پس از fork به صورت copy-on-write
+      میان کارگرها مشترک است
+    - کارگرها فقط از طریق IPC محلی در حافظه می‌خوانند و می‌نویسند
+    """
+    def __init__(self,
+                 num_workers: Optional[int] = None,
+                 address: Tuple[str, int] = (MEMORY_SERVICE_HOST, MEMORY_SERVICE_PORT),
+                 authkey: Optional[bytes] = None,
+                 start_service: bool = True,
+                 system_prompt: str = ""):
+        global _shared_embedding_model
+
+        if authkey is None:
+            if start_service and not MEMORY_SERVICE_AUTHKEY:
+                # سرویس متعلق به همین pool است؛ کلید تصادفی فقط به فرایندهای فرزند داده می‌شود
+                authkey = secrets.token_bytes(32)
+            else:
+                authkey = require_authkey(MEMORY_SERVICE_AUTHKEY)
+        self.service = start_memory_service(address, authkey) if start_service else None
+
+        _shared_embedding_model = load_embedding_model()
+        # اشیای موجود از ردیابی GC خارج می‌شوند تا صفحه‌های مشترک پس از fork کپی نشوند
+        gc.collect()
+        gc.freeze()
+
+        self.num_workers = num_workers or SERVING_WORKERS or os.cpu_count() or 1
+        self.pool = multiprocessing.get_context("fork").Pool(
+            self.num_workers,
+            initializer=_init_worker,
+            initargs=(address, authkey, system_prompt)
+        )
+
+    def process_turn(self, user_id: str, text: str) -> Dict[str, Any]:
+        """
+        پردازش یک پیام در یکی از کارگرها
+        """
+        return self.pool.apply(_process_turn, (user_id, text))
+
+    def process_turns(self, turns: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        پردازش موازی چند پیام به صورت (user_id, text)
+        """
+        return self.pool.starmap(_process_turn, turns)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        if self.service is not None:
+            self.service.terminate()
+            self.service.join()